@@ -0,0 +1,108 @@
+# --------------------------------------------------------------
+#  FEEDBACK ON DEMAND
+#  A scores-only grading run skips the highlighted feedback copies
+#  and saves outcomes.json instead. This makes the feedback workbook
+#  for one student, a few, or everyone, from outcomes.json and the
+#  original submissions (the LMS zip or an extracted folder),
+#  without grading again.
+#
+#  Usage:
+#    python Feedback.py outcomes.json submissions.zip --out Feedback --student "Jane Doe"
+#    python Feedback.py outcomes.json submissions.zip --out Feedback --all [--zip] [--workers 4]
+# --------------------------------------------------------------
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from openpyxl import load_workbook
+import Grader
+import argparse
+import hashlib
+import zipfile
+
+
+def read_submission(source, rel):
+    """Bytes of one submission from the LMS zip or an extracted folder."""
+    source = Path(source)
+    if source.is_dir():
+        return (source / rel).read_bytes()
+    with zipfile.ZipFile(source) as z:
+        return z.read(rel)
+
+
+def select(outcomes, students=None):
+    """Submissions whose folder or file name contains any of the given names (all if none given)."""
+    subs = [s for s in outcomes["submissions"] if not s.get("flag")]  # flagged: never graded
+    if not students:
+        return subs
+    wanted = [s.casefold() for s in students]
+    return [s for s in subs if any(w in s["file"].casefold() for w in wanted)]
+
+
+def materialize(key, sub, instructor, source, out_dir):
+    """Write the feedback workbook for one outcomes entry. Returns its path, or None if skipped."""
+    rel = sub["file"]
+    data = read_submission(source, rel)
+    if hashlib.sha256(data).hexdigest() != sub["sha256"]:
+        print(f"{rel} has changed since it was graded. Skipping.")
+        return None
+
+    result = Grader.result_from_outcome(sub["outcome"], key["graded"], sub["score"])
+    res_path = Path(out_dir) / rel
+    res_path.parent.mkdir(parents=True, exist_ok=True)
+    wb = load_workbook(BytesIO(data))
+    try:
+        Grader.write_feedback(wb, result, key, instructor, res_path)
+    finally:
+        wb.close()
+    print(f"Feedback: {rel} ({sub['score']}%) → {res_path}")
+    return res_path
+
+
+def _materialize_job(job):
+    return materialize(*job)
+
+
+def create_feedback(outcomes_file, source, out_dir, students=None, workers=None, make_zip=False):
+    key, outcomes = Grader.load_outcomes(outcomes_file)
+    chosen = select(outcomes, students)
+    if not chosen:
+        print("No matching submissions in", outcomes_file)
+        return []
+
+    instructor = outcomes.get("instructor") or "Instructor"
+    jobs = [(key, s, instructor, source, out_dir) for s in chosen]
+    if workers and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = list(pool.map(_materialize_job, jobs))
+    else:
+        paths = [materialize(*job) for job in jobs]
+    paths = [p for p in paths if p is not None]
+
+    if make_zip:
+        # Same layout as the Results.zip of a full run
+        zip_path = Path(out_dir) / "Results.zip"
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for p in paths:
+                zipf.write(p, arcname=Path("Results") / p.relative_to(out_dir))
+        print(f"Zipped {len(paths)} feedback files → {zip_path}")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create feedback workbooks from a scores-only run.")
+    parser.add_argument("outcomes", type=Path, help="outcomes.json from the grading run")
+    parser.add_argument("source", type=Path, help="the submissions zip that was graded, or its extracted folder")
+    parser.add_argument("--out", type=Path, default=Path("Feedback"))
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--student", action="append", help="name (or part of the folder name); repeatable")
+    group.add_argument("--all", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--zip", action="store_true", help="also bundle the files as Results.zip")
+    args = parser.parse_args()
+
+    create_feedback(args.outcomes, args.source, args.out, None if args.all else args.student,
+                    args.workers, args.zip)
+
+
+if __name__ == "__main__":
+    main()
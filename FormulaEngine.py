@@ -0,0 +1,1107 @@
+# --------------------------------------------------------------
+#  FORMULA ENGINE
+#  Parses Excel formulas into small tuple ASTs and evaluates them
+#  for the function subset used in our keys.
+# --------------------------------------------------------------
+from decimal import Decimal, ROUND_HALF_UP, ROUND_UP, ROUND_DOWN
+from functools import lru_cache
+from openpyxl.formula.tokenizer import Tokenizer, Token
+from openpyxl.utils import column_index_from_string
+import math
+import re
+import warnings
+import numpy as np
+
+
+class FormulaError(Exception):
+    """The formula cannot be parsed, or uses something the engine does not support."""
+
+
+class CellError(Exception):
+    """An Excel error value (#DIV/0!, #N/A, ...) produced while evaluating."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+# ----------------------------------------------------------------------
+# PARSING
+# ----------------------------------------------------------------------
+# AST nodes are plain tuples:
+#   ("num", 1.0) ("str", "x") ("bool", True) ("err", "#N/A") ("blank",)
+#   ("ref", sheet, row, col)
+#   ("range", sheet, min_row, min_col, max_row, max_col)   rows may be None for A:A
+#   ("op", "+", left, right) ("neg", x) ("pct", x)
+#   ("func", "SUM", (arg, ...))
+# sheet is None for references to the formula's own sheet. Rows and
+# columns are 1-based like openpyxl.
+
+_BINARY = {"=": 1, "<>": 1, "<": 1, ">": 1, "<=": 1, ">=": 1,
+           "&": 2, "+": 3, "-": 3, "*": 4, "/": 4, "^": 5}
+
+_REF = re.compile(
+    r"^(?:(?:'(?P<qsheet>(?:[^']|'')+)'|(?P<sheet>[^'!]+))!)?"
+    r"\$?(?P<c1>[A-Za-z]{1,3})\$?(?P<r1>\d+)?"
+    r"(?::\$?(?P<c2>[A-Za-z]{1,3})\$?(?P<r2>\d+)?)?$"
+)
+
+
+def parse_reference(text):
+    m = _REF.match(text)
+    if not m:
+        raise FormulaError(f"Unsupported reference: {text}")
+    sheet = m["qsheet"].replace("''", "'") if m["qsheet"] else m["sheet"]
+    c1 = column_index_from_string(m["c1"].upper())
+    r1 = int(m["r1"]) if m["r1"] else None
+    if m["c2"] is None:
+        if r1 is None:
+            raise FormulaError(f"Unsupported reference: {text}")
+        return ("ref", sheet, r1, c1)
+    c2 = column_index_from_string(m["c2"].upper())
+    r2 = int(m["r2"]) if m["r2"] else None
+    if (r1 is None) != (r2 is None):
+        raise FormulaError(f"Unsupported reference: {text}")
+    if r1 is not None:
+        r1, r2 = min(r1, r2), max(r1, r2)
+    return ("range", sheet, r1, min(c1, c2), r2, max(c1, c2))
+
+
+class _Parser:
+    def __init__(self, formula):
+        try:
+            items = Tokenizer(formula).items
+        except Exception as e:
+            raise FormulaError(f"Cannot tokenize {formula!r}: {e}")
+        self.tokens = [t for t in items if t.type != Token.WSPACE]
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        t = self.peek()
+        if t is None:
+            raise FormulaError("Unexpected end of formula")
+        self.pos += 1
+        return t
+
+    def expression(self, min_prec=1):
+        left = self.unary()
+        while True:
+            t = self.peek()
+            if t is None or t.type != Token.OP_IN or t.value not in _BINARY:
+                return left
+            prec = _BINARY[t.value]
+            if prec < min_prec:
+                return left
+            self.next()
+            left = ("op", t.value, left, self.expression(prec + 1))
+
+    def unary(self):
+        # Excel binds prefix minus tighter than ^, so -2^2 = 4
+        t = self.peek()
+        if t is not None and t.type == Token.OP_PRE:
+            self.next()
+            operand = self.unary()
+            return ("neg", operand) if t.value == "-" else operand
+        node = self.primary()
+        while self.peek() is not None and self.peek().type == Token.OP_POST:
+            self.next()
+            node = ("pct", node)
+        return node
+
+    def primary(self):
+        t = self.next()
+        if t.type == Token.OPERAND:
+            if t.subtype == Token.NUMBER:
+                return ("num", float(t.value))
+            if t.subtype == Token.TEXT:
+                return ("str", t.value[1:-1].replace('""', '"'))
+            if t.subtype == Token.LOGICAL:
+                return ("bool", t.value.upper() == "TRUE")
+            if t.subtype == Token.ERROR:
+                return ("err", t.value)
+            return parse_reference(t.value)
+
+        if t.type == Token.FUNC and t.subtype == Token.OPEN:
+            name = t.value[:-1].upper()
+            for prefix in ("_XLFN.", "_XLWS."):
+                if name.startswith(prefix):
+                    name = name[len(prefix):]
+            args = []
+            if self.peek() is not None and self.peek().type == Token.FUNC and self.peek().subtype == Token.CLOSE:
+                self.next()
+                return ("func", name, ())
+            while True:
+                nxt = self.peek()
+                if nxt is not None and (nxt.type == Token.SEP or nxt.type == Token.FUNC and nxt.subtype == Token.CLOSE):
+                    args.append(("blank",))
+                else:
+                    args.append(self.expression())
+                t = self.next()
+                if t.type == Token.SEP and t.subtype == Token.ARG:
+                    continue
+                if t.type == Token.FUNC and t.subtype == Token.CLOSE:
+                    return ("func", name, tuple(args))
+                raise FormulaError(f"Unexpected {t.value!r} in {name}()")
+
+        if t.type == Token.PAREN and t.subtype == Token.OPEN:
+            node = self.expression()
+            t = self.next()
+            if t.type != Token.PAREN or t.subtype != Token.CLOSE:
+                raise FormulaError(f"Expected ')' but found {t.value!r}")
+            return node
+
+        raise FormulaError(f"Unsupported token {t.value!r}")
+
+
+def parse(formula):
+    """Parse a formula string (with or without the leading '=') into an AST."""
+    text = str(formula).strip()
+    if not text.startswith("="):
+        text = "=" + text
+    parser = _Parser(text)
+    node = parser.expression()
+    if parser.peek() is not None:
+        raise FormulaError(f"Unexpected {parser.peek().value!r} in {formula!r}")
+    return node
+
+
+def is_formula(value):
+    return isinstance(value, str) and value.startswith("=") and len(value) > 1
+
+
+# ----------------------------------------------------------------------
+# STRUCTURAL COMPARISON
+# ----------------------------------------------------------------------
+# Operators and functions whose operand order does not matter
+_COMMUTATIVE_OPS = {"+", "*", "=", "<>"}
+_COMMUTATIVE_FUNCS = {"SUM", "PRODUCT", "MIN", "MAX", "AVERAGE", "COUNT", "COUNTA", "AND", "OR"}
+
+_INTERNED = {}
+
+
+def _operands(node, op):
+    """Flatten a chain like a+b+c into [a, b, c]."""
+    if node[0] == "op" and node[1] == op and op in ("+", "*"):
+        return _operands(node[2], op) + _operands(node[3], op)
+    return [node]
+
+
+def normalize(node, sheet=None):
+    """
+    Canonical form of an AST: references to the formula's own sheet lose
+    their qualifier, sheet names are case-folded, and operands of
+    commutative operators and functions are put in a fixed order.
+    ($ anchors, whitespace and _xlfn. prefixes are already gone after parse.)
+    """
+    kind = node[0]
+    if kind in ("ref", "range"):
+        ref_sheet = node[1].lower() if node[1] else None
+        if ref_sheet is not None and sheet is not None and ref_sheet == sheet.lower():
+            ref_sheet = None
+        return (kind, ref_sheet) + node[2:]
+    if kind in ("neg", "pct"):
+        return (kind, normalize(node[1], sheet))
+    if kind == "op":
+        op = node[1]
+        if op in ("+", "*"):
+            parts = sorted((normalize(n, sheet) for n in _operands(node, op)), key=repr)
+            result = parts[0]
+            for part in parts[1:]:
+                result = ("op", op, result, part)
+            return result
+        left, right = normalize(node[2], sheet), normalize(node[3], sheet)
+        if op in _COMMUTATIVE_OPS and repr(right) < repr(left):
+            left, right = right, left
+        return ("op", op, left, right)
+    if kind == "func":
+        args = tuple(normalize(a, sheet) for a in node[2])
+        if node[1] in _COMMUTATIVE_FUNCS:
+            args = tuple(sorted(args, key=repr))
+        return ("func", node[1], args)
+    return node
+
+
+@lru_cache(maxsize=None)
+def canonical(formula, sheet=None):
+    """
+    Normalized AST for a formula string. Memoized by formula text and
+    interned, so equivalent formulas share one object and a class-wide
+    check parses each distinct formula once.
+    """
+    node = normalize(parse(formula), sheet)
+    return _INTERNED.setdefault(node, node)
+
+
+_IDS = {}
+
+
+@lru_cache(maxsize=None)
+def formula_id(formula, sheet=None):
+    """Small integer naming a formula's canonical form; equivalent formulas share it."""
+    return _IDS.setdefault(canonical(formula, sheet), len(_IDS))
+
+
+def same_formula(a, b, sheet=None):
+    """
+    True if two cell contents are the same answer: structurally
+    equivalent formulas, or equal constants.
+    """
+    if is_formula(a) and is_formula(b):
+        try:
+            return canonical(a, sheet) is canonical(b, sheet)
+        except FormulaError:
+            return a.replace(" ", "").upper() == b.replace(" ", "").upper()
+    return a == b
+
+
+# ----------------------------------------------------------------------
+# VALUE HELPERS
+# ----------------------------------------------------------------------
+def to_number(v):
+    if isinstance(v, CellError):
+        raise v
+    if v is None:
+        return 0.0
+    if isinstance(v, bool):
+        return 1.0 if v else 0.0
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        return float(str(v).strip())
+    except ValueError:
+        raise CellError("#VALUE!")
+
+
+def to_text(v):
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, float):
+        return str(int(v)) if v.is_integer() else repr(v)
+    return str(v)
+
+
+def to_bool(v):
+    if v is None:
+        return False
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, (int, float)):
+        return v != 0
+    s = str(v).upper()
+    if s in ("TRUE", "FALSE"):
+        return s == "TRUE"
+    raise CellError("#VALUE!")
+
+
+def _rank(v):
+    # Excel orders numbers < text < logicals
+    if isinstance(v, bool):
+        return 2
+    if isinstance(v, str):
+        return 1
+    return 0
+
+
+def compare(a, b, op):
+    if a is None:
+        a = "" if isinstance(b, str) else (False if isinstance(b, bool) else 0.0)
+    if b is None:
+        b = "" if isinstance(a, str) else (False if isinstance(a, bool) else 0.0)
+    ra, rb = _rank(a), _rank(b)
+    if ra != rb:
+        a, b = ra, rb
+    elif ra == 1:
+        a, b = a.lower(), b.lower()
+    elif ra == 0:
+        a, b = float(a), float(b)
+    return {"=": a == b, "<>": a != b, "<": a < b, ">": a > b, "<=": a <= b, ">=": a >= b}[op]
+
+
+def excel_round(x, digits, rounding=ROUND_HALF_UP):
+    """ROUND/ROUNDUP/ROUNDDOWN: rounds away from / towards zero like Excel."""
+    d = int(digits)
+    q = Decimal(repr(float(x))).scaleb(d).quantize(Decimal(1), rounding=rounding).scaleb(-d)
+    return float(q)
+
+
+def _flatten(v):
+    if isinstance(v, list):
+        for row in v:
+            yield from row
+    else:
+        yield v
+
+
+# ----------------------------------------------------------------------
+# EVALUATION
+# ----------------------------------------------------------------------
+class Evaluator:
+    """
+    Evaluate cells of a workbook snapshot.
+
+    cells maps (sheet, row, col) -> raw value, where sheet is the sheet
+    title and formulas are strings starting with '='. Formula results are
+    memoized, so create a new Evaluator for each set of inputs.
+    """
+
+    def __init__(self, cells, sheet):
+        self.cells = {(s.lower(), r, c): v for (s, r, c), v in cells.items()}
+        self.sheet = sheet.lower()
+        self.bounds = {}
+        for s, r, c in self.cells:
+            mr, mc = self.bounds.get(s, (0, 0))
+            self.bounds[s] = (max(mr, r), max(mc, c))
+        self._values = {}
+        self._active = set()
+
+    def value(self, row, col, sheet=None):
+        """Return the value of a cell; errors come back as their code string."""
+        try:
+            return self._cell((sheet or self.sheet).lower(), row, col)
+        except CellError as e:
+            return e.code
+
+    def _cell(self, sheet, row, col):
+        key = (sheet, row, col)
+        if key in self._values:
+            v = self._values[key]
+            if isinstance(v, CellError):
+                raise v
+            return v
+        raw = self.cells.get(key)
+        if not is_formula(raw):
+            return raw
+        if key in self._active:
+            raise FormulaError(f"Circular reference at {sheet}!R{row}C{col}")
+        self._active.add(key)
+        try:
+            v = self.eval(parse(raw), sheet)
+            if isinstance(v, list):
+                v = CellError("#VALUE!")
+        except CellError as e:
+            v = e
+        finally:
+            self._active.discard(key)
+        self._values[key] = v
+        if isinstance(v, CellError):
+            raise v
+        return v
+
+    def _range(self, sheet, r1, c1, r2, c2):
+        max_row, max_col = self.bounds.get(sheet, (0, 0))
+        if r1 is None:
+            r1, r2 = 1, max_row
+        r2, c2 = min(r2, max_row), min(c2, max_col)
+        return [[self._cell_or_error(sheet, r, c) for c in range(c1, c2 + 1)] for r in range(r1, r2 + 1)]
+
+    def _cell_or_error(self, sheet, r, c):
+        try:
+            return self._cell(sheet, r, c)
+        except CellError as e:
+            return e
+
+    def eval(self, node, sheet):
+        kind = node[0]
+        if kind in ("num", "str", "bool"):
+            return node[1]
+        if kind == "blank":
+            return None
+        if kind == "err":
+            raise CellError(node[1])
+        if kind == "ref":
+            return self._cell((node[1] or sheet).lower(), node[2], node[3])
+        if kind == "range":
+            return self._range((node[1] or sheet).lower(), *node[2:])
+        if kind == "neg":
+            return -to_number(self.scalar(node[1], sheet))
+        if kind == "pct":
+            return to_number(self.scalar(node[1], sheet)) / 100
+        if kind == "op":
+            return self._op(node[1], self.scalar(node[2], sheet), self.scalar(node[3], sheet))
+        if kind == "func":
+            fn = FUNCTIONS.get(node[1])
+            if fn is None:
+                raise FormulaError(f"Unsupported function: {node[1]}")
+            return fn(self, node[2], sheet)
+        raise FormulaError(f"Unknown node {kind}")
+
+    def scalar(self, node, sheet):
+        v = self.eval(node, sheet)
+        if isinstance(v, list):
+            # A single-cell range behaves like a reference
+            if len(v) == 1 and len(v[0]) == 1:
+                v = v[0][0]
+            else:
+                raise CellError("#VALUE!")
+        if isinstance(v, CellError):
+            raise v
+        return v
+
+    @staticmethod
+    def _op(op, a, b):
+        if op == "&":
+            return to_text(a) + to_text(b)
+        if op in ("=", "<>", "<", ">", "<=", ">="):
+            return compare(a, b, op)
+        a, b = to_number(a), to_number(b)
+        if op == "+":
+            return a + b
+        if op == "-":
+            return a - b
+        if op == "*":
+            return a * b
+        if op == "/":
+            if b == 0:
+                raise CellError("#DIV/0!")
+            return a / b
+        if op == "^":
+            try:
+                return float(a ** b)
+            except (OverflowError, ZeroDivisionError, TypeError):
+                raise CellError("#NUM!")
+        raise FormulaError(f"Unsupported operator {op}")
+
+    # --- argument helpers for FUNCTIONS ---
+    def numbers(self, args, sheet):
+        """Numbers for SUM-style functions: ranges skip text/blank, direct args are coerced."""
+        out = []
+        for a in args:
+            v = self.eval(a, sheet)
+            if isinstance(v, list):
+                for x in _flatten(v):
+                    if isinstance(x, CellError):
+                        raise x
+                    if isinstance(x, (int, float)) and not isinstance(x, bool):
+                        out.append(float(x))
+            elif v is not None:
+                out.append(to_number(v))
+        return out
+
+    def arg(self, args, i, sheet, default=None):
+        if i >= len(args) or args[i] == ("blank",):
+            return default
+        return self.scalar(args[i], sheet)
+
+
+# ----------------------------------------------------------------------
+# FUNCTIONS
+# ----------------------------------------------------------------------
+def _sum(ev, args, sheet):
+    return sum(ev.numbers(args, sheet))
+
+
+def _average(ev, args, sheet):
+    nums = ev.numbers(args, sheet)
+    if not nums:
+        raise CellError("#DIV/0!")
+    return sum(nums) / len(nums)
+
+
+def _min(ev, args, sheet):
+    nums = ev.numbers(args, sheet)
+    return min(nums) if nums else 0.0
+
+
+def _max(ev, args, sheet):
+    nums = ev.numbers(args, sheet)
+    return max(nums) if nums else 0.0
+
+
+def _count(ev, args, sheet):
+    return float(len(ev.numbers(args, sheet)))
+
+
+def _counta(ev, args, sheet):
+    n = 0
+    for a in args:
+        v = ev.eval(a, sheet)
+        n += sum(1 for x in _flatten(v) if x is not None and x != "")
+    return float(n)
+
+
+def _product(ev, args, sheet):
+    return math.prod(ev.numbers(args, sheet))
+
+
+def _rounder(mode):
+    def fn(ev, args, sheet):
+        return excel_round(to_number(ev.arg(args, 0, sheet)), to_number(ev.arg(args, 1, sheet, 0)), mode)
+    return fn
+
+
+def _int(ev, args, sheet):
+    return float(math.floor(to_number(ev.arg(args, 0, sheet))))
+
+
+def _abs(ev, args, sheet):
+    return abs(to_number(ev.arg(args, 0, sheet)))
+
+
+def _sqrt(ev, args, sheet):
+    x = to_number(ev.arg(args, 0, sheet))
+    if x < 0:
+        raise CellError("#NUM!")
+    return math.sqrt(x)
+
+
+def _power(ev, args, sheet):
+    return Evaluator._op("^", ev.arg(args, 0, sheet), ev.arg(args, 1, sheet))
+
+
+def _mod(ev, args, sheet):
+    n, d = to_number(ev.arg(args, 0, sheet)), to_number(ev.arg(args, 1, sheet))
+    if d == 0:
+        raise CellError("#DIV/0!")
+    return n - d * math.floor(n / d)
+
+
+def _if(ev, args, sheet):
+    if to_bool(ev.arg(args, 0, sheet)):
+        return ev.arg(args, 1, sheet, True)
+    return ev.arg(args, 2, sheet, False)
+
+
+def _iferror(ev, args, sheet):
+    try:
+        return ev.arg(args, 0, sheet)
+    except CellError:
+        return ev.arg(args, 1, sheet)
+
+
+def _and(ev, args, sheet):
+    return all(to_bool(x) for a in args for x in _flatten(ev.eval(a, sheet)) if x is not None)
+
+
+def _or(ev, args, sheet):
+    return any(to_bool(x) for a in args for x in _flatten(ev.eval(a, sheet)) if x is not None)
+
+
+def _not(ev, args, sheet):
+    return not to_bool(ev.arg(args, 0, sheet))
+
+
+def _finance_args(ev, args, sheet):
+    return [to_number(ev.arg(args, i, sheet, 0)) for i in range(5)]
+
+
+def _pmt(ev, args, sheet):
+    rate, nper, pv, fv, when = _finance_args(ev, args, sheet)
+    if nper == 0:
+        raise CellError("#NUM!")
+    if rate == 0:
+        return -(pv + fv) / nper
+    growth = (1 + rate) ** nper
+    return -(rate * (fv + pv * growth)) / ((1 + rate * when) * (growth - 1))
+
+
+def _fv(ev, args, sheet):
+    rate, nper, pmt, pv, when = _finance_args(ev, args, sheet)
+    if rate == 0:
+        return -(pv + pmt * nper)
+    growth = (1 + rate) ** nper
+    return -(pv * growth + pmt * (1 + rate * when) * (growth - 1) / rate)
+
+
+def _pv(ev, args, sheet):
+    rate, nper, pmt, fv, when = _finance_args(ev, args, sheet)
+    if rate == 0:
+        return -(fv + pmt * nper)
+    growth = (1 + rate) ** nper
+    return -(fv + pmt * (1 + rate * when) * (growth - 1) / rate) / growth
+
+
+def _lookup(ev, args, sheet, by_column):
+    needle = ev.arg(args, 0, sheet)
+    table = ev.eval(args[1], sheet)
+    if not isinstance(table, list):
+        raise CellError("#N/A")
+    if not by_column:
+        table = [list(col) for col in zip(*table)]
+    idx = int(to_number(ev.arg(args, 2, sheet)))
+    approx = to_bool(ev.arg(args, 3, sheet, True))
+    if idx < 1 or (table and idx > len(table[0])):
+        raise CellError("#REF!")
+
+    found = None
+    for row in table:
+        key = row[0]
+        if isinstance(key, CellError):
+            continue
+        if approx:
+            if key is None or _rank(key) != _rank(needle):
+                continue
+            if compare(key, needle, "<="):
+                found = row
+            else:
+                break
+        elif compare(key, needle, "="):
+            found = row
+            break
+    if found is None:
+        raise CellError("#N/A")
+    v = found[idx - 1]
+    if isinstance(v, CellError):
+        raise v
+    return v
+
+
+def _vlookup(ev, args, sheet):
+    return _lookup(ev, args, sheet, by_column=True)
+
+
+def _hlookup(ev, args, sheet):
+    return _lookup(ev, args, sheet, by_column=False)
+
+
+def _concat(ev, args, sheet):
+    return "".join(to_text(x) for a in args for x in _flatten(ev.eval(a, sheet)))
+
+
+FUNCTIONS = {
+    "SUM": _sum,
+    "AVERAGE": _average,
+    "MIN": _min,
+    "MAX": _max,
+    "COUNT": _count,
+    "COUNTA": _counta,
+    "PRODUCT": _product,
+    "ROUND": _rounder(ROUND_HALF_UP),
+    "ROUNDUP": _rounder(ROUND_UP),
+    "ROUNDDOWN": _rounder(ROUND_DOWN),
+    "INT": _int,
+    "ABS": _abs,
+    "SQRT": _sqrt,
+    "POWER": _power,
+    "MOD": _mod,
+    "IF": _if,
+    "IFERROR": _iferror,
+    "AND": _and,
+    "OR": _or,
+    "NOT": _not,
+    "PMT": _pmt,
+    "FV": _fv,
+    "PV": _pv,
+    "VLOOKUP": _vlookup,
+    "HLOOKUP": _hlookup,
+    "CONCATENATE": _concat,
+    "CONCAT": _concat,
+}
+
+
+# ----------------------------------------------------------------------
+# BATCH EVALUATION
+# ----------------------------------------------------------------------
+# Formulas are compiled once into closures over NumPy arrays, so one call
+# evaluates a formula for every batch row (e.g. every student x input set)
+# that shares the same formula text. Only numbers are modelled: blanks are
+# 0, logicals are 1/0, and text or error values are NaN. Formulas that
+# need text (&, string literals, text functions) raise FormulaError at
+# compile time and their cells come back as NaN.
+
+def _scalarize(v):
+    """Collapse a single-cell range (n, 1, 1) to (n,); other ranges are #VALUE!."""
+    if isinstance(v, np.ndarray) and v.ndim == 3:
+        if v.shape[1:] == (1, 1):
+            return v[:, 0, 0]
+        return np.full(v.shape[0], np.nan)
+    return v
+
+
+def _flat(v):
+    """Arguments of SUM-style functions as a (n, k) array."""
+    if isinstance(v, np.ndarray):
+        if v.ndim == 3:
+            return v.reshape(v.shape[0], -1)
+        return v.reshape(-1, 1)
+    return np.array([[v]], dtype=float)
+
+
+def _gather(values):
+    """Stack several (n, k) blocks side by side, broadcasting scalars to n rows."""
+    blocks = [_flat(v) for v in values]
+    n = max(b.shape[0] for b in blocks)
+    return np.hstack([np.broadcast_to(b, (n, b.shape[1])) for b in blocks])
+
+
+def _reduce(nan_fn):
+    def fn(args):
+        def run(env):
+            data = _gather([f(env) for f in args])
+            with np.errstate(all="ignore"), warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                return nan_fn(data, axis=1)
+        return run
+    return fn
+
+
+def _round_array(x, d, mode):
+    f = np.power(10.0, d)
+    scaled = np.abs(x) * f
+    if mode == ROUND_HALF_UP:
+        scaled = np.floor(scaled + 0.5 + 1e-9)
+    elif mode == ROUND_UP:
+        scaled = np.ceil(scaled - 1e-9)
+    else:
+        scaled = np.floor(scaled + 1e-9)
+    return np.sign(x) * scaled / f
+
+
+def _vec_round(mode):
+    def fn(args):
+        fx = args[0]
+        fd = args[1] if len(args) > 1 else (lambda env: 0.0)
+        return lambda env: _round_array(_scalarize(fx(env)), _scalarize(fd(env)), mode)
+    return fn
+
+
+def _vec_unary(np_fn):
+    def fn(args):
+        fx = args[0]
+        return lambda env: np_fn(_scalarize(fx(env)))
+    return fn
+
+
+def _vec_if(args):
+    fc = args[0]
+    fa = args[1] if len(args) > 1 else (lambda env: 1.0)
+    fb = args[2] if len(args) > 2 else (lambda env: 0.0)
+
+    def run(env):
+        cond = _scalarize(fc(env))
+        out = np.where(cond != 0, _scalarize(fa(env)), _scalarize(fb(env)))
+        return np.where(np.isnan(cond), np.nan, out)
+    return run
+
+
+def _vec_iferror(args):
+    fa, fb = args[0], args[1]
+
+    def run(env):
+        a = _scalarize(fa(env))
+        return np.where(np.isnan(a), _scalarize(fb(env)), a)
+    return run
+
+
+def _vec_logic(all_or_any):
+    def fn(args):
+        def run(env):
+            data = _gather([f(env) for f in args]) != 0
+            return all_or_any(data, axis=1).astype(float)
+        return run
+    return fn
+
+
+def _vec_finance(kind):
+    def fn(args):
+        def run(env):
+            a = [_scalarize(f(env)) for f in args] + [0.0] * (5 - len(args))
+            rate, nper, x, y, when = (np.asarray(v, dtype=float) for v in a)
+            with np.errstate(all="ignore"):
+                growth = np.power(1 + rate, nper)
+                zero = rate == 0
+                if kind == "PMT":
+                    pv, fv = x, y
+                    out = -(rate * (fv + pv * growth)) / ((1 + rate * when) * (growth - 1))
+                    flat = -(pv + fv) / nper
+                elif kind == "FV":
+                    pmt, pv = x, y
+                    out = -(pv * growth + pmt * (1 + rate * when) * (growth - 1) / rate)
+                    flat = -(pv + pmt * nper)
+                else:
+                    pmt, fv = x, y
+                    out = -(fv + pmt * (1 + rate * when) * (growth - 1) / rate) / growth
+                    flat = -(fv + pmt * nper)
+            return np.where(zero, flat, out)
+        return run
+    return fn
+
+
+def _vec_lookup(by_column):
+    def fn(args):
+        fneedle, ftable, fidx = args[0], args[1], args[2]
+        fapprox = args[3] if len(args) > 3 else (lambda env: 1.0)
+
+        def run(env):
+            table = ftable(env)
+            if not isinstance(table, np.ndarray) or table.ndim != 3:
+                raise FormulaError("Lookup table must be a range")
+            if not by_column:
+                table = table.transpose(0, 2, 1)
+            n = table.shape[0]
+            needle = np.broadcast_to(_scalarize(fneedle(env)), (n,))
+            idx = np.broadcast_to(_scalarize(fidx(env)), (n,)).astype(float)
+            approx = np.broadcast_to(_scalarize(fapprox(env)), (n,)) != 0
+            keys = table[:, :, 0]
+
+            exact = keys == needle[:, None]
+            exact_found = exact.any(axis=1)
+            exact_row = exact.argmax(axis=1)
+            with np.errstate(invalid="ignore"):
+                below = (keys <= needle[:, None]).sum(axis=1)
+            row = np.where(approx, below - 1, exact_row)
+            found = np.where(approx, below > 0, exact_found)
+
+            col = np.nan_to_num(idx, nan=0).astype(int) - 1
+            valid = found & (col >= 0) & (col < table.shape[2])
+            rows = np.arange(n)
+            out = table[rows, np.clip(row, 0, table.shape[1] - 1), np.clip(col, 0, table.shape[2] - 1)]
+            return np.where(valid, out, np.nan)
+        return run
+    return fn
+
+
+def _vec_mod(args):
+    fa, fb = args[0], args[1]
+
+    def run(env):
+        a, b = _scalarize(fa(env)), _scalarize(fb(env))
+        with np.errstate(all="ignore"):
+            out = a - b * np.floor(a / b)
+        return np.where(b == 0, np.nan, out)
+    return run
+
+
+VECTOR_FUNCTIONS = {
+    "SUM": _reduce(np.nansum),
+    "AVERAGE": _reduce(np.nanmean),
+    "MIN": _reduce(np.nanmin),
+    "MAX": _reduce(np.nanmax),
+    "PRODUCT": _reduce(np.nanprod),
+    "ROUND": _vec_round(ROUND_HALF_UP),
+    "ROUNDUP": _vec_round(ROUND_UP),
+    "ROUNDDOWN": _vec_round(ROUND_DOWN),
+    "INT": _vec_unary(np.floor),
+    "ABS": _vec_unary(np.abs),
+    "SQRT": _vec_unary(lambda x: np.sqrt(np.where(x < 0, np.nan, x))),
+    "NOT": _vec_unary(lambda x: (x == 0).astype(float)),
+    "MOD": _vec_mod,
+    "IF": _vec_if,
+    "IFERROR": _vec_iferror,
+    "AND": _vec_logic(np.all),
+    "OR": _vec_logic(np.any),
+    "PMT": _vec_finance("PMT"),
+    "FV": _vec_finance("FV"),
+    "PV": _vec_finance("PV"),
+    "VLOOKUP": _vec_lookup(by_column=True),
+    "HLOOKUP": _vec_lookup(by_column=False),
+}
+
+
+
+def _vec_count(numbers_only):
+    """
+    COUNT / COUNTA. Blank cells read as 0 in batch evaluation, so cell
+    arguments are counted from the raw cells (BatchEvaluator.filled).
+    """
+    def fn(nodes, sheet):
+        parts = []
+        for a in nodes:
+            if a[0] in ("ref", "range"):
+                bounds = (a[2], a[3], a[2], a[3]) if a[0] == "ref" else a[2:]
+                key = ((a[1] or sheet).lower(),) + tuple(bounds)
+                parts.append(lambda env, key=key: env.count(*key, numbers_only=numbers_only))
+            elif numbers_only:
+                f = _compile(a, sheet)
+                parts.append(lambda env, f=f: np.isfinite(_scalarize(f(env))).astype(float))
+            else:
+                parts.append(lambda env: 1.0)
+        return lambda env: sum(p(env) for p in parts)
+    return fn
+
+
+# Functions compiled from their argument nodes rather than argument values
+VECTOR_COUNT_FUNCTIONS = {
+    "COUNT": _vec_count(numbers_only=True),
+    "COUNTA": _vec_count(numbers_only=False),
+}
+
+_VECTOR_OPS = {
+    "+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide, "^": np.power,
+    "=": lambda a, b: (a == b).astype(float), "<>": lambda a, b: (a != b).astype(float),
+    "<": lambda a, b: (a < b).astype(float), ">": lambda a, b: (a > b).astype(float),
+    "<=": lambda a, b: (a <= b).astype(float), ">=": lambda a, b: (a >= b).astype(float),
+}
+
+
+def _compile(node, sheet):
+    kind = node[0]
+    if kind == "num":
+        v = float(node[1])
+        return lambda env: v
+    if kind == "bool":
+        v = 1.0 if node[1] else 0.0
+        return lambda env: v
+    if kind == "blank":
+        return lambda env: 0.0
+    if kind == "ref":
+        key = ((node[1] or sheet).lower(), node[2], node[3])
+        return lambda env: env.ref(*key)
+    if kind == "range":
+        key = ((node[1] or sheet).lower(),) + node[2:]
+        return lambda env: env.range(*key)
+    if kind == "neg":
+        f = _compile(node[1], sheet)
+        return lambda env: -_scalarize(f(env))
+    if kind == "pct":
+        f = _compile(node[1], sheet)
+        return lambda env: _scalarize(f(env)) / 100
+    if kind == "op":
+        op = _VECTOR_OPS.get(node[1])
+        if op is None:
+            raise FormulaError(f"Operator {node[1]} is not supported in batch evaluation")
+        fa, fb = _compile(node[2], sheet), _compile(node[3], sheet)
+
+        def run(env):
+            with np.errstate(all="ignore"):
+                out = op(np.asarray(_scalarize(fa(env)), dtype=float), np.asarray(_scalarize(fb(env)), dtype=float))
+            return np.where(np.isinf(out), np.nan, out)
+        return run
+    if kind == "func":
+        if node[1] in VECTOR_COUNT_FUNCTIONS:
+            return VECTOR_COUNT_FUNCTIONS[node[1]](node[2], sheet)
+        maker = VECTOR_FUNCTIONS.get(node[1])
+        if maker is None:
+            raise FormulaError(f"{node[1]} is not supported in batch evaluation")
+        return maker([_compile(a, sheet) for a in node[2]])
+    raise FormulaError(f"{kind} values are not supported in batch evaluation")
+
+
+@lru_cache(maxsize=None)
+def compile_formula(formula, sheet):
+    """Compile a formula once into a function env -> array; cached by text and sheet."""
+    return _compile(parse(formula), sheet.lower())
+
+
+class _Rows:
+    """The view of a BatchEvaluator a compiled formula sees: only its rows."""
+
+    def __init__(self, ev, idx):
+        self.ev = ev
+        self.idx = idx
+
+    def ref(self, sheet, row, col):
+        return self.ev.precedent(sheet, row, col)[self.idx]
+
+    def range(self, sheet, r1, c1, r2, c2):
+        r1, c1, r2, c2 = self.ev.used(sheet, r1, c1, r2, c2)
+        rows = [[self.ev.precedent(sheet, r, c)[self.idx] for c in range(c1, c2 + 1)] for r in range(r1, r2 + 1)]
+        if not rows or not rows[0]:
+            return np.full((len(self.idx), 1, 1), np.nan)
+        return np.stack([np.stack(row, axis=1) for row in rows], axis=1)
+
+    def count(self, sheet, r1, c1, r2, c2, numbers_only):
+        r1, c1, r2, c2 = self.ev.used(sheet, r1, c1, r2, c2)
+        out = np.zeros(len(self.idx))
+        for r in range(r1, r2 + 1):
+            for c in range(c1, c2 + 1):
+                out += self.ev.filled(sheet, r, c)[1 if numbers_only else 0][self.idx]
+        return out
+
+
+class BatchEvaluator:
+    """
+    Evaluate cells for many batch rows at once.
+
+    row_cells[i] maps (sheet, row, col) -> raw value for row i (rows may
+    share the same dict). overrides maps (sheet, row, col) -> array of
+    per-row values and wins over the raw cells; it is how perturbed inputs
+    are fed in. cell() returns a float array with one value per row.
+
+    When isolate (a set of (sheet, row, col)) and reference (another
+    BatchEvaluator) are given, formulas that refer to an isolated cell
+    read the reference's value for it. Grading uses this so a wrong
+    answer in one graded cell does not also fail the cells built on it.
+    """
+
+    def __init__(self, row_cells, sheet, overrides=None, isolate=None, reference=None):
+        self.sheet = sheet.lower()
+        self.n = len(row_cells)
+        # Rows that share a dict share one case-folded copy
+        lowered = {}
+        self.row_cells = []
+        for cells in row_cells:
+            if id(cells) not in lowered:
+                lowered[id(cells)] = {(s.lower(), r, c): v for (s, r, c), v in cells.items()}
+            self.row_cells.append(lowered[id(cells)])
+        self.overrides = {(s.lower(), r, c): np.asarray(v, dtype=float) for (s, r, c), v in (overrides or {}).items()}
+        self.bounds = {}
+        for cells in lowered.values():
+            for s, r, c in cells:
+                mr, mc = self.bounds.get(s, (0, 0))
+                self.bounds[s] = (max(mr, r), max(mc, c))
+        self.isolate = {(s.lower(), r, c) for s, r, c in (isolate or ())}
+        self.reference = reference
+        self._values = {}
+        self._filled = {}
+        self._active = set()
+
+    def used(self, sheet, r1, c1, r2, c2):
+        """A range limited to the sheet's used area (whole columns have r1 None), like Evaluator._range."""
+        max_row, max_col = self.bounds.get(sheet, (0, 0))
+        if r1 is None:
+            r1, r2 = 1, max_row
+        return r1, c1, min(r2, max_row), min(c2, max_col)
+
+    def filled(self, sheet, row, col):
+        """(non-blank, number) masks of a cell for every row, as 0/1 floats, for COUNTA and COUNT."""
+        key = (sheet, row, col)
+        if key in self.isolate:
+            return self.reference.filled(sheet, row, col)
+        if key not in self._filled:
+            if key in self.overrides:
+                present = np.ones(self.n)
+                number = np.isfinite(self.overrides[key])
+            else:
+                raw = [cells.get(key) for cells in self.row_cells]
+                present = np.array([v is not None and v != "" for v in raw], dtype=float)
+                number = np.array([isinstance(v, (int, float)) and not isinstance(v, bool) for v in raw])
+                formula = np.array([is_formula(v) for v in raw], dtype=bool)
+                if formula.any():
+                    number |= formula & np.isfinite(self.cell(sheet, row, col))
+            self._filled[key] = (present, number.astype(float))
+        return self._filled[key]
+
+    def precedent(self, sheet, row, col):
+        """Value of a cell as seen from another cell's formula."""
+        if (sheet, row, col) in self.isolate:
+            return self.reference.cell(sheet, row, col)
+        return self.cell(sheet, row, col)
+
+    def cell(self, sheet, row, col):
+        key = (sheet, row, col)
+        if key in self._values:
+            return self._values[key]
+        if key in self.overrides:
+            return self.overrides[key]
+        if key in self._active:
+            raise FormulaError(f"Circular reference at {sheet}!R{row}C{col}")
+        self._active.add(key)
+        try:
+            groups = {}
+            for i, cells in enumerate(self.row_cells):
+                groups.setdefault(cells.get(key), []).append(i)
+
+            out = np.full(self.n, np.nan)
+            for raw, rows in groups.items():
+                idx = np.array(rows)
+                if raw is None:
+                    out[idx] = 0.0
+                elif isinstance(raw, bool):
+                    out[idx] = 1.0 if raw else 0.0
+                elif isinstance(raw, (int, float)):
+                    out[idx] = float(raw)
+                elif is_formula(raw):
+                    try:
+                        fn = compile_formula(raw, sheet)
+                        out[idx] = np.broadcast_to(_scalarize(fn(_Rows(self, idx))), (len(idx),))
+                    except (FormulaError, ValueError, IndexError):
+                        pass  # stays NaN: not checkable
+        finally:
+            self._active.discard(key)
+        self._values[key] = out
+        return out
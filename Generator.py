@@ -8,7 +8,16 @@ from openpyxl import load_workbook
 from openpyxl.cell.cell import MergedCell
 from openpyxl.styles import Protection, PatternFill
 from openpyxl.formatting.rule import FormulaRule
+from openpyxl.utils import get_column_letter
 from PIL import Image, ImageTk
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from io import BytesIO
+import KeyProbe
+import Profiler
+import Variants
+import argparse
+import multiprocessing
+import random
 import sys
 
 # Try importing TkinterDnD
@@ -19,33 +28,142 @@ except ImportError:
     DND_AVAILABLE = False
 
 
-# --- Check if a cell is a graded cell ---
-def is_target_fill(cell, target_hex="FFD9E1F2"):
-    if cell.fill is None:
-        return False
-    fg = getattr(cell.fill.fgColor, "rgb", None)
-    if fg is None:
-        return False
-    return str(fg).upper() == target_hex.upper()
-
-
-# --- Create assignment ---
-def create_assignment(key_file: Path, output_file: Path, target_sheet: str = None, target_hex="FFD9E1F2"):
+# --- Graded cells: the key's graded-cell spec, or its fill colour ---
+def graded_cell_set(key_file: Path, sheet_name: str, target_hex="FFD9E1F2"):
+    """1-based (row, col) of the graded cells, read once from the key file (see KeyProbe)."""
+    return {(r + 1, c + 1) for r, c in KeyProbe.graded_cells(key_file, sheet_name, target_hex)["graded"]}
+
+
+# --- Group graded cells into rectangles ---
+def coalesce_ranges(cells):
+    """
+    Group (row, col) cells into contiguous rectangles.
+    Returns a list of (min_row, min_col, max_row, max_col), 1-based.
+    """
+    by_row = {}
+    for r, c in cells:
+        by_row.setdefault(r, []).append(c)
+
+    open_rects = {}   # (min_col, max_col) -> [min_row, max_row]
+    rects = []
+    for r in sorted(by_row):
+        # Horizontal runs of consecutive columns in this row
+        cols = sorted(set(by_row[r]))
+        runs = []
+        start = prev = cols[0]
+        for c in cols[1:]:
+            if c != prev + 1:
+                runs.append((start, prev))
+                start = c
+            prev = c
+        runs.append((start, prev))
+
+        # Extend a rectangle from the row above when the run spans the same columns
+        still_open = {}
+        for span in runs:
+            rect = open_rects.pop(span, None)
+            if rect is not None and rect[1] == r - 1:
+                rect[1] = r
+            else:
+                if rect is not None:
+                    rects.append((rect[0], span[0], rect[1], span[1]))
+                rect = [r, r]
+            still_open[span] = rect
+        for span, rect in open_rects.items():
+            rects.append((rect[0], span[0], rect[1], span[1]))
+        open_rects = still_open
+
+    for span, rect in open_rects.items():
+        rects.append((rect[0], span[0], rect[1], span[1]))
+    return sorted(rects)
+
+
+# --- Cached key values for graded cells ---
+def graded_key_values(key_file: Path, sheet_name: str, graded: dict):
+    """
+    Return {(row, col): value} for the graded cells, using the values Excel
+    cached in the key. graded maps (row, col) to the cell's original value;
+    constants are used as-is, formulas need a cached result.
+    """
+    wb_vals = load_workbook(key_file, data_only=True, read_only=True)
+    try:
+        ws_vals = wb_vals[sheet_name]
+        cached = {}
+        for r_idx, row in enumerate(ws_vals.iter_rows(values_only=True), start=1):
+            for c_idx, value in enumerate(row, start=1):
+                if (r_idx, c_idx) in graded:
+                    cached[(r_idx, c_idx)] = value
+    finally:
+        wb_vals.close()
+
+    values = {}
+    missing = []
+    for (r, c), original in graded.items():
+        if isinstance(original, str) and original.startswith("="):
+            value = cached.get((r, c))
+            if value is None:
+                missing.append(f"{get_column_letter(c)}{r}")
+            values[(r, c)] = value
+        else:
+            values[(r, c)] = original
+
+    if missing:
+        raise ValueError(
+            f"The key has no saved values for {len(missing)} graded formula cell(s) "
+            f"(e.g. {', '.join(missing[:5])}). Open and save the key in Excel, "
+            f"or generate without compact key data."
+        )
+    return values
+
+
+# --- Build assignment ---
+def build_assignment(key_file: Path, target_sheet: str = None, target_hex="FFD9E1F2",
+                     coalesce_rules=True, compact_key=False, stats: dict = None,
+                     inputs: dict = None, key_values: dict = None, variant: str = None,
+                     profiler=None):
+    """
+    Build the locked assignment once in memory and return the serialized
+    .xlsx bytes. Callers write the same bytes out for every copy.
+
+    With coalesce_rules, graded cells are grouped into rectangles and each
+    rectangle gets one green and one red rule using relative references.
+    With compact_key, KeyData holds only the graded cells' saved values
+    instead of a copy of the whole sheet, so its size follows the graded
+    cell count. The key must have been saved by Excel for this.
+    If a stats dict is passed it is filled with graded_cells, rules, key_cells and bytes.
+
+    For variants, inputs maps (row, col) -> value to overwrite input cells,
+    key_values replaces the cached graded values used by compact_key, and
+    variant is stamped into the workbook so the grader can identify it.
+    profiler (see Profiler.py) times and profiles each step.
+    """
+    profiler = profiler or Profiler.OFF
+    profiler.begin("load key")
+    wb = load_workbook(key_file, data_only=False)
     try:
-        wb = load_workbook(key_file, data_only=False)
         ws = wb[target_sheet] if target_sheet and target_sheet in wb.sheetnames else wb.active
+        graded_set = graded_cell_set(key_file, ws.title, target_hex)
+        if KeyProbe.SPEC_SHEET in wb.sheetnames:
+            del wb[KeyProbe.SPEC_SHEET]  # accepted alternates stay out of student copies
+
+        for (r, c), value in (inputs or {}).items():
+            cell = ws.cell(row=r, column=c)
+            cell.value = value
+            cell.comment = None  # drop the Vary: spec from the student copy
 
         # --------------------------------------------------------------
         # 1. Create hidden sheet to store key answers
         # --------------------------------------------------------------
+        profiler.begin("key data")
         key_sheet_name = "KeyData"
         if key_sheet_name in wb.sheetnames:
             del wb[key_sheet_name]
         ws_key = wb.create_sheet(key_sheet_name)
 
-        for r_idx, row in enumerate(ws.iter_rows(values_only=True), start=1):
-            for c_idx, value in enumerate(row, start=1):
-                ws_key.cell(row=r_idx, column=c_idx, value=value)
+        if not compact_key:
+            for r_idx, row in enumerate(ws.iter_rows(values_only=True), start=1):
+                for c_idx, value in enumerate(row, start=1):
+                    ws_key.cell(row=r_idx, column=c_idx, value=value)
 
         ws_key.sheet_state = "veryHidden"
 
@@ -58,42 +176,199 @@ def create_assignment(key_file: Path, output_file: Path, target_sheet: str = Non
         # --------------------------------------------------------------
         # 3. Loop through visible sheet cells
         # --------------------------------------------------------------
+        profiler.begin("lock cells")
+        graded = {}  # (row, col) -> original key value
         for row in ws.iter_rows():
             for cell in row:
                 if isinstance(cell, MergedCell):
                     continue
 
-                coord = cell.coordinate
-                key_ref = f"'{key_sheet_name}'!{coord}"
-
-                if is_target_fill(cell, target_hex):
+                if (cell.row, cell.column) in graded_set:
                     # Unlock and clear graded cells
+                    graded[(cell.row, cell.column)] = cell.value
                     cell.value = None
                     cell.protection = Protection(locked=False)
-
-                    # Add conditional formatting
-                    ws.conditional_formatting.add(
-                        coord,
-                        FormulaRule(formula=[f"={coord}={key_ref}"], fill=green_fill)
-                    )
-                    ws.conditional_formatting.add(
-                        coord,
-                        FormulaRule(formula=[f"=AND({coord}<>\"\",{coord}<>{key_ref})"], fill=red_fill)
-                    )
                 else:
                     # Lock all other cells
                     cell.protection = Protection(locked=True)
 
+        if compact_key:
+            # Same coordinates as the visible sheet, so the rules below still line up
+            if key_values is None:
+                key_values = graded_key_values(key_file, ws.title, graded)
+            for (r, c), value in key_values.items():
+                ws_key.cell(row=r, column=c, value=value)
+
+        # --------------------------------------------------------------
+        # 3b. Add conditional formatting per graded range
+        # --------------------------------------------------------------
+        profiler.begin("conditional formatting")
+        if coalesce_rules:
+            rects = coalesce_ranges(graded)
+        else:
+            rects = [(r, c, r, c) for r, c in graded]
+
+        for min_row, min_col, max_row, max_col in rects:
+            # Formulas are written for the top-left cell; Excel shifts the
+            # relative references across the rest of the range.
+            coord = f"{get_column_letter(min_col)}{min_row}"
+            key_ref = f"'{key_sheet_name}'!{coord}"
+            if (min_row, min_col) == (max_row, max_col):
+                cell_range = coord
+            else:
+                cell_range = f"{coord}:{get_column_letter(max_col)}{max_row}"
+
+            ws.conditional_formatting.add(
+                cell_range,
+                FormulaRule(formula=[f"={coord}={key_ref}"], fill=green_fill)
+            )
+            ws.conditional_formatting.add(
+                cell_range,
+                FormulaRule(formula=[f"=AND({coord}<>\"\",{coord}<>{key_ref})"], fill=red_fill)
+            )
+
         # --------------------------------------------------------------
         # 4. Enable sheet protection
         # --------------------------------------------------------------
         ws.protection.sheet = True
         ws.protection.enable()
 
+        if variant is not None:
+            Variants.set_marker(wb, variant)
+
         # --------------------------------------------------------------
-        # 5. Save workbook
+        # 5. Serialize workbook
         # --------------------------------------------------------------
-        wb.save(output_file)
+        profiler.begin("serialize")
+        buf = BytesIO()
+        wb.save(buf)
+        data = buf.getvalue()
+
+        if stats is not None:
+            stats["graded_cells"] = len(graded)
+            stats["rules"] = 2 * len(rects)
+            stats["key_cells"] = len(graded) if compact_key else ws.max_row * ws.max_column
+            stats["bytes"] = len(data)
+        print(f"Conditional formatting: {2 * len(rects)} rules for {len(graded)} graded cells")
+        return data
+    finally:
+        wb.close()
+
+
+# --- Write copies ---
+def write_copies(data: bytes, output_dir: Path, num_copies: int, max_workers: int = None):
+    """
+    Write the serialized assignment num_copies times as Assignment_NN.xlsx.
+    The copies are identical, so this is pure file I/O and runs on a thread pool.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = [output_dir / f"Assignment_{i:02d}.xlsx" for i in range(1, num_copies + 1)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(lambda p: p.write_bytes(data), paths))
+
+    return paths
+
+
+# --- Variant spec ---
+def read_variant_spec(key_file: Path, target_sheet: str = None, target_hex="FFD9E1F2"):
+    """
+    Scan the key once for variant generation.
+    Returns (sheet title, cells, graded, specs) where cells maps
+    (sheet, row, col) -> raw value for every sheet, graded lists the
+    graded (row, col) cells and specs maps input (row, col) -> Vary spec.
+    """
+    wb = load_workbook(key_file, data_only=False)
+    try:
+        ws = wb[target_sheet] if target_sheet and target_sheet in wb.sheetnames else wb.active
+        graded_set = graded_cell_set(key_file, ws.title, target_hex)
+        cells = {}
+        for sheet in wb.worksheets:
+            for row in sheet.iter_rows():
+                for cell in row:
+                    if cell.value is not None and not isinstance(cell, MergedCell):
+                        cells[(sheet.title, cell.row, cell.column)] = cell.value
+
+        graded = []
+        specs = {}
+        for row in ws.iter_rows():
+            for cell in row:
+                if isinstance(cell, MergedCell):
+                    continue
+                if (cell.row, cell.column) in graded_set:
+                    graded.append((cell.row, cell.column))
+                elif cell.comment is not None:
+                    spec = Variants.parse_vary(cell.comment.text)
+                    if spec:
+                        specs[(cell.row, cell.column)] = spec
+        return ws.title, cells, graded, specs
+    finally:
+        wb.close()
+
+
+def _build_variant(job):
+    """Process-pool worker: build one variant and write it to disk."""
+    key_file, sheet, target_hex, compact_key, variant_id, inputs, expected, out_file = job
+    data = build_assignment(key_file, sheet, target_hex, compact_key=compact_key,
+                            inputs=inputs, key_values=expected, variant=variant_id)
+    Path(out_file).write_bytes(data)
+    return out_file
+
+
+# --- Generate randomized variants ---
+def generate_variants(key_file: Path, output_dir: Path, num_copies: int, target_sheet: str = None,
+                      target_hex="FFD9E1F2", compact_key=False, base_seed: int = None,
+                      max_workers: int = None, profiler=None):
+    """
+    Build one variant per copy with randomized input cells (see Variants.py).
+    Expected graded values are computed from the key's formulas here, once
+    per variant, and saved with each seed in variants.json. The copies
+    differ, so they are built in a process pool (profiled from this
+    process only).
+    """
+    profiler = profiler or Profiler.OFF
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    profiler.begin("variant spec")
+    sheet, cells, graded, specs = read_variant_spec(key_file, target_sheet, target_hex)
+    if not specs:
+        raise ValueError("No input cells marked with a 'Vary: low, high' comment were found in the key.")
+    if base_seed is None:
+        base_seed = random.randrange(2 ** 31)
+
+    profiler.begin("expected values", items=True)
+    jobs = []
+    manifest = {}
+    for i in range(1, num_copies + 1):
+        variant_id = f"{i:02d}"
+        profiler.item(f"variant {variant_id}")
+        seed = base_seed + i
+        inputs = Variants.draw_inputs(specs, seed)
+        expected = Variants.expected_values(cells, sheet, graded, inputs)
+        out_file = output_dir / f"Assignment_{variant_id}.xlsx"
+        jobs.append((key_file, sheet, target_hex, compact_key, variant_id, inputs, expected, out_file))
+        manifest[variant_id] = Variants.manifest_entry(out_file.name, seed, inputs, expected)
+
+    profiler.begin("build variants")
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        paths = list(pool.map(_build_variant, jobs))
+
+    profiler.begin("manifest")
+    Variants.write_manifest(output_dir / Variants.MANIFEST_NAME, key_file, sheet, base_seed, manifest)
+    print(f"{len(paths)} variant(s) saved and locked in: {output_dir}")
+    return paths
+
+
+# --- Create assignment ---
+def create_assignment(key_file: Path, output_file: Path, target_sheet: str = None, target_hex="FFD9E1F2",
+                      profiler=None):
+    profiler = profiler or Profiler.OFF
+    try:
+        data = build_assignment(key_file, target_sheet, target_hex, profiler=profiler)
+        profiler.begin("write file")
+        Path(output_file).write_bytes(data)
+        profiler.end()
         print(f"Assignment saved and locked: {output_file}")
 
     except PermissionError:
@@ -103,6 +378,38 @@ def create_assignment(key_file: Path, output_file: Path, target_sheet: str = Non
         messagebox.showerror("Error", f"Error creating assignment: {e}")
 
 
+# --- Generate all copies ---
+def generate_assignments(key_file: Path, output_dir: Path, num_copies: int, target_sheet: str = None,
+                         target_hex="FFD9E1F2", compact_key=False, variants=False, profiler=None):
+    """
+    Parse the key and build the assignment once, then emit num_copies files.
+    With variants, each copy gets its own randomized inputs instead.
+    Returns the list of written paths, or [] if an error was shown.
+    """
+    profiler = profiler or Profiler.OFF
+    try:
+        if variants:
+            paths = generate_variants(key_file, output_dir, num_copies, target_sheet, target_hex,
+                                      compact_key=compact_key, profiler=profiler)
+            profiler.end()
+            return paths
+
+        data = build_assignment(key_file, target_sheet, target_hex, compact_key=compact_key, profiler=profiler)
+        profiler.begin("write copies")
+        paths = write_copies(data, output_dir, num_copies)
+        profiler.end()
+        print(f"{len(paths)} assignment(s) saved and locked in: {output_dir}")
+        return paths
+
+    except PermissionError as e:
+        messagebox.showerror("Permission Error",
+                             f"Cannot write to {getattr(e, 'filename', None) or output_dir}\n"
+                             f"Close the file if it's open.")
+    except Exception as e:
+        messagebox.showerror("Error", f"Error creating assignment: {e}")
+    return []
+
+
 # --- GUI ---
 def run_gui():
     result = {"key_file": None, "num_copies": 1, "output_dir": None, "sheet_name": None}
@@ -110,16 +417,32 @@ def run_gui():
     def set_key(event_or_path):
         p = _get_path(event_or_path)
         key_var.set(str(p))
-        try:
-            wb = load_workbook(p, read_only=True)
-            sheets = wb.sheetnames
-            sheet_combo['values'] = sheets
-            if sheets:
-                sheet_combo.current(0)
-                sheet_var.set(sheets[0])
-        except Exception as e:
+        graded_var.set("Reading key...")
+        probe_key(p)
+
+    def probe_key(p, sheet=None):
+        # Reads workbook.xml off the Tk thread; ignore results for a key that was replaced
+        def done(info):
+            if key_var.get() != str(p):
+                return
+            if sheet is None:
+                sheets = info["sheets"]
+                sheet_combo['values'] = sheets
+                if sheets:
+                    sheet_combo.current(0)
+                    sheet_var.set(sheets[0])
+            graded_var.set(f"Graded cells on '{info['sheet']}': {info['graded']}")
+
+        def failed(e):
+            graded_var.set("")
             messagebox.showerror("Error", f"Cannot read sheets: {e}")
 
+        KeyProbe.run_in_background(root, lambda: KeyProbe.probe(p, sheet, with_count=True), done, failed)
+
+    def on_sheet_selected(event=None):
+        if key_var.get() and sheet_var.get():
+            probe_key(Path(key_var.get()), sheet_var.get())
+
     def browse_key():
         f = filedialog.askopenfilename(title="Select Key .xlsx", filetypes=[("Excel files", "*.xlsx")])
         if f:
@@ -146,6 +469,8 @@ def run_gui():
         result["output_dir"] = output_var.get()
         result["sheet_name"] = sheet_var.get()
         result["enable_cond_fmt"] = cond_fmt_var.get()
+        result["compact_key"] = compact_var.get()
+        result["variants"] = variants_var.get()
         root.quit()
 
     def _get_path(e):
@@ -197,6 +522,7 @@ def run_gui():
     output_var = tk.StringVar()
     num_var = tk.StringVar(value="1")
     sheet_var = tk.StringVar()
+    graded_var = tk.StringVar()
     pad_x, pad_y = 8, 6
 
     # --- Number of copies ---
@@ -216,6 +542,24 @@ def run_gui():
         bg="#f0f0f0"
     )
     chk_cond.pack(side="left", padx=(30, 0))
+
+    compact_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(
+        frame_num,
+        text="Compact key data (graded cells only)",
+        variable=compact_var,
+        font=("Helvetica", 10),
+        bg="#f0f0f0"
+    ).pack(side="left", padx=(15, 0))
+
+    variants_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(
+        frame_num,
+        text="Randomize inputs per copy",
+        variable=variants_var,
+        font=("Helvetica", 10),
+        bg="#f0f0f0"
+    ).pack(side="left", padx=(15, 0))
     # -----------------------------------------------------------------
 
     result["enable_cond_fmt"] = cond_fmt_var.get()
@@ -237,7 +581,10 @@ def run_gui():
     tk.Label(root, text="Select sheet to clear graded cells:", anchor="w",
              font=("Helvetica", 10, "bold")).pack(anchor="w", padx=pad_x)
     sheet_combo = ttk.Combobox(root, textvariable=sheet_var, state="readonly", width=40)
-    sheet_combo.pack(anchor="w", padx=pad_x, pady=(0, 10))
+    sheet_combo.pack(anchor="w", padx=pad_x, pady=(0, 2))
+    sheet_combo.bind("<<ComboboxSelected>>", on_sheet_selected)
+    tk.Label(root, textvariable=graded_var, anchor="w", font=("Helvetica", 9),
+             bg="#f0f0f0").pack(anchor="w", padx=pad_x, pady=(0, 8))
 
     # --- Output folder ---
     frame_out = tk.Frame(root)
@@ -276,6 +623,10 @@ def run_gui():
 
 # --- Main ---
 def main():
+    parser = argparse.ArgumentParser(description="Generate locked Excel assignments from an answer key.")
+    Profiler.add_arguments(parser)
+    args = parser.parse_args()
+
     inputs = run_gui()
     if inputs:
         messagebox.showinfo(f"Success!", f"The assignment has been created.")
@@ -289,13 +640,15 @@ def main():
     num_copies = inputs["num_copies"]
     sheet_name = inputs["sheet_name"]
 
-    for i in range(1, num_copies + 1):
-        print(f"Output Directory: \n{output_dir}")
-        out_file = output_dir / f"Assignment_{i:02d}.xlsx"
-        create_assignment(key_file, out_file, target_sheet=sheet_name)
+    print(f"Output Directory: \n{output_dir}")
+    generate_assignments(key_file, output_dir, num_copies, target_sheet=sheet_name,
+                         compact_key=inputs.get("compact_key", False),
+                         variants=inputs.get("variants", False),
+                         profiler=Profiler.from_args(args, "generator"))
 
     messagebox.showinfo("Done", f"{num_copies} assignment(s) generated in:\n{output_dir}")
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # variant workers in a frozen (PyInstaller) build
     main()
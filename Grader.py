@@ -29,10 +29,25 @@ from openpyxl.chart import BarChart, Reference
 from openpyxl.styles import PatternFill
 from openpyxl.comments import Comment
 from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
 from pathlib import Path
 from GraderGUI2 import run_gui
+import FormulaEngine
+import Guards
+import Journal
+import KeyProbe
+import Matchers
+import Metrics
+import Profiler
+import Recalc
+import Similarity
+import Variants
 from tkinter import messagebox
 import pandas as pd
+import numpy as np
+import argparse
+import json
+import multiprocessing
 import zipfile
 import shutil
 import os
@@ -59,12 +74,465 @@ else:
     # Running as a normal Python script
     BASE = Path.cwd()
 
-for d in ["Solutions", "Roster", "Submissions", "Results"]:
-    (BASE / d).mkdir(parents=True, exist_ok=True)
+
+# ----------------------------------------------------------------------
+# GRADING CORE
+# ----------------------------------------------------------------------
+TARGET = "FFD9E1F2"
+
+
+def load_key(key_path, sheet_name, target=TARGET, rubric=None):
+    """
+    Read the answer key once. Returns a dict with the graded cells
+    (0-based (row, col)), their 1-based coords and points, one compiled
+    matcher per cell, the scoring rubric, the key's answers for feedback
+    comments and the raw contents of every non-empty key cell. Graded
+    cells come from the key's graded-cell spec, or its fill colour (see
+    KeyProbe); rubric is a dict from load_rubric, or None.
+    """
+    wb_key = load_workbook(key_path)
+    try:
+        try:
+            ws_key = wb_key[sheet_name]
+        except KeyError:
+            raise KeyError(f"Sheet '{sheet_name}' not found in key workbook: {key_path}")
+
+        spec = KeyProbe.graded_cells(key_path, sheet_name, target)
+        graded = spec["graded"]
+        print(f"Graded cells: {len(graded)} (from {spec['source']})")
+        cells = {}
+        for i, row in enumerate(ws_key.iter_rows(values_only=True)):
+            for j, value in enumerate(row):
+                if value is not None:
+                    cells[(i, j)] = value
+
+        # Compile each graded cell once: accepted formulas/values from the key
+        # and its comment, plus the value Excel saved in the key
+        graded_coords = [(r + 1, c + 1) for r, c in graded]
+        key_values = KeyProbe.cached_values(key_path, sheet_name, graded_coords)
+        matchers = Matchers.compile_matchers(ws_key, graded, key_values, sheet_name, spec["accept"])
+        answers = {(r, c): ws_key.cell(row=r + 1, column=c + 1).value for r, c in graded}
+    finally:
+        # Close the key workbook promptly to avoid locks
+        wb_key.close()
+
+    return {
+        "path": Path(key_path),
+        "sheet": sheet_name,
+        "graded": graded,
+        "coords": graded_coords,
+        "points": [spec["points"].get(rc, 1.0) for rc in graded],
+        "rubric": compile_rubric(graded, [spec["points"].get(rc, 1.0) for rc in graded], rubric),
+        "matchers": matchers,
+        "answers": answers,
+        "cells": cells,
+    }
+
+
+def variant_values(wb, manifest_file, name):
+    """Expected values for the submission's variant, or None to use the key's."""
+    if not manifest_file:
+        return None
+    variant_id = Variants.get_marker(wb)
+    variant_num = Variants.variant_key(manifest_file, variant_id) if variant_id else None
+    if variant_num is None:
+        print(f"No variant found for {name} (marker: {variant_id}). Using key values.")
+    return variant_num
+
+
+def grade_workbook(wb, source, key, variant_num=None, recalc=None):
+    """
+    Grade one loaded submission against a key from load_key.
+    source is the submission's path or file object (read for saved values),
+    recalc the submission's verdicts from Recalc.verify, if any.
+    Returns a dict with the blank, wrong_form, wrong and hardcoded (right
+    value typed as a constant) cells and the score.
+    """
+    ws = wb[key["sheet"]]
+    graded = key["graded"]
+
+    # Saved results for the graded cells only
+    saved = KeyProbe.cached_values(source, key["sheet"], key["coords"])
+    blank = []
+    wrong_val = []
+    wrong_form = []
+    hardcoded = []
+    for idx, (r, c) in enumerate(graded):
+        val = ws.cell(row=r + 1, column=c + 1).value
+        if val is None or val == "":
+            blank.append((r, c))
+            continue
+
+        # Formulas are compared by structure (reference style, whitespace,
+        # _xlfn. prefixes, operand order), against the key and any alternates
+        m = key["matchers"][idx]
+        if not m.matches_entry(val):
+            wrong_val.append((r, c))
+
+        # A constant where the key has a formula is a hardcoded answer
+        verdict = (recalc or {}).get((r + 1, c + 1))
+        expected = variant_num.get((r, c)) if variant_num is not None else None
+        if m.is_hardcoded(val):
+            wrong_form.append((r, c))
+            # Kept apart so a rubric can give partial credit for it
+            if m.matches_value(saved[(r + 1, c + 1)], expected):
+                hardcoded.append((r, c))
+        elif verdict is not None:
+            if not verdict:
+                wrong_form.append((r, c))
+        else:
+            if m.matches_value(saved[(r + 1, c + 1)], expected) is False:
+                wrong_form.append((r, c))
+
+    wrong_form = [c for c in wrong_val if c in wrong_form]
+    wrong = wrong_form + blank
+    hardcoded = [c for c in hardcoded if c in wrong_form]
+    result = {"blank": blank, "wrong_form": wrong_form, "wrong": wrong, "hardcoded": hardcoded,
+              "out_of": len(graded)}
+
+    # Points and partial credit from the rubric (1 point, all or nothing by default)
+    rubric = key.get("rubric") or compile_rubric(graded, key.get("points"))
+    result["score"] = int(score_outcomes([outcome_string(result, graded)], rubric)[0])
+    return result
+
+
+def cell_list(cells):
+    return ','.join(f"{get_column_letter(c + 1)}{r + 1}" for r, c in cells)
+
+
+def student_name(folder):
+    """First and last name from an LMS folder name like 'First Last_123_assignsubmission_file'."""
+    parts = folder.split('_')[0].split(' ')
+    return parts[0], ' '.join(parts[1:])
+
+
+def grade_submission(f, key, manifest_file=None, recalc=None, res_path=None, instructor=None):
+    """
+    Open, grade and fingerprint one submission file, and write its feedback
+    copy to res_path (skipped if None). Returns (result, fingerprint), or
+    None if the file can't be opened or has no graded sheet.
+    """
+    try:
+        wb = load_workbook(f)
+    except Exception as e:
+        print(f"Could not open {f}: {e}. Skipping.")
+        return None
+    try:
+        if key["sheet"] not in wb.sheetnames:
+            print(f"Sheet '{key['sheet']}' not found in {f}. Skipping.")
+            return None
+
+        # Variant assignments are graded against that variant's precomputed values
+        variant_num = variant_values(wb, manifest_file, Path(f).name)
+
+        result = grade_workbook(wb, f, key, variant_num, recalc)
+        fingerprint = Similarity.fingerprint(wb, key)
+
+        # Save graded copy with highlights and the grade report
+        if res_path is not None:
+            Path(res_path).parent.mkdir(parents=True, exist_ok=True)
+            write_feedback(wb, result, key, instructor, res_path)
+        return result, fingerprint
+    finally:
+        # Close workbook to avoid leaving locks
+        try:
+            wb.close()
+        except Exception:
+            pass
+
+
+# Grading under a time limit runs in a worker process (Guards.TimeLimited).
+# Each worker loads the key itself: matchers hold process-local formula ids.
+_WORKER_KEY = None
+
+
+def _init_grade_worker(key_path, sheet_name, rubric=None):
+    global _WORKER_KEY
+    _WORKER_KEY = load_key(key_path, sheet_name, rubric=rubric)
+
+
+def _grade_in_worker(f, manifest_file, recalc, res_path, instructor):
+    return grade_submission(f, _WORKER_KEY, manifest_file, recalc, res_path, instructor)
+
+
+# ----------------------------------------------------------------------
+# STORED OUTCOMES (feedback on demand, rescoring)
+# ----------------------------------------------------------------------
+OUTCOMES_NAME = "outcomes.json"
+CORRECT, INCORRECT, EMPTY, HARDCODED = "1", "0", "-", "h"
+
+
+def outcome_string(result, graded):
+    """
+    One character per graded cell, in graded order: 1 correct, 0 incorrect,
+    - empty, h incorrect but the right value typed as a constant.
+    """
+    blank = set(result["blank"])
+    wrong = set(result["wrong"])
+    hardcoded = set(result.get("hardcoded", ()))
+    return "".join(EMPTY if cell in blank else HARDCODED if cell in hardcoded else INCORRECT if cell in wrong
+                   else CORRECT for cell in graded)
 
 
-def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor, output_folder):
+def result_from_outcome(outcome, graded, score):
+    """Rebuild grade_workbook's result dict from an outcome string."""
+    blank = [cell for cell, o in zip(graded, outcome) if o == EMPTY]
+    wrong_form = [cell for cell, o in zip(graded, outcome) if o in (INCORRECT, HARDCODED)]
+    hardcoded = [cell for cell, o in zip(graded, outcome) if o == HARDCODED]
+    return {"blank": blank, "wrong_form": wrong_form, "wrong": wrong_form + blank, "hardcoded": hardcoded,
+            "score": score, "out_of": len(graded)}
+
+
+def _json_value(value):
+    return value if value is None or isinstance(value, (str, int, float, bool)) else str(value)
+
+
+def write_outcomes(path, key, instructor, submissions):
+    """
+    Save every submission's per-cell outcome together with what feedback
+    needs from the key (sheet, graded cells, answers), so feedback files
+    can be made later from the submission alone.
+    """
+    graded = key["graded"]
+    outcomes = {
+        "key_file": Path(key["path"]).name,
+        "sheet": key["sheet"],
+        "instructor": instructor,
+        "graded": cell_list(graded).split(",") if graded else [],
+        "answers": [_json_value(key["answers"].get(cell)) for cell in graded],
+        "points": key.get("points"),
+        "rubric": key["rubric"]["source"] if key.get("rubric") else None,
+        "submissions": submissions,
+    }
+    Path(path).write_text(json.dumps(outcomes, indent=1), encoding="utf-8")
+    print(f"Per-cell outcomes for {len(submissions)} submissions saved → {path}")
+
+
+def load_outcomes(path):
+    """Read outcomes.json. Returns (key dict usable by write_feedback, outcomes)."""
+    outcomes = json.loads(Path(path).read_text(encoding="utf-8"))
+    graded = []
+    for coord in outcomes["graded"]:
+        r, c = coordinate_to_tuple(coord)
+        graded.append((r - 1, c - 1))
+    key = {
+        "sheet": outcomes["sheet"],
+        "graded": graded,
+        "answers": dict(zip(graded, outcomes["answers"])),
+    }
+    return key, outcomes
+
+
+# ----------------------------------------------------------------------
+# RUBRIC (POINTS AND PARTIAL CREDIT)
+# ----------------------------------------------------------------------
+# A rubric is a JSON file; every part is optional:
+#   {"points":  {"C5": 2, "D2:D10": 0.5},      overrides the key's points
+#    "credit":  {"hardcoded": 0.5},            share of a cell's points per outcome
+#    "forgive": ["D7"]}                        full credit for everyone (bad key cell)
+# Outcomes are correct, incorrect, blank and hardcoded (right value
+# typed where the key has a formula). Scores are computed from the
+# stored outcome strings, so a changed rubric rescores a whole class
+# without opening a workbook (see Rescore.py).
+CREDIT = {CORRECT: 1.0, INCORRECT: 0.0, EMPTY: 0.0, HARDCODED: 0.0}
+RUBRIC_OUTCOMES = {"correct": CORRECT, "incorrect": INCORRECT, "blank": EMPTY, "hardcoded": HARDCODED}
+
+
+def load_rubric(path):
+    rubric = json.loads(Path(path).read_text(encoding="utf-8"))
+    unknown = set(rubric.get("credit", {})) - set(RUBRIC_OUTCOMES)
+    if unknown:
+        raise ValueError(f"Unknown outcome(s) in rubric credit: {', '.join(sorted(unknown))} "
+                         f"(use {', '.join(RUBRIC_OUTCOMES)})")
+    return rubric
+
+
+def _rubric_cells(ranges, graded):
+    """Indices into graded of the cells in a range or list of ranges ("C5", "D2:D10")."""
+    for text in [ranges] if isinstance(ranges, str) else ranges:
+        min_col, min_row, max_col, max_row = range_boundaries(str(text).replace("$", "").strip())
+        for i, (r, c) in enumerate(graded):
+            if min_row <= r + 1 <= max_row and min_col <= c + 1 <= max_col:
+                yield i
+
+
+def compile_rubric(graded, points=None, rubric=None):
+    """
+    Point vector, credit per outcome code and forgiven cells for
+    score_outcomes. points are the key's per-cell points (1 each if None).
+    """
+    rubric = rubric or {}
+    weights = np.array(points if points else [1.0] * len(graded), dtype=float)
+    for ranges, p in rubric.get("points", {}).items():
+        weights[list(_rubric_cells(ranges, graded))] = float(p)
+
+    # Indexed by the outcome character's code, so a whole matrix of outcomes is one lookup
+    credit = np.zeros(256)
+    for code, value in CREDIT.items():
+        credit[ord(code)] = value
+    for name, value in rubric.get("credit", {}).items():
+        credit[ord(RUBRIC_OUTCOMES[name])] = float(value)
+
+    forgive = np.zeros(len(graded), dtype=bool)
+    forgive[list(_rubric_cells(rubric.get("forgive", []), graded))] = True
+    return {"points": weights, "credit": credit, "forgive": forgive, "source": rubric or None}
+
+
+def score_outcomes(outcomes, rubric):
+    """Scores (0-100, rounded) for equal-length outcome strings: one matrix-vector product."""
+    weights = rubric["points"]
+    total = weights.sum()
+    if not outcomes or not total:
+        return np.zeros(len(outcomes), dtype=int)
+    codes = np.frombuffer("".join(outcomes).encode("ascii"), dtype=np.uint8).reshape(len(outcomes), len(weights))
+    earned = rubric["credit"][codes]
+    earned[:, rubric["forgive"]] = 1.0
+    lost = (1.0 - earned) @ weights
+    return np.round(100 - lost / total * 100).astype(int)
+
+
+def write_feedback(wb, result, key, instructor, res_path, answers=True):
+    """
+    Highlight the wrong cells with the correct answer in a comment, add the
+    grade report sheet and save to res_path (a path or file object).
+    With answers=False (students checking work before the deadline) the
+    wrong cells are only highlighted.
+    """
+    ws = wb[key["sheet"]]
+
+    # Highlight + comment
+    for r, c in result["wrong"]:
+        cell = ws.cell(row=r + 1, column=c + 1)
+        cell.fill = PatternFill("solid", "00FFFF00")
+        if not answers:
+            continue
+        # Use the KEY sheet cell value (not comment) as correct answer to avoid _xlfn. issues
+        correct_val = key["answers"].get((r, c))
+        comment_text = f"Correct: {correct_val}"
+        # Clean any weird _xlfn. prefix
+        if "_xlfn." in str(comment_text):
+            clean_answer = str(comment_text).replace("_xlfn.", "")
+        else:
+            clean_answer = str(comment_text)
+        cell.comment = Comment(str(clean_answer), instructor)
+
+    # Add grade report sheet
+    rep = wb.create_sheet("grade report")
+    rep["A1"] = "GRADE SUMMARY"
+    rep["A2"] = "Incorrect formulas:"
+    rep["A3"] = cell_list(result["wrong_form"])
+    rep["A4"] = "Empty cells:"
+    rep["A5"] = cell_list(result["blank"])
+    rep["A6"] = "Total incorrect:"
+    rep["A7"] = len(result["wrong"])
+    rep["A8"] = "Out of:"
+    rep["A9"] = result["out_of"]
+    rep["A10"] = "Score (%):"
+    rep["A11"] = result["score"]
+    wb.save(res_path)
+
+
+def read_roster(roster_path):
+    """The roster's first four columns as First Name, Last Name, Student ID, Email."""
+    roster_path = Path(roster_path)
+    # Read Excel or CSV explicitly
+    if roster_path.suffix == ".xlsx":
+        df_roster = pd.read_excel(io=str(roster_path), sheet_name=0)
+    else:
+        df_roster = pd.read_csv(filepath_or_buffer=str(roster_path))
+
+    # Select and rename the first four columns
+    df_roster = df_roster.iloc[:, :4].copy()
+    df_roster.columns = ["First Name", "Last Name", "Student ID", "Email"]
+    return df_roster
+
+
+SCORE_BINS = [0, 60, 70, 80, 90, 100]
+
+
+def score_labels(bins=SCORE_BINS):
+    """Labels matching whole-number bins exactly: each bin is [lo, hi), the last one [lo, hi]."""
+    labels = [f"{lo}-{hi - 1}" for lo, hi in zip(bins, bins[1:-1])]
+    labels.append(f"{bins[-2]}-{bins[-1]}")
+    return labels
+
+
+def score_counts(scores, bins=SCORE_BINS):
+    """
+    Number of scores in each bin. Scores outside the bins count in the
+    first or last one. Counts from separate batches add up.
+    """
+    scores = np.clip(np.asarray(list(scores), dtype=float), bins[0], bins[-1])
+    counts, _ = np.histogram(scores, bins=bins)
+    return counts.tolist()
+
+
+def write_summary(cell_wrong_count, scores, summary_path, counts=None, clusters=None, bins=SCORE_BINS):
+    """
+    Item analysis (how often each graded cell was wrong) plus the score
+    range counts and chart, saved to summary_path. Pass counts to use
+    already-tallied score ranges instead of binning scores, and clusters
+    (from Similarity.find_clusters) to add the near-duplicate sheet.
+
+    Written in one pass with a write-only workbook, so rows stream to
+    disk and large item analyses are never reloaded.
+    """
+    # Most frequently incorrect first
+    cell_summary = sorted(cell_wrong_count.items(), key=lambda x: x[1], reverse=True)
+    if counts is None:
+        counts = score_counts(scores, bins)
+    labels = score_labels(bins)
+
+    wb_summary = Workbook(write_only=True)
+    ws_summary = wb_summary.create_sheet("Item Analysis")
+
+    # Headers and per-cell counts
+    ws_summary.append(["Cell", "Incorrect Count"])
+    for (r, c), count in cell_summary:
+        ws_summary.append([f"{get_column_letter(c + 1)}{r + 1}", count])
+
+    # --- Score summary below a blank row ---
+    start_row = len(cell_summary) + 3
+    ws_summary.append([])
+    ws_summary.append(["SCORE SUMMARY"])
+    ws_summary.append(["Score Range", "Count"])
+    for label, count in zip(labels, counts):
+        ws_summary.append([label, count])
+
+    # --- Create Bar Chart ---
+    chart = BarChart()
+    chart.type = "col"
+    chart.title = "Score Range Distribution"
+    chart.y_axis.title = "Number of Students"
+    chart.x_axis.title = "Score Range"
+
+    last_row = start_row + 1 + len(labels)
+    data = Reference(ws_summary, min_col=2, min_row=start_row+2, max_row=last_row)
+    categories = Reference(ws_summary, min_col=1, min_row=start_row+2, max_row=last_row)
+    chart.add_data(data, titles_from_data=False)
+    chart.set_categories(categories)
+
+    # Place the chart a few columns to the right
+    ws_summary.add_chart(chart, f"D{start_row+1}")
+
+    if clusters is not None:
+        Similarity.add_sheet(wb_summary, clusters)
+
+    wb_summary.save(summary_path)
+    print(f"Summary of exam results saved at: {summary_path}")
+
+
+def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor, output_folder,
+                        manifest_file=None, perturbations=0, profiler=None, score_bins=SCORE_BINS,
+                        feedback=True, timeout=None, max_mb=Guards.MAX_UNCOMPRESSED_MB,
+                        max_cells=Guards.MAX_CELLS, metrics=None, rubric=None):
     # Your existing logic here
+    profiler = profiler or Profiler.OFF
+    metrics = (metrics or Metrics.Metrics()).start()
+
+    def begin(stage, items=False):
+        profiler.begin(stage, items)
+        metrics.begin(stage)
     # ----------------------------------------------------------------------
     # MOVE KEY & ROSTER
     # ----------------------------------------------------------------------
@@ -111,9 +579,13 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
                         "Please close all programs that may have the file open and try again."
                     )
 
+    begin("move inputs")
     solutions_dir = BASE / "Solutions"
     solutions_dir.mkdir(exist_ok=True)
     KEY_PATH = move(key_file, solutions_dir)
+    if KeyProbe.sidecar_path(key_file).exists():
+        # The key's graded-cell spec travels with it
+        move(KeyProbe.sidecar_path(key_file), solutions_dir)
     roster_dir = BASE / "Roster"
     roster_dir.mkdir(exist_ok=True)
     ROSTER_PATH = move(roster_file, roster_dir)
@@ -121,33 +593,27 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
     # ----------------------------------------------------------------------
     # READ ANSWER KEY
     # ----------------------------------------------------------------------
-    wb_key = load_workbook(KEY_PATH)
-    try:
-        ws_key = wb_key[sheet_name]
-    except KeyError:
-        wb_key.close()
-        raise KeyError(f"Sheet '{sheet_name}' not found in key workbook: {KEY_PATH}")
-
-    TARGET = "FFD9E1F2"
+    begin("load key")
+    key = load_key(KEY_PATH, sheet_name, rubric=rubric)
+    graded = key["graded"]
 
-    graded = []
-    comments = []
-    for i, row in enumerate(ws_key.iter_rows()):
-        for j, cell in enumerate(row):
-            # openpyxl stores colors as RGB possibly with alpha; match by substring safer
-            fg = getattr(cell.fill.fgColor, "rgb", None)
-            if fg == TARGET:
-                graded.append((i, j))
-                txt = cell.comment.text if cell.comment else ""
-                txt = txt.replace("\n", ", ")
-                comments.append([x.strip() for x in txt.split(",") if x.strip()])
-
-    dfKey = pd.DataFrame(ws_key.values)
-    # read numeric key for formula checking
-    dfNumKey = pd.read_excel(KEY_PATH, sheet_name).apply(pd.to_numeric, errors='coerce').round(5)
-
-    # Close the key workbook promptly to avoid locks
-    wb_key.close()
+    # ----------------------------------------------------------------------
+    # RUN JOURNAL (RESUME AN INTERRUPTED RUN)
+    # ----------------------------------------------------------------------
+    begin("journal")
+    spec_file = KeyProbe.sidecar_path(KEY_PATH)
+    journal = Journal.Journal(BASE / Journal.JOURNAL_NAME, {
+        "key": Journal.file_hash(KEY_PATH),
+        "spec": Journal.file_hash(spec_file) if spec_file.exists() else None,
+        "zip": Journal.file_hash(zip_file),
+        "sheet": sheet_name,
+        "manifest": Journal.file_hash(manifest_file) if manifest_file else None,
+        "perturbations": perturbations,
+        "feedback": feedback,
+        "limits": [timeout, max_mb, max_cells],
+        "rubric": rubric,
+    })
+    resumed = {}  # submission path -> journal entry, for work a previous run finished
 
     # ----------------------------------------------------------------------
     # EXTRACT SUBMISSIONS
@@ -155,8 +621,8 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
     def extract(zipped_path):
         tmp = Path(zipped_path).parent / "Temp_Extract"
 
-        # Reset Submissions and Results folders
-        for ds in ["Submissions", "Results"]:
+        # Reset Submissions and Results folders (keep Results when resuming)
+        for ds in ["Submissions"] if journal.resuming else ["Submissions", "Results"]:
             path = Path(ds)
             if path.exists():
                 shutil.rmtree(path, onerror=lambda func, p, e: (os.chmod(p, stat.S_IWRITE), func(p)))
@@ -186,7 +652,11 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
             dst_res.parent.mkdir(parents=True, exist_ok=True)
 
             shutil.move(str(src), str(dst_sub))
-            shutil.copy2(str(dst_sub), str(dst_res))
+            entry = journal.finished(rel, dst_sub, dst_res) if journal.resuming else None
+            if entry is not None:
+                resumed[dst_sub] = entry
+            elif feedback:
+                shutil.copy2(str(dst_sub), str(dst_res))
             files.append(dst_sub)
 
             folder_name = src.parent.name       # folder the file was in
@@ -201,16 +671,15 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
         return files, folder_student_map
 
     # Extract submissions
+    begin("extract")
     sub_files, folder_student = extract(zip_file)
+    metrics.gauge("total", sum(1 for f in sub_files if not f.name.startswith("~$")))
 
     # -----------------------------------------------------------------------
     # GET STUDENT NAMES FROM FOLDERS
     # -----------------------------------------------------------------------
     # Extract "First Last" from folder names before "_"
-    names = [path.parent.name.split('_')[0].split(' ') for path in sub_files]
-
-    # Pad or merge name parts so there are always exactly 2 columns
-    clean_names = [[parts[0], ' '.join(parts[1:])] for parts in names]
+    clean_names = [student_name(path.parent.name) for path in sub_files]
 
     # Extract lists from folder_student dict in the correct order
     folders = list(folder_student.keys())
@@ -224,15 +693,77 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
         "Last Name": last_names,
         "Folder": folders
     })
+
+    # ----------------------------------------------------------------------
+    # SCREEN SUBMISSIONS (SIZE AND CELL LIMITS)
+    # ----------------------------------------------------------------------
+    # Zip bombs and huge sheets are flagged before anything loads them
+    begin("screen")
+    flags = {}  # submission path -> why it was not graded
+    for f in sub_files:
+        if f.name.startswith("~$") or f in resumed:
+            continue
+        start = time.perf_counter()
+        try:
+            Guards.screen(f, sheet_name, max_mb, max_cells)
+        except Guards.Rejected as e:
+            flags[f] = str(e)
+            print(f"Flagged: {f.relative_to('Submissions')}: {e}")
+        metrics.observe("screen", time.perf_counter() - start, busy=False)
+    # ----------------------------------------------------------------------
+    # RECALCULATION CHECK (OPTIONAL)
+    # ----------------------------------------------------------------------
+    # Recompute every graded cell from each student's own formulas under the
+    # original and perturbed inputs, for all students in one batch
+    # With a time limit each file is read and graded in a worker process that
+    # is replaced if it runs over. The profiler cannot see into the worker, so
+    # a profiled run grades in this process with no time limit.
+    if timeout and profiler.enabled:
+        print("Profiling: grading in this process, without the per-file time limit")
+    runner = Guards.TimeLimited(timeout, _init_grade_worker, (KEY_PATH, sheet_name, rubric)) \
+        if timeout and not profiler.enabled else None
+
+    recalc = {}
+    if perturbations:
+        begin("recalc")
+        recalc_files = []
+        recalc_cells = []
+        for f in sub_files:
+            if f.name.startswith("~$") or f in resumed or f in flags:
+                continue
+            # A file openpyxl cannot read (or takes too long on) is flagged, not fatal
+            try:
+                cells = runner.run(Recalc.read_cells, f) if runner else Recalc.read_cells(f)
+            except Guards.Rejected as e:
+                flags[f] = str(e)
+            except Exception as e:
+                flags[f] = f"not a readable .xlsx ({e})"
+            else:
+                recalc_files.append(f)
+                recalc_cells.append(cells)
+                continue
+            print(f"Flagged: {f.relative_to('Submissions')}: {flags[f]}")
+        verdicts = Recalc.verify(Recalc.read_cells(KEY_PATH), recalc_cells,
+                                 sheet_name, [(r + 1, c + 1) for r, c in graded], perturbations)
+        recalc = dict(zip(recalc_files, verdicts))
+        print(f"Recalculated {len(graded)} graded cells for {len(recalc_files)} submissions "
+              f"under {perturbations} perturbed input sets")
+
     # ----------------------------------------------------------------------
     # GRADE EACH SUBMISSION
     # ----------------------------------------------------------------------
     details = []
     scores = []
     folder_score_dict = {}
+    folder_flag_dict = {}
     cell_wrong_count = {c: 0 for c in graded}  # graded is a list of (row, col)
+    fingerprints = {}  # submission -> hashed shingles for near-duplicate detection
+    outcomes = []      # per-cell outcomes, for feedback on demand (Feedback.py)
 
-    for f in sub_files:
+    begin("grade", items=True)
+
+    for i, f in enumerate(sub_files):
+        metrics.gauge("queue_depth", len(sub_files) - i - 1)
         if f.name.startswith("~$"):
             try:
                 f.unlink(missing_ok=True)  # deletes the file
@@ -244,42 +775,64 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
         student = folder_student.get(folder)
         if not student:
             continue
-        print(f"\nGrading: {f.relative_to('Submissions')} → {student}")
-        wb = load_workbook(f)
-        try:
-            ws = wb[sheet_name]
-        except KeyError:
-            wb.close()
-            print(f"Sheet '{sheet_name}' not found in {f}. Skipping.")
+        rel = f.relative_to('Submissions')
+        res_path = Path("Results") / rel
+        profiler.item(rel)
+        entry = resumed.get(f)
+        flag = flags.get(f)
+        if entry is not None and entry.get("flag"):
+            print(f"\nAlready flagged: {rel} → {student} ({entry['flag']})")
+            flag = entry["flag"]
+        elif entry is not None:
+            # Graded before the last run stopped; its feedback file is already in Results
+            print(f"\nAlready graded: {rel} → {student} ({entry['score']}%)")
+            result = Journal.result_from(entry)
+            fingerprint = entry.get("fingerprint")
+        elif flag is None:
+            print(f"\nGrading: {rel} → {student}")
+            args = (f, manifest_file, recalc.get(f), res_path if feedback else None, instructor)
+            try:
+                with metrics.timed("grade"):
+                    graded_sub = runner.run(_grade_in_worker, *args) if runner else grade_submission(f, key, *args[1:])
+            except Guards.Rejected as e:
+                flag = str(e)
+            except Exception as e:
+                if not runner:
+                    raise
+                flag = f"grading failed: {e}"
+            else:
+                if graded_sub is None:
+                    # Kept as a flagged row (and in outcomes.json, so rescoring keeps it too)
+                    flag = f"could not be opened or has no '{sheet_name}' sheet"
+                else:
+                    result, fingerprint = graded_sub
+                    entry = journal.record(rel, f, result, res_path if feedback else None, fingerprint)
+
+        if flag is not None:
+            # Not graded: score 0 with the reason in Scores.csv, no feedback file
+            if entry is None:
+                if f not in flags:
+                    print(f"Flagged: {rel}: {flag}")
+                entry = journal.record_flag(rel, f, flag)
+                res_path.unlink(missing_ok=True)
+            outcomes.append({"file": rel.as_posix(), "sha256": entry["sha256"], "score": 0,
+                             "outcome": "", "flag": flag})
+            scores.append(0)
+            folder_score_dict[folder] = 0
+            folder_flag_dict[folder] = flag
+            metrics.done(flagged=True)
             continue
 
-        df = pd.DataFrame(ws.values)
-        df_num = pd.read_excel(f, sheet_name).apply(pd.to_numeric, errors='coerce').round(5)
-        blank = []
-        wrong_val = []
-        wrong_form = []
-        for idx, (r, c) in enumerate(graded):
-            val = df.iloc[r, c]
-            if pd.isna(val) or val in ("", None):
-                blank.append((r, c))
-                continue
-
-            if val in comments[idx]:
-                df.iloc[r, c] = dfKey.iloc[r, c]
-
-            if df.iloc[r, c] != dfKey.iloc[r, c]:
-                wrong_val.append((r, c))
-
-            if r > 0 and not pd.isna(dfNumKey.iloc[r - 1, c]):
-                if df_num.iloc[r - 1, c] != dfNumKey.iloc[r - 1, c]:
-                    wrong_form.append((r, c))
-                if df_num.iloc[r - 1, c] == df.iloc[r, c]:
-                    wrong_form.append((r, c))
-
-        wrong_form = [c for c in wrong_val if c in wrong_form]
-        wrong = wrong_form + blank
-        score = 100 - len(wrong) / len(graded) * 100 if graded else 0
-        score = round(score)
+        blank, wrong_form, wrong = result["blank"], result["wrong_form"], result["wrong"]
+        if fingerprint is not None:
+            fingerprints[rel.as_posix()] = fingerprint
+        outcomes.append({
+            "file": rel.as_posix(),
+            "sha256": entry["sha256"],
+            "score": result["score"],
+            "outcome": outcome_string(result, graded),
+        })
+        score = result["score"]
         scores.append(score)
 
         folder_score_dict[folder] = score
@@ -298,55 +851,17 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
             "Score_%": score,
             "Incorrect_Cells": len(wrong),
             "Out_Of": len(graded),
-            "Incorrect_Formulas": ','.join(f"{get_column_letter(c + 1)}{r + 1}" for r, c in wrong_form),
-            "Empty_Cells": ','.join(f"{get_column_letter(c + 1)}{r + 1}" for r, c in blank),
+            "Incorrect_Formulas": cell_list(wrong_form),
+            "Empty_Cells": cell_list(blank),
         })
+        metrics.done()
 
-        # Highlight + comment
-        for r, c in wrong:
-            cell = ws.cell(row=r + 1, column=c + 1)
-            cell.fill = PatternFill("solid", "00FFFF00")
-            # Use the KEY sheet cell value (not comment) as correct answer to avoid _xlfn. issues
-            correct_val = ws_key.cell(row=r + 1, column=c + 1).value if 'ws_key' in locals() else None
-            comment_text = f"Correct: {correct_val}"
-            # Clean any weird _xlfn. prefix
-            if "_xlfn." in str(comment_text):
-                clean_answer = str(comment_text).replace("_xlfn.", "")
-            else:
-                clean_answer = str(comment_text)
-            cell.comment = Comment(str(clean_answer), instructor)
-
-        # Save graded copy (Results)
-        res_path = Path("Results") / f.relative_to("Submissions")
-        # Ensure parent exists
-        res_path.parent.mkdir(parents=True, exist_ok=True)
-        wb.save(res_path)
-
-        # Add grade report sheet and save (open new workbook handle)
-        wb2 = load_workbook(res_path)
-        rep = wb2.create_sheet("grade report")
-        rep["A1"] = "GRADE SUMMARY"
-        rep["A2"] = "Incorrect formulas:"
-        rep["A3"] = details[-1]["Incorrect_Formulas"]
-        rep["A4"] = "Empty cells:"
-        rep["A5"] = details[-1]["Empty_Cells"]
-        rep["A6"] = "Total incorrect:"
-        rep["A7"] = len(wrong)
-        rep["A8"] = "Out of:"
-        rep["A9"] = len(graded)
-        rep["A10"] = "Score (%):"
-        rep["A11"] = score
-        wb2.save(res_path)
-
-        # Close workbooks to avoid leaving locks
-        try:
-            wb.close()
-        except Exception:
-            pass
-        try:
-            wb2.close()
-        except Exception:
-            pass
+    if runner:
+        runner.close()
+    journal.close()
+    write_outcomes(BASE / OUTCOMES_NAME, key, instructor, outcomes)
+    info = FormulaEngine.canonical.cache_info()
+    print(f"Formula cache: {info.currsize} distinct formulas parsed for {info.hits + info.misses} lookups")
 
     # Make sure 'Folder' exists
     folder_col = 'Folder'
@@ -355,6 +870,9 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
 
     # Map scores
     submissions['Score'] = submissions[folder_col].map(folder_score_dict).fillna(0)
+    submissions['Flag'] = submissions[folder_col].map(folder_flag_dict).fillna("")
+    if folder_flag_dict:
+        print(f"Warning: {len(folder_flag_dict)} submission(s) flagged and not graded (see the Flag column)")
 
     # Optional: warn about missing scores
     missing = submissions[submissions['Score'].isna()][folder_col].tolist()
@@ -364,6 +882,7 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
     # ----------------------------------------------------------------------
     # 1. CREATE & SORT roster_debug.csv (sort roster workbook by first column first)
     # ----------------------------------------------------------------------
+    begin("roster")
     wb_roster = load_workbook(ROSTER_PATH)
     try:
         ws_roster = wb_roster["Grades"]
@@ -390,15 +909,7 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
     print(f"Roster workbook sorted by first column and saved → {ROSTER_PATH}")
     wb_roster.close()
 
-    # Read Excel or CSV explicitly
-    if ROSTER_PATH.suffix == ".xlsx":
-        df_roster = pd.read_excel(io=str(ROSTER_PATH), sheet_name=0)
-    else:
-        df_roster = pd.read_csv(filepath_or_buffer=str(ROSTER_PATH))
-
-    # Select and rename the first four columns
-    df_roster = df_roster.iloc[:, :4].copy()
-    df_roster.columns = ["First Name", "Last Name", "Student ID", "Email"]
+    df_roster = read_roster(ROSTER_PATH)
 
     # Merge based on 'First Name' and 'Last Name'
     df_scores = pd.merge(
@@ -411,29 +922,33 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
     # ----------------------------------------------------------------------
     # 4. ZIP THE ENTIRE RESULTS FOLDER OF FEEDBACK FILES (KEEP ZIP IN BASE FOR DEBUG)
     # ----------------------------------------------------------------------
+    begin("zip results")
     base_results = BASE / "Results"
 
-    # Defensive check
-    if not base_results.exists():
-        raise FileNotFoundError(f"Results folder not found (nothing to zip): {base_results}")
+    if not feedback:
+        print("Scores-only run: no feedback files to zip. Create them later with Feedback.py.")
+    else:
+        # Defensive check
+        if not base_results.exists():
+            raise FileNotFoundError(f"Results folder not found (nothing to zip): {base_results}")
 
-    # Create the zip in BASE (do NOT move it)
-    zip_path = BASE / "Results.zip"
+        # Create the zip in BASE (do NOT move it)
+        zip_path = BASE / "Results.zip"
 
-    print(f"Zipping folder: {base_results} → {zip_path}")
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for file_path in base_results.rglob("*"):
-            if file_path.is_file():
-                # Keep relative structure inside zip relative to BASE
-                zipf.write(file_path, arcname=file_path.relative_to(BASE))
+        print(f"Zipping folder: {base_results} → {zip_path}")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for file_path in base_results.rglob("*"):
+                if file_path.is_file():
+                    # Keep relative structure inside zip relative to BASE
+                    zipf.write(file_path, arcname=file_path.relative_to(BASE))
 
-    print(f"✅ Zipped successfully → {zip_path}")
+        print(f"✅ Zipped successfully → {zip_path}")
 
-    # Diagnostics: show the file exists and list BASE contents
-    if zip_path.exists():
-        print(f"Confirmed: {zip_path} exists (size: {zip_path.stat().st_size} bytes)")
-    else:
-        print("⚠️ Results.zip was NOT found in BASE after zipping.")
+        # Diagnostics: show the file exists and list BASE contents
+        if zip_path.exists():
+            print(f"Confirmed: {zip_path} exists (size: {zip_path.stat().st_size} bytes)")
+        else:
+            print("⚠️ Results.zip was NOT found in BASE after zipping.")
 
     print("Current contents of BASE:")
     for p in sorted(BASE.iterdir()):
@@ -454,6 +969,7 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
     # ----------------------------------------------------------------------
     # 5. SAVE FINAL SCORES CSV
     # ----------------------------------------------------------------------
+    begin("scores csv")
     SCORES_CSV = BASE / "Scores.csv"
     df_scores.to_csv(SCORES_CSV, index=False)
     print(f"\nFINAL: Scores.csv with Email_Address → {SCORES_CSV}")
@@ -462,98 +978,26 @@ def process_submissions(key_file, roster_file, zip_file, sheet_name, instructor,
     # ----------------------------------------------------------------------
     # 6. MISTAKES BY GRADED CELL SUMMARY
     # ----------------------------------------------------------------------
-    # cell_summary = {f"{get_column_letter(c + 1)}{r + 1}": count for (r, c), count in cell_wrong_count.items()}
-
-    # Convert to readable format for Excel
-    cell_summary = [
-        {"Cell": f"{get_column_letter(c + 1)}{r + 1}", "Incorrect_Count": count}
-        for (r, c), count in cell_wrong_count.items()
-    ]
+    begin("similarity")
+    clusters = Similarity.find_clusters(fingerprints)
 
-    # Sort by most frequently incorrect
-    cell_summary.sort(key=lambda x: x["Incorrect_Count"], reverse=True)
-
-    # Create workbook and sheet
-    wb_summary = Workbook()
-    ws_summary = wb_summary.active
-    ws_summary.title = "Item Analysis"
-
-    # Headers
-    ws_summary["A1"] = "Cell"
-    ws_summary["B1"] = "Incorrect Count"
-
-    # Fill in data
-    for i, entry in enumerate(cell_summary, start=2):
-        ws_summary[f"A{i}"] = entry["Cell"]
-        ws_summary[f"B{i}"] = entry["Incorrect_Count"]
-
-    # Save the summary in the Results folder
+    begin("summary")
     summary_path = BASE / "results_summary.xlsx"
-    wb_summary.save(summary_path)
-    wb_summary.close()
-
-    # --- Load existing summary workbook ---
-    wb_summary = load_workbook(summary_path)
-    ws_summary = wb_summary.active  # or wb_summary["Cell Mistakes Summary"]
-
-    # --- Add header for scores summary ---
-    start_row = ws_summary.max_row + 2  # leave a blank row
-    ws_summary[f"A{start_row}"] = "SCORE SUMMARY"
-    ws_summary[f"A{start_row+1}"] = "Score Range"
-    ws_summary[f"B{start_row+1}"] = "Count"
-
-    # --- Count the scores ---
-    labels = ["<60", "61-70", "71-80", "81-90", ">90"]
-    counts = [0] * 5
-
-    for score in df_scores["Score"]:
-        if score < 60:
-            counts[0] += 1
-        elif 60 <= score < 70:
-            counts[1] += 1
-        elif 70 <= score < 80:
-            counts[2] += 1
-        elif 80 <= score < 90:
-            counts[3] += 1
-        else:  # >=90
-            counts[4] += 1
-
-    # --- Write counts to sheet ---
-    for i, label in enumerate(labels):
-        ws_summary[f"A{start_row+2+i}"] = label
-        ws_summary[f"B{start_row+2+i}"] = counts[i]
-
-    # --- Create Bar Chart ---
-    chart = BarChart()
-    chart.type = "col"
-    chart.title = "Score Range Distribution"
-    chart.y_axis.title = "Number of Students"
-    chart.x_axis.title = "Score Range"
-
-    data = Reference(ws_summary, min_col=2, min_row=start_row+2, max_row=start_row+6)
-    categories = Reference(ws_summary, min_col=1, min_row=start_row+2, max_row=start_row+6)
-    chart.add_data(data, titles_from_data=False)
-    chart.set_categories(categories)
-
-    # Place the chart a few columns to the right
-    ws_summary.add_chart(chart, f"D{start_row+1}")
-
-    # Save workbook
-    wb_summary.save(summary_path)
-    wb_summary.close()
-    print(f"Summary of exam results saved at: {summary_path}")
+    write_summary(cell_wrong_count, df_scores["Score"], summary_path, clusters=clusters, bins=score_bins)
+    profiler.end()
+    metrics.close()
 
     return
 
 
-def move_outputs_to_folder(output_dir, results_zip, summary_file, scores_file):
+def move_outputs_to_folder(output_dir, results_zip, summary_file, scores_file, *other_files):
     """
     Moves the specified output files to the user-provided output directory.
     """
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    for file_path in [results_zip, summary_file, scores_file]:
+    for file_path in [results_zip, summary_file, scores_file, *other_files]:
         src = Path(file_path)
         if src.exists():
             dest = output_dir / src.name
@@ -587,7 +1031,7 @@ def cleanup_base_directory(base_dir):
 
     # Delete temporary files (CSV, tmp, log) but not Results.zip
     for file in base_dir.iterdir():
-        if file.is_file() and file.suffix.lower() in (".csv", ".tmp", ".log"):
+        if file.is_file() and file.suffix.lower() in (".csv", ".tmp", ".log", ".jsonl"):
             try:
                 file.unlink()
                 print(f"Deleted file: {file.name}")
@@ -595,36 +1039,65 @@ def cleanup_base_directory(base_dir):
                 print(f"Could not delete {file.name}: {e}")
 
 
-inputs = run_gui()
-if inputs:
-    process_submissions(**inputs)
-    messagebox.showinfo("Success!", "The submissions have been graded.")
-
-    # Define paths of the outputs (must match what's created in process_submissions)
-    RESULTS_ZIP = BASE / "Results.zip"
-    SUMMARY_FILE = BASE / "results_summary.xlsx"  # matches the actual saved name
-    SCORES_FILE = BASE / "Scores.csv"
-
-    # Get user-provided output folder from GUI
-    out_dir = Path(inputs["output_folder"])
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    # --- Move output files to user folder ---
-    move_outputs_to_folder(out_dir, RESULTS_ZIP, SUMMARY_FILE, SCORES_FILE)
+def main():
+    parser = argparse.ArgumentParser(description="Grade Excel submissions against an answer key.")
+    Profiler.add_arguments(parser)
+    Metrics.add_arguments(parser)
+    parser.add_argument("--score-bins", type=lambda t: [int(x) for x in t.split(",")], default=SCORE_BINS,
+                        metavar="0,60,70,80,90,100", help="score range edges for the summary histogram")
+    parser.add_argument("--timeout", type=float, default=Guards.TIMEOUT,
+                        help="seconds allowed to grade one submission; 0 (or --profile) grades in this process with no limit")
+    parser.add_argument("--max-mb", type=float, default=Guards.MAX_UNCOMPRESSED_MB,
+                        help="largest uncompressed submission in MB")
+    parser.add_argument("--max-cells", type=int, default=Guards.MAX_CELLS,
+                        help="most rows and cells allowed on the graded sheet")
+    parser.add_argument("--rubric", type=Path, default=None, metavar="rubric.json",
+                        help="cell points and partial credit (see RUBRIC); rescore later with Rescore.py")
+    args = parser.parse_args()
+
+    for d in ["Solutions", "Roster", "Submissions", "Results"]:
+        (BASE / d).mkdir(parents=True, exist_ok=True)
+
+    inputs = run_gui()
+    if inputs:
+        process_submissions(**inputs, profiler=Profiler.from_args(args, "grader"), score_bins=args.score_bins,
+                            timeout=args.timeout, max_mb=args.max_mb, max_cells=args.max_cells,
+                            metrics=Metrics.from_args(args),
+                            rubric=load_rubric(args.rubric) if args.rubric else None)
+        messagebox.showinfo("Success!", "The submissions have been graded.")
+
+        # Define paths of the outputs (must match what's created in process_submissions)
+        RESULTS_ZIP = BASE / "Results.zip"
+        SUMMARY_FILE = BASE / "results_summary.xlsx"  # matches the actual saved name
+        SCORES_FILE = BASE / "Scores.csv"
+        OUTCOMES_FILE = BASE / OUTCOMES_NAME
+
+        # Get user-provided output folder from GUI
+        out_dir = Path(inputs["output_folder"])
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        # --- Move output files to user folder ---
+        if inputs.get("feedback", True):
+            move_outputs_to_folder(out_dir, RESULTS_ZIP, SUMMARY_FILE, SCORES_FILE, OUTCOMES_FILE)
+        else:
+            move_outputs_to_folder(out_dir, SUMMARY_FILE, SCORES_FILE, OUTCOMES_FILE)
 
-    # --- Clean up base directory AFTER moving ---
-    try:
-        cleanup_base_directory(BASE)
-        print("Cleanup complete. All temporary files and folders removed.")
-    except Exception as e:
-        print(f"Cleanup failed: {e}")
+        # --- Clean up base directory AFTER moving ---
+        try:
+            cleanup_base_directory(BASE)
+            print("Cleanup complete. All temporary files and folders removed.")
+        except Exception as e:
+            print(f"Cleanup failed: {e}")
 
-    messagebox.showinfo("Done", f"All results moved to:\n{out_dir}")
+        messagebox.showinfo("Done", f"All results moved to:\n{out_dir}")
 
-else:
-    messagebox.showinfo("Canceled", "User cancelled the program. Exiting now.")
+    else:
+        messagebox.showinfo("Canceled", "User cancelled the program. Exiting now.")
 
-# After moving the zip
-# subprocess.Popen(f'explorer "{final_zip}"')
+    # After moving the zip
+    # subprocess.Popen(f'explorer "{final_zip}"')
 
 
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # grading workers in a frozen (PyInstaller) build
+    main()
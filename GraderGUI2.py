@@ -28,7 +28,7 @@ from tkinter import filedialog, messagebox
 from tkinter import ttk
 from pathlib import Path
 from PIL import Image, ImageTk, ImageOps
-from openpyxl import load_workbook, Workbook
+import KeyProbe
 import sys
 
 
@@ -49,7 +49,10 @@ def run_gui():
       "roster_file": "<path>",
       "zip_file": "<path>",
       "sheet_name": "<sheet name>",
-      "instructor": "<instructor>"
+      "instructor": "<instructor>",
+      "manifest_file": "<path or None>",
+      "perturbations": <0 = off>,
+      "feedback": <False = scores only>
     }
     """
 
@@ -59,17 +62,32 @@ def run_gui():
     def set_key(event_or_path):
         p = _get_path_from_event(event_or_path)
         key_var.set(str(p))
-        try:
-            wb = load_workbook(p, read_only=True)
-            sheets = wb.sheetnames
-            sheet_combo['values'] = sheets
-            if sheets:
-                sheet_combo.current(0)
-                sheet_var.set(sheets[0])
-            wb.close()  # <-- ADD THIS LINE
-        except Exception as e:
+        graded_var.set("Reading key...")
+        probe_key(p)
+
+    def probe_key(p, sheet=None):
+        # Reads workbook.xml off the Tk thread; ignore results for a key that was replaced
+        def done(info):
+            if key_var.get() != str(p):
+                return
+            if sheet is None:
+                sheets = info["sheets"]
+                sheet_combo['values'] = sheets
+                if sheets:
+                    sheet_combo.current(0)
+                    sheet_var.set(sheets[0])
+            graded_var.set(f"Graded cells on '{info['sheet']}': {info['graded']}")
+
+        def failed(e):
+            graded_var.set("")
             messagebox.showerror("Error", f"Cannot read sheets: {e}")
 
+        KeyProbe.run_in_background(root, lambda: KeyProbe.probe(p, sheet, with_count=True), done, failed)
+
+    def on_sheet_selected(event=None):
+        if key_var.get() and sheet_var.get():
+            probe_key(Path(key_var.get()), sheet_var.get())
+
     def set_roster(event_or_path):
         p = _get_path_from_event(event_or_path)
         roster_var.set(str(p))
@@ -78,6 +96,10 @@ def run_gui():
         p = _get_path_from_event(event_or_path)
         zip_var.set(str(p))
 
+    def set_manifest(event_or_path):
+        p = _get_path_from_event(event_or_path)
+        manifest_var.set(str(p))
+
     def set_out(event_or_path):
         p = _get_path_from_event(event_or_path)
         out_var.set(str(p))
@@ -97,6 +119,11 @@ def run_gui():
         if f:
             zip_var.set(f)
 
+    def browse_manifest():
+        f = filedialog.askopenfilename(title="Select variants.json", filetypes=[("Variant manifest", "*.json")])
+        if f:
+            manifest_var.set(f)
+
     def browse_out():
         out = filedialog.askdirectory(title="Select Output Folder")
         if out:
@@ -116,6 +143,7 @@ def run_gui():
         s = sheet_var.get().strip()
         inst = instr_var.get().strip()
         out = out_var.get().strip()
+        manifest = manifest_var.get().strip()
 
         if not (k and r and z and s and inst):
             messagebox.showerror("Missing input", "Please provide Key, Roster, ZIP, Sheet name and Instructor.")
@@ -127,11 +155,35 @@ def run_gui():
         result["sheet_name"] = s
         result["instructor"] = inst
         result["output_folder"] = out
+        result["manifest_file"] = manifest or None
+        result["perturbations"] = 3 if recalc_var.get() else 0
+        result["feedback"] = not scores_only_var.get()
         root.quit()
 
     def on_cancel():
         root.quit()
 
+    def on_quick_look():
+        k = key_var.get().strip()
+        z = zip_var.get().strip()
+        s = sheet_var.get().strip()
+        if not (k and z and s):
+            messagebox.showerror("Missing input", "Please provide Key, ZIP and Sheet name.")
+            return
+        import Preview  # imports Grader, which imports this module
+
+        def done(report):
+            root.config(cursor="")
+            messagebox.showinfo("Quick look", Preview.format_report(report))
+
+        def failed(e):
+            root.config(cursor="")
+            messagebox.showerror("Error", f"Quick look failed: {e}")
+
+        root.config(cursor="watch")
+        manifest = manifest_var.get().strip() or None
+        KeyProbe.run_in_background(root, lambda: Preview.preview(k, z, s, manifest_file=manifest), done, failed)
+
     # --- Handle icon paths ---
     if getattr(sys, 'frozen', False):
         base_path = Path(sys._MEIPASS)
@@ -149,7 +201,7 @@ def run_gui():
 
     root.iconbitmap(default=str(icon_path))
     root.title("Automated Spreadsheet Grading")
-    root.geometry("750x600")
+    root.geometry("750x705")
     root.configure(bg="#f0f0f0")
 
     # --- Banner ---
@@ -175,6 +227,10 @@ def run_gui():
     sheet_var = tk.StringVar()
     instr_var = tk.StringVar()
     out_var = tk.StringVar()
+    manifest_var = tk.StringVar()
+    graded_var = tk.StringVar()
+    recalc_var = tk.BooleanVar(value=False)
+    scores_only_var = tk.BooleanVar(value=False)
 
     pad_x = 8
     pad_y = 6
@@ -187,10 +243,19 @@ def run_gui():
         .grid(row=0, column=0, sticky="w", pady=pad_y)
     sheet_combo = ttk.Combobox(frame_meta, textvariable=sheet_var, state="readonly", width=20)
     sheet_combo.grid(row=0, column=1, sticky="w", padx=(0, 15))
+    sheet_combo.bind("<<ComboboxSelected>>", on_sheet_selected)
 
     tk.Label(frame_meta, text="Instructor:", width=12, anchor="w", font=("Helvetica", 10, "bold")) \
         .grid(row=0, column=2, sticky="w", pady=pad_y)
     tk.Entry(frame_meta, textvariable=instr_var, bg="#C1E1C1", width=20).grid(row=0, column=3, sticky="w")
+    tk.Label(frame_meta, textvariable=graded_var, anchor="w", font=("Helvetica", 9)) \
+        .grid(row=1, column=1, columnspan=3, sticky="w")
+    tk.Checkbutton(frame_meta, text="Verify answers by recalculating with perturbed inputs",
+                   variable=recalc_var, font=("Helvetica", 10)) \
+        .grid(row=2, column=0, columnspan=4, sticky="w")
+    tk.Checkbutton(frame_meta, text="Scores only (make feedback files later with Feedback.py)",
+                   variable=scores_only_var, font=("Helvetica", 10)) \
+        .grid(row=3, column=0, columnspan=4, sticky="w")
 
     # --- File selectors ---
     def add_file_field(label_text, var, set_func, browse_func):
@@ -211,12 +276,16 @@ def run_gui():
     add_file_field("Roster file (.xlsx or .csv) - drag & drop (or browse)", roster_var, set_roster, browse_roster)
     add_file_field("Submissions ZIP (do NOT extract) - drag & drop (or browse)", zip_var, set_zip, browse_zip)
     add_file_field("Output Folder - drag & drop (or browse)", out_var, set_out, browse_out)
+    add_file_field("Variant manifest (variants.json, optional) - drag & drop (or browse)",
+                   manifest_var, set_manifest, browse_manifest)
 
     # --- Buttons ---
     btn_frame = tk.Frame(root)
     btn_frame.pack(fill="x", padx=pad_x, pady=(25, 10))
     tk.Button(btn_frame, text="Run Grader", bg="#23904C", fg="#f0f0f0", width=18,
               command=on_run, font=("Helvetica", 10, "bold")).pack(side="left", padx=(0, 10))
+    tk.Button(btn_frame, text="Quick Look", bg="#23904C", fg="#f0f0f0", width=12,
+              command=on_quick_look, font=("Helvetica", 10, "bold")).pack(side="left", padx=(0, 10))
     tk.Button(btn_frame, text="Cancel", bg="#23904C", fg="#f0f0f0", width=10,
               command=on_cancel, font=("Helvetica", 10, "bold")).pack(side="left")
 
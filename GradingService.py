@@ -0,0 +1,276 @@
+# --------------------------------------------------------------
+#  LOCAL GRADING SERVICE
+#  Keeps parsed keys warm in memory and grades one submission per
+#  request, so students can check their work before the deadline.
+#  Binds to localhost by default; put it behind the campus reverse
+#  proxy with --host if it should be reachable from outside.
+#
+#  Usage:
+#    python GradingService.py --keys-dir Solutions [--port 8765] [--workers 4]
+#                             [--preload Key.xlsx:Sheet1 ...] [--timeout 30]
+#                             [--max-unpacked-mb 200] [--max-cells 2000000] [--list-keys]
+#
+#  Endpoints:
+#    GET  /health
+#    GET  /keys                             key files in --keys-dir (with --list-keys)
+#    GET  /metrics, /metrics.json           live counters (see Metrics.py)
+#    POST /grade?key=Key.xlsx[&sheet=Sheet1][&feedback=1]
+#         body: the submission .xlsx
+#         -> JSON score and wrong-cell lists, or with feedback=1 the
+#            highlighted workbook (score in the X-Score header); the
+#            key's answers are never included, since this runs before
+#            the deadline
+#
+#  Each worker is a Guards.TimeLimited process: an upload that runs
+#  past --timeout has its worker killed and replaced, so bad files
+#  cannot tie up the service. Uploads are screened for zip bombs and
+#  huge sheets before they are loaded.
+# --------------------------------------------------------------
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from openpyxl import load_workbook
+import Grader
+import Guards
+import KeyProbe
+import Metrics
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# ----------------------------------------------------------------------
+# WORKER SIDE (runs in the pool processes)
+# ----------------------------------------------------------------------
+_KEYS_DIR = None
+_KEYS = {}  # (file name, sheet) -> (mtime, key from Grader.load_key)
+
+
+def key_path(keys_dir, name):
+    """Resolve a key name inside keys_dir; names cannot point elsewhere."""
+    path = Path(keys_dir) / Path(name).name
+    if path.suffix.lower() != ".xlsx" or not path.is_file():
+        raise FileNotFoundError(f"Unknown key: {name}")
+    return path
+
+
+def warm_key(name, sheet=None):
+    """Parsed key from the cache, reloaded only if the file changed."""
+    path = key_path(_KEYS_DIR, name)
+    if not sheet:
+        sheet = KeyProbe.sheet_names(path)[0]
+    mtime = KeyProbe.key_mtime(path)
+    cached = _KEYS.get((path.name, sheet))
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, Grader.load_key(path, sheet))
+        _KEYS[(path.name, sheet)] = cached
+    return cached[1]
+
+
+def _init_worker(keys_dir, preload):
+    global _KEYS_DIR
+    _KEYS_DIR = keys_dir
+    for name, sheet in preload:
+        warm_key(name, sheet)
+
+
+def grade_bytes(name, sheet, data, feedback=False, instructor="Instructor",
+                max_mb=Guards.MAX_UNCOMPRESSED_MB, max_cells=Guards.MAX_CELLS):
+    """Grade one submission held in memory. Returns (summary dict, feedback bytes or None)."""
+    start = time.perf_counter()
+    key = warm_key(name, sheet)
+    Guards.screen(BytesIO(data), key["sheet"], max_mb, max_cells)
+    wb = load_workbook(BytesIO(data))
+    try:
+        if key["sheet"] not in wb.sheetnames:
+            raise KeyError(f"Sheet '{key['sheet']}' not found in submission")
+        result = Grader.grade_workbook(wb, BytesIO(data), key)
+
+        workbook = None
+        if feedback:
+            buf = BytesIO()
+            Grader.write_feedback(wb, result, key, instructor, buf, answers=False)
+            workbook = buf.getvalue()
+    finally:
+        wb.close()
+
+    summary = {
+        "key": Path(name).name,
+        "sheet": key["sheet"],
+        "score": result["score"],
+        "out_of": result["out_of"],
+        "incorrect_cells": Grader.cell_list(result["wrong"]).split(",") if result["wrong"] else [],
+        "incorrect_formulas": Grader.cell_list(result["wrong_form"]).split(",") if result["wrong_form"] else [],
+        "empty_cells": Grader.cell_list(result["blank"]).split(",") if result["blank"] else [],
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    return summary, workbook
+
+
+# ----------------------------------------------------------------------
+# HTTP SIDE
+# ----------------------------------------------------------------------
+class GradingHandler(BaseHTTPRequestHandler):
+    server_version = "AutograderService/1.0"
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send(200, {"status": "ok"})
+        elif path == "/keys" and self.server.list_keys:
+            keys = sorted(p.name for p in Path(self.server.keys_dir).glob("*.xlsx") if not p.name.startswith("~$"))
+            self._send(200, {"keys": keys})
+        elif path == "/metrics":
+            self._send(200, self.server.metrics.prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        elif path == "/metrics.json":
+            self._send(200, self.server.metrics.snapshot())
+        else:
+            self._send(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/grade":
+            self._send(404, {"error": "Not found"})
+            return
+        query = parse_qs(url.query)
+        name = query.get("key", [None])[0]
+        sheet = query.get("sheet", [None])[0]
+        feedback = query.get("feedback", ["0"])[0] in ("1", "true", "yes")
+        if not name:
+            self._send(400, {"error": "Missing 'key' parameter"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        if length <= 0:
+            self._send(400, {"error": "Empty upload; send the .xlsx as the request body"})
+            return
+        if length > self.server.max_bytes:
+            self._send(413, {"error": f"Upload larger than {self.server.max_bytes} bytes"})
+            return
+        data = self.rfile.read(length)
+
+        metrics = self.server.metrics
+        self.server.in_flight(1)
+        runner = self.server.runners.get()  # waits for a free worker
+        try:
+            with metrics.timed("request", busy=False):
+                summary, workbook = runner.run(grade_bytes, name, sheet, data, feedback, self.server.instructor,
+                                               self.server.max_mb, self.server.max_cells)
+        except FileNotFoundError as e:
+            metrics.count("errors")
+            self._send(404, {"error": str(e)})
+            return
+        except Guards.TimedOut:
+            # The worker was killed; the runner starts a fresh one for the next request
+            metrics.count("timeouts")
+            self._send(504, {"error": "Grading timed out"})
+            return
+        except Guards.Rejected as e:
+            metrics.count("rejected")
+            self._send(422, {"error": f"Submission rejected: {e}"})
+            return
+        except Exception as e:
+            metrics.count("errors")
+            self._send(400, {"error": f"Could not grade submission: {e}"})
+            return
+        finally:
+            self.server.runners.put(runner)
+            self.server.in_flight(-1)
+        metrics.observe("grade", summary["elapsed_ms"] / 1000)
+        metrics.done()
+
+        if feedback:
+            self._send(200, workbook, XLSX_TYPE, {
+                "X-Score": str(summary["score"]),
+                "Content-Disposition": 'attachment; filename="feedback.xlsx"',
+            })
+        else:
+            self._send(200, summary)
+
+    def log_message(self, fmt, *args):
+        print(f"{self.address_string()} - {fmt % args}")
+
+
+def serve(keys_dir, host="127.0.0.1", port=8765, workers=None, preload=(), max_mb=20,
+          timeout=30, instructor="Instructor", max_unpacked_mb=Guards.MAX_UNCOMPRESSED_MB,
+          max_cells=Guards.MAX_CELLS, list_keys=False):
+    # One killable worker process per slot, started now so --preload keys are warm
+    workers = workers or os.cpu_count() or 1
+    runners = queue.Queue()
+    for _ in range(workers):
+        runner = Guards.TimeLimited(timeout, _init_worker, (str(keys_dir), list(preload)))
+        runner.start()
+        runners.put(runner)
+    server = ThreadingHTTPServer((host, port), GradingHandler)
+    server.keys_dir = str(keys_dir)
+    server.runners = runners
+    server.max_bytes = max_mb * 1024 * 1024
+    server.max_mb = max_unpacked_mb
+    server.max_cells = max_cells
+    server.instructor = instructor
+    server.list_keys = list_keys
+
+    # Requests waiting for a worker are the queue
+    server.metrics = Metrics.Metrics(workers=workers)
+    lock = threading.Lock()
+    waiting = [0]
+
+    def in_flight(n):
+        with lock:
+            waiting[0] += n
+            server.metrics.gauge("requests_in_flight", waiting[0])
+            server.metrics.gauge("queue_depth", max(waiting[0] - workers, 0))
+
+    server.in_flight = in_flight
+    print(f"Grading service on http://{host}:{port} (keys: {keys_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        while not runners.empty():
+            runners.get().close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local grading service with warm key cache.")
+    parser.add_argument("--keys-dir", type=Path, required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--preload", nargs="*", default=[], metavar="KEY.xlsx:SHEET",
+                        help="keys to parse in every worker at startup")
+    parser.add_argument("--max-mb", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30, help="seconds per submission before its worker is killed")
+    parser.add_argument("--instructor", default="Instructor")
+    parser.add_argument("--max-unpacked-mb", type=float, default=Guards.MAX_UNCOMPRESSED_MB,
+                        help="reject uploads larger than this uncompressed")
+    parser.add_argument("--max-cells", type=int, default=Guards.MAX_CELLS,
+                        help="reject uploads with more rows and cells than this on the graded sheet")
+    parser.add_argument("--list-keys", action="store_true", help="let GET /keys list the key files")
+    args = parser.parse_args()
+
+    preload = [tuple(p.split(":", 1)) if ":" in p else (p, None) for p in args.preload]
+    serve(args.keys_dir, args.host, args.port, args.workers, preload, args.max_mb, args.timeout,
+          args.instructor, args.max_unpacked_mb, args.max_cells, args.list_keys)
+
+
+if __name__ == "__main__":
+    main()
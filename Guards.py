@@ -0,0 +1,95 @@
+# --------------------------------------------------------------
+#  SUBMISSION GUARDS
+#  Limits that keep one bad file from stalling a class run:
+#    - uncompressed size of the .xlsx (zip bombs)
+#    - rows + cells on the graded sheet (a million formatted rows)
+#    - wall-clock time to grade one submission (files openpyxl
+#      chokes on): grading runs in a worker process that is killed
+#      and replaced when it runs over
+#  The size and cell checks stream the zip directory and sheet XML,
+#  so they are cheap and run before anything loads the workbook.
+# --------------------------------------------------------------
+import multiprocessing
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+import KeyProbe
+
+MAX_UNCOMPRESSED_MB = 200
+MAX_CELLS = 2_000_000
+TIMEOUT = 120  # seconds per submission
+
+
+class Rejected(Exception):
+    """A submission broke a limit; the message says which."""
+
+
+def screen(path, sheet_name, max_mb=MAX_UNCOMPRESSED_MB, max_cells=MAX_CELLS):
+    """Raise Rejected if the file is too big unpacked or its graded sheet has too many rows and cells."""
+    try:
+        with zipfile.ZipFile(path) as z:
+            total = sum(info.file_size for info in z.infolist())
+            if max_mb and total > max_mb * 1024 * 1024:
+                raise Rejected(f"{total / 1024 / 1024:.0f} MB uncompressed (limit {max_mb} MB)")
+
+            sheet_path = dict(KeyProbe._sheets(z)).get(sheet_name)
+            if not max_cells or sheet_path is None:
+                return  # a missing sheet is reported by the grader
+            count = 0
+            with z.open(sheet_path) as f:
+                for _, el in ET.iterparse(f):
+                    if el.tag in (f"{KeyProbe.NS_MAIN}c", f"{KeyProbe.NS_MAIN}row"):
+                        count += 1
+                        if count > max_cells:
+                            raise Rejected(f"more than {max_cells:,} rows and cells on '{sheet_name}'")
+                        el.clear()
+    except (zipfile.BadZipFile, KeyError, ET.ParseError, zlib.error, EOFError, OSError) as e:
+        raise Rejected(f"not a readable .xlsx ({e})")
+
+
+class TimedOut(Rejected):
+    """A submission ran past the time limit."""
+
+
+def _ready():
+    return True
+
+
+class TimeLimited:
+    """
+    Run calls in a single worker process with a time limit. A call that
+    runs over is abandoned by terminating the worker; the next call starts
+    a fresh one (running initializer again). The limit starts once the
+    initializer has finished, so a slow key load is not charged to a file.
+    """
+
+    def __init__(self, timeout=TIMEOUT, initializer=None, initargs=()):
+        self.timeout = timeout
+        self.initializer = initializer
+        self.initargs = initargs
+        self.pool = None
+        self.warm = None
+
+    def start(self):
+        """Start the worker now (it runs initializer in the background) rather than on the first call."""
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(1, self.initializer, self.initargs)
+            self.warm = self.pool.apply_async(_ready)  # done once initializer has run
+
+    def run(self, fn, *args):
+        self.start()
+        self.warm.wait()
+        pending = self.pool.apply_async(fn, args)
+        try:
+            return pending.get(self.timeout)
+        except multiprocessing.TimeoutError:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            raise TimedOut(f"grading took longer than {self.timeout:g}s")
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
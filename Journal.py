@@ -0,0 +1,128 @@
+# --------------------------------------------------------------
+#  RUN JOURNAL
+#  Append-only record of a grading run, one JSON line per finished
+#  submission: its hash, score, wrong/blank cells, the feedback file
+#  written and its similarity fingerprint. If the run stops (a crash, the laptop sleeping),
+#  the next run over the same key and zip reads the journal and
+#  skips everything already graded.
+#
+#  The first line identifies the run. A journal from a different
+#  key, zip, sheet or options is discarded and grading starts over.
+# --------------------------------------------------------------
+from pathlib import Path
+import hashlib
+import json
+import os
+
+JOURNAL_NAME = "grading_journal.jsonl"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cells(cells):
+    return [list(c) for c in cells]
+
+
+class Journal:
+    def __init__(self, path, run):
+        """run is a JSON-able dict identifying this run (input hashes and options)."""
+        self.path = Path(path)
+        self.run = run
+        self.entries = {}
+
+        lines = []
+        if self.path.exists():
+            for line in self.path.read_text(encoding="utf-8").splitlines():
+                try:
+                    lines.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Last line cut short by the crash; everything before it is good
+                    break
+
+        if lines and lines[0].get("run") == run:
+            self.entries = {e["file"]: e for e in lines[1:]}
+            print(f"Resuming run: {len(self.entries)} submissions already graded ({self.path.name})")
+        elif lines:
+            print(f"Journal {self.path.name} is from a different run. Starting over.")
+            lines = []
+
+        # Rewrite without any torn line, so appends start on a clean line
+        self._f = open(self.path, "w", encoding="utf-8")
+        for line in lines or [{"run": run}]:
+            self._write(line)
+
+    @property
+    def resuming(self):
+        return bool(self.entries)
+
+    def _write(self, obj):
+        self._f.write(json.dumps(obj) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def finished(self, rel, sub_path, res_path):
+        """
+        The journal entry for rel if it was graded from a file with the
+        same content and its feedback file is still as written, else None.
+        """
+        entry = self.entries.get(Path(rel).as_posix())
+        if entry is None or entry["sha256"] != file_hash(sub_path):
+            return None
+        if entry["result"] is None:
+            return entry  # scores-only run: no feedback file to check
+        res_path = Path(res_path)
+        if not res_path.exists() or file_hash(res_path) != entry["result_sha256"]:
+            return None
+        return entry
+
+    def record(self, rel, sub_path, result, res_path, fingerprint=None):
+        entry = {
+            "file": Path(rel).as_posix(),
+            "sha256": file_hash(sub_path),
+            "score": result["score"],
+            "out_of": result["out_of"],
+            "blank": _cells(result["blank"]),
+            "wrong_form": _cells(result["wrong_form"]),
+            "wrong": _cells(result["wrong"]),
+            "hardcoded": _cells(result.get("hardcoded", [])),
+            "result": Path(res_path).as_posix() if res_path else None,
+            "result_sha256": file_hash(res_path) if res_path else None,
+            "fingerprint": fingerprint,
+        }
+        self._write(entry)
+        self.entries[entry["file"]] = entry
+        return entry
+
+    def record_flag(self, rel, sub_path, flag):
+        """Record a submission that was not graded (see Guards), so a resumed run doesn't retry it."""
+        entry = {
+            "file": Path(rel).as_posix(),
+            "sha256": file_hash(sub_path),
+            "score": 0,
+            "flag": flag,
+            "result": None,
+        }
+        self._write(entry)
+        self.entries[entry["file"]] = entry
+        return entry
+
+    def close(self):
+        self._f.close()
+
+
+def result_from(entry):
+    """Rebuild grade_workbook's result dict from a journal entry."""
+    return {
+        "blank": [tuple(c) for c in entry["blank"]],
+        "wrong_form": [tuple(c) for c in entry["wrong_form"]],
+        "wrong": [tuple(c) for c in entry["wrong"]],
+        "hardcoded": [tuple(c) for c in entry.get("hardcoded", [])],
+        "score": entry["score"],
+        "out_of": entry["out_of"],
+    }
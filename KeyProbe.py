@@ -0,0 +1,369 @@
+# --------------------------------------------------------------
+#  KEY FILE PROBE
+#  Reads sheet names (and optionally a graded-cell count) straight
+#  from the .xlsx zip without loading the workbook in openpyxl, and
+#  runs the probe off the Tk thread so the GUIs stay responsive.
+#  The grader uses the same zip reading for graded cells' saved values.
+#
+#  GRADED CELLS
+#  A key can list its graded cells explicitly, in a hidden sheet
+#  named GradedCells or a sidecar file next to it (Key.graded.json):
+#
+#    Range    Points  Accept                 Sheet (optional)
+#    C3:C10   2       =B3*2                  Sheet1
+#    D5       1       tol: 0.01
+#
+#    {"cells": [{"range": "C3:C10", "points": 2, "accept": ["=B3*2"], "sheet": "Sheet1"},
+#               {"range": "D5", "accept": ["tol: 0.01"]}]}
+#
+#  Accept uses the same lines as a key cell comment (alternates and
+#  tol/rtol/regex/case settings). A sidecar overrides the sheet.
+#  Without a spec, graded cells are the ones filled with the target
+#  colour: the fill is resolved (rgb, theme + tint or palette index)
+#  to style ids once, then cells are picked by their style index.
+# --------------------------------------------------------------
+from openpyxl.styles.colors import COLOR_INDEX
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
+from pathlib import Path, PurePosixPath
+import colorsys
+import json
+import queue
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+NS_DRAWING = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+
+SPEC_SHEET = "GradedCells"
+SPEC_SUFFIX = ".graded.json"
+COLOR_TOLERANCE = 3  # per channel, for colours computed from theme tints
+
+
+def _sheets(z):
+    """[(name, zip path of the sheet xml)] in workbook order."""
+    wb_xml = ET.fromstring(z.read("xl/workbook.xml"))
+    rels_xml = ET.fromstring(z.read("xl/_rels/workbook.xml.rels"))
+    targets = {}
+    for rel in rels_xml.iter(f"{NS_PKG}Relationship"):
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            target = target.lstrip("/")
+        else:
+            target = str(PurePosixPath("xl") / target)
+        targets[rel.get("Id")] = target
+
+    return [(s.get("name"), targets.get(s.get(f"{NS_REL}id")))
+            for s in wb_xml.iter(f"{NS_MAIN}sheet")]
+
+
+def sheet_names(path):
+    """Sheet names from xl/workbook.xml, in workbook order."""
+    with zipfile.ZipFile(path) as z:
+        return [name for name, _ in _sheets(z)]
+
+
+def _theme_colors(z):
+    """RGB hex of each theme colour index (lt1, dk1, lt2, dk2, accent1-6, hlink, folHlink)."""
+    try:
+        theme = ET.fromstring(z.read("xl/theme/theme1.xml"))
+    except KeyError:
+        return []
+    scheme = theme.find(f"{NS_DRAWING}themeElements/{NS_DRAWING}clrScheme")
+    if scheme is None:
+        return []
+    colors = []
+    for el in scheme:
+        c = el.find(f"{NS_DRAWING}srgbClr")
+        if c is not None:
+            colors.append(c.get("val"))
+        else:
+            c = el.find(f"{NS_DRAWING}sysClr")
+            colors.append(c.get("lastClr") if c is not None else None)
+    # The scheme lists dk1, lt1, dk2, lt2; theme indices start with lt1, dk1, lt2, dk2
+    colors[0:2], colors[2:4] = colors[1::-1], colors[3:1:-1]
+    return colors
+
+
+def _tinted(rgb, tint):
+    """Apply an Excel tint (-1..1) to an RRGGBB colour, as Excel does in HLS space."""
+    r, g, b = (int(rgb[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    h, l, s = colorsys.rgb_to_hls(r, g, b)
+    l = l * (1 + tint) if tint < 0 else l * (1 - tint) + tint
+    return "".join(f"{round(x * 255):02X}" for x in colorsys.hls_to_rgb(h, l, s))
+
+
+def _color_rgb(el, theme, palette):
+    """RRGGBB of a colour element (rgb, theme + tint or indexed), or None."""
+    if el is None:
+        return None
+    rgb = None
+    if el.get("rgb"):
+        rgb = el.get("rgb")[-6:]
+    elif el.get("theme") is not None:
+        i = int(el.get("theme"))
+        rgb = theme[i] if i < len(theme) else None
+    elif el.get("indexed") is not None:
+        i = int(el.get("indexed"))
+        rgb = palette[i][-6:] if i < len(palette) else None
+    if rgb and el.get("tint"):
+        rgb = _tinted(rgb, float(el.get("tint")))
+    return rgb.upper() if rgb else None
+
+
+def _close(a, b):
+    return all(abs(int(a[i:i + 2], 16) - int(b[i:i + 2], 16)) <= COLOR_TOLERANCE for i in (0, 2, 4))
+
+
+def target_style_ids(z, target_hex="FFD9E1F2"):
+    """Indices into cellXfs whose fill has the target foreground colour."""
+    styles = ET.fromstring(z.read("xl/styles.xml"))
+    theme = _theme_colors(z)
+    custom = styles.find(f"{NS_MAIN}colors/{NS_MAIN}indexedColors")
+    palette = [c.get("rgb") for c in custom] if custom is not None else list(COLOR_INDEX)
+    target = target_hex.upper()[-6:]
+
+    fills = styles.find(f"{NS_MAIN}fills")
+    target_fills = set()
+    for i, fill in enumerate(fills if fills is not None else []):
+        fg = fill.find(f"{NS_MAIN}patternFill/{NS_MAIN}fgColor")
+        rgb = _color_rgb(fg, theme, palette)
+        # Exact for stored rgb values; theme tints are rounded, so allow a little
+        if rgb is not None and (rgb == target or (fg.get("rgb") is None and _close(rgb, target))):
+            target_fills.add(i)
+
+    xfs = styles.find(f"{NS_MAIN}cellXfs")
+    return {i for i, xf in enumerate(xfs if xfs is not None else [])
+            if int(xf.get("fillId", 0)) in target_fills}
+
+
+def _styled_cells(z, sheet_path, style_ids):
+    """0-based (row, col) of the cells whose style index is in style_ids, in sheet order."""
+    cells = []
+    with z.open(sheet_path) as f:
+        for _, el in ET.iterparse(f):
+            if el.tag == f"{NS_MAIN}c":
+                if int(el.get("s", 0)) in style_ids:
+                    r, c = coordinate_to_tuple(el.get("r"))
+                    cells.append((r - 1, c - 1))
+                el.clear()
+    return cells
+
+
+def _sheet_values(z, sheet_path):
+    """{(row, col) 1-based: value} for a small sheet (the spec), strings resolved."""
+    shared = None
+    values = {}
+    with z.open(sheet_path) as f:
+        for _, el in ET.iterparse(f):
+            if el.tag != f"{NS_MAIN}c":
+                continue
+            t = el.get("t", "n")
+            if t == "inlineStr":
+                value = "".join(x.text or "" for x in el.iter(f"{NS_MAIN}t"))
+            else:
+                v = el.find(f"{NS_MAIN}v")
+                value = v.text if v is not None else None
+                if value is not None and t == "s":
+                    if shared is None:
+                        shared = _shared_strings(z)
+                    value = shared[int(value)]
+            if value not in (None, ""):
+                values[coordinate_to_tuple(el.get("r"))] = value
+            el.clear()
+    return values
+
+
+def sidecar_path(path):
+    path = Path(path)
+    return path.with_name(path.stem + SPEC_SUFFIX)
+
+
+def key_mtime(path):
+    """Latest change to the key or its sidecar spec, for reloading a cached key."""
+    sidecar = sidecar_path(path)
+    mtime = Path(path).stat().st_mtime
+    return max(mtime, sidecar.stat().st_mtime) if sidecar.exists() else mtime
+
+
+def _spec_from_sheet(z, sheet_path):
+    values = _sheet_values(z, sheet_path)
+    headers = {str(v).strip().lower(): c for (r, c), v in values.items() if r == 1}
+    if "range" not in headers:
+        return []
+    last_row = max(r for r, _ in values)
+    entries = []
+    for r in range(2, last_row + 1):
+        entry = {k: values.get((r, c)) for k, c in headers.items() if k in ("range", "points", "accept", "sheet")}
+        if entry.get("range"):
+            entries.append(entry)
+    return entries
+
+
+def read_spec(path, z=None):
+    """
+    The key's graded-cell spec entries ({range, points, accept, sheet}),
+    from the sidecar file or the GradedCells sheet; None if it has neither.
+    """
+    sidecar = sidecar_path(path)
+    if sidecar.exists():
+        return json.loads(sidecar.read_text(encoding="utf-8")).get("cells", [])
+    if z is None:
+        with zipfile.ZipFile(path) as z:
+            return read_spec(path, z)
+    sheet_path = dict(_sheets(z)).get(SPEC_SHEET)
+    return _spec_from_sheet(z, sheet_path) if sheet_path else None
+
+
+def _apply_spec(entries, sheet_name):
+    graded, points, accept = [], {}, {}
+    for entry in entries:
+        if entry.get("sheet") and entry["sheet"] != sheet_name:
+            continue
+        text = entry.get("accept")
+        if isinstance(text, list):
+            text = "\n".join(str(x) for x in text)
+        p = entry.get("points")
+        p = 1.0 if p is None else float(p)  # 0 points: shown but not scored
+        if p < 0:
+            raise ValueError(f"Negative points for {entry['range']} in the graded-cell spec: {entry['points']}")
+        min_col, min_row, max_col, max_row = range_boundaries(str(entry["range"]).replace("$", "").strip())
+        for r in range(min_row - 1, max_row):
+            for c in range(min_col - 1, max_col):
+                if (r, c) not in points:
+                    graded.append((r, c))
+                points[(r, c)] = p
+                if text:
+                    accept[(r, c)] = str(text)
+    graded.sort()
+    return graded, points, accept
+
+
+def graded_cells(path, sheet_name, target_hex="FFD9E1F2"):
+    """
+    The graded cells of sheet_name: from the key's spec if it has one for
+    that sheet, else by fill colour. Returns a dict with graded (0-based
+    (row, col), row by row), points and accept (keyed by cell) and source.
+    """
+    with zipfile.ZipFile(path) as z:
+        sheets = dict(_sheets(z))
+        sheet_path = sheets.get(sheet_name)
+        if sheet_path is None:
+            raise KeyError(f"Sheet '{sheet_name}' not found in {path}")
+
+        entries = read_spec(path, z)
+        if entries:
+            graded, points, accept = _apply_spec(entries, sheet_name)
+            if graded:
+                source = "sidecar" if sidecar_path(path).exists() else SPEC_SHEET
+                return {"graded": graded, "points": points, "accept": accept, "source": source}
+
+        style_ids = target_style_ids(z, target_hex)
+        graded = _styled_cells(z, sheet_path, style_ids) if style_ids else []
+        return {"graded": graded, "points": {}, "accept": {}, "source": "fill"}
+
+
+def graded_cell_count(path, sheet_name, target_hex="FFD9E1F2"):
+    """Count the graded cells on sheet_name (spec or fill)."""
+    return len(graded_cells(path, sheet_name, target_hex)["graded"])
+
+
+def probe(path, sheet_name=None, with_count=False, target_hex="FFD9E1F2"):
+    """
+    Return {"sheets": [...], "sheet": <probed sheet>, "graded": <count or None>}.
+    The count is for sheet_name, or the first sheet when not given.
+    """
+    names = [n for n in sheet_names(path) if n != SPEC_SHEET]
+    sheet = sheet_name if sheet_name in names else (names[0] if names else None)
+    graded = graded_cell_count(path, sheet, target_hex) if with_count and sheet else None
+    return {"sheets": names, "sheet": sheet, "graded": graded}
+
+
+def run_in_background(root, fn, on_done, on_error, poll_ms=50):
+    """
+    Run fn() on a worker thread and hand its result to on_done (or the
+    exception to on_error) back on the Tk thread. Tk is not thread-safe,
+    so the worker only fills a queue and the Tk loop polls it.
+    """
+    results = queue.Queue(maxsize=1)
+
+    def worker():
+        try:
+            results.put((True, fn()))
+        except Exception as e:
+            results.put((False, e))
+
+    def poll():
+        try:
+            ok, value = results.get_nowait()
+        except queue.Empty:
+            root.after(poll_ms, poll)
+            return
+        (on_done if ok else on_error)(value)
+
+    threading.Thread(target=worker, daemon=True).start()
+    root.after(poll_ms, poll)
+
+
+def _shared_strings(z):
+    try:
+        f = z.open("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+    strings = []
+    with f:
+        for _, el in ET.iterparse(f):
+            if el.tag == f"{NS_MAIN}si":
+                strings.append("".join(t.text or "" for t in el.iter(f"{NS_MAIN}t")))
+                el.clear()
+    return strings
+
+
+def cached_values(path, sheet_name, coords):
+    """
+    Values Excel saved for just the given cells, read by streaming the
+    sheet XML instead of loading the workbook. coords are 1-based
+    (row, col); cells without a saved value map to None.
+    """
+    wanted = set(coords)
+    last_row = max((r for r, _ in wanted), default=0)
+    raw = {}
+    with zipfile.ZipFile(path) as z:
+        sheet_path = dict(_sheets(z)).get(sheet_name)
+        if sheet_path is None:
+            raise KeyError(f"Sheet '{sheet_name}' not found in {path}")
+        with z.open(sheet_path) as f:
+            for _, el in ET.iterparse(f):
+                if el.tag == f"{NS_MAIN}c":
+                    rc = coordinate_to_tuple(el.get("r"))
+                    if rc in wanted:
+                        v = el.find(f"{NS_MAIN}v")
+                        if el.get("t") == "inlineStr":
+                            text = "".join(t.text or "" for t in el.iter(f"{NS_MAIN}t"))
+                        else:
+                            text = v.text if v is not None else None
+                        raw[rc] = (el.get("t", "n"), text)
+                    el.clear()
+                elif el.tag == f"{NS_MAIN}row":
+                    if int(el.get("r", 0)) >= last_row:
+                        break
+                    el.clear()
+
+        shared = _shared_strings(z) if any(t == "s" for t, _ in raw.values()) else []
+
+    values = {}
+    for rc in wanted:
+        t, text = raw.get(rc, ("n", None))
+        if text is None:
+            values[rc] = None
+        elif t == "n":
+            values[rc] = float(text)
+        elif t == "b":
+            values[rc] = text == "1"
+        elif t == "s":
+            values[rc] = shared[int(text)]
+        else:
+            values[rc] = text  # str, inlineStr, e (error code)
+    return values
@@ -0,0 +1,149 @@
+# --------------------------------------------------------------
+#  ANSWER MATCHERS
+#  Each graded cell is compiled once, from the key cell and its
+#  comment, into a matcher. Grading a student is then a handful of
+#  set lookups and one numeric comparison per cell.
+#
+#  Key cell comments (and the Accept column of a graded-cell spec,
+#  see KeyProbe) list accepted alternates, one formula per line
+#  or comma-separated values, plus optional settings:
+#      tol: 0.01        absolute numeric tolerance
+#      rtol: 1%         relative numeric tolerance (or rtol: 0.01)
+#      regex: ^\d+ ?kg$ accepted text pattern
+#      case: ignore     case-insensitive text
+# --------------------------------------------------------------
+from FormulaEngine import FormulaError, formula_id, is_formula
+import math
+import re
+
+DEFAULT_ABS_TOL = 1e-5  # matches the old round(5) comparison
+_SETTING = re.compile(r"^(tol|rtol|regex|case)\s*:\s*(.*)$", re.IGNORECASE)
+
+
+def parse_comment(text):
+    """Split a key comment into (alternates, settings)."""
+    alternates = []
+    settings = {}
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        m = _SETTING.match(line)
+        if m:
+            settings[m.group(1).lower()] = m.group(2).strip()
+        elif line.startswith("="):
+            # Formulas keep their commas
+            alternates.append(line)
+        else:
+            alternates.extend(x.strip() for x in line.split(",") if x.strip())
+    return alternates, settings
+
+
+def _tolerance(text):
+    text = text.strip()
+    if text.endswith("%"):
+        return float(text[:-1]) / 100
+    return float(text)
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+class AnswerMatcher:
+    """Accepted answers for one graded cell."""
+
+    __slots__ = ("sheet", "key_is_formula", "formulas", "texts", "expected",
+                 "abs_tol", "rel_tol", "regex", "casefold")
+
+    def __init__(self, key_value, expected, comment_text=None, sheet=None):
+        alternates, settings = parse_comment(comment_text)
+        self.sheet = sheet
+        self.key_is_formula = is_formula(key_value)
+        self.casefold = settings.get("case", "").lower() in ("ignore", "insensitive", "no")
+        self.abs_tol = _tolerance(settings["tol"]) if "tol" in settings else DEFAULT_ABS_TOL
+        self.rel_tol = _tolerance(settings["rtol"]) if "rtol" in settings else 0.0
+        self.regex = re.compile(settings["regex"], re.IGNORECASE if self.casefold else 0) \
+            if "regex" in settings else None
+        self.expected = expected
+
+        formulas = set()
+        texts = set()
+        for answer in [key_value] + alternates:
+            if answer is None:
+                continue
+            if is_formula(answer):
+                try:
+                    formulas.add(formula_id(answer, sheet))
+                except FormulaError:
+                    texts.add(self.normalize(answer))
+            else:
+                texts.add(self.normalize(answer))
+        self.formulas = frozenset(formulas)
+        self.texts = frozenset(texts)
+
+    def normalize(self, value):
+        """Text form used for set lookups: numbers by value, text trimmed (and case-folded)."""
+        if _is_number(value):
+            return format(float(value), ".10g")
+        text = str(value).strip()
+        try:
+            return format(float(text), ".10g")
+        except ValueError:
+            pass
+        if is_formula(text):
+            text = text.replace(" ", "").upper()
+        return text.casefold() if self.casefold else text
+
+    def matches_entry(self, entry):
+        """Is what the student typed (formula or constant) an accepted answer?"""
+        if is_formula(entry):
+            try:
+                return formula_id(entry, self.sheet) in self.formulas
+            except FormulaError:
+                return self.normalize(entry) in self.texts
+        if self.normalize(entry) in self.texts:
+            return True
+        return bool(self.regex and self.regex.fullmatch(str(entry).strip()))
+
+    def is_hardcoded(self, entry):
+        """A constant typed where the key has a formula."""
+        return self.key_is_formula and not is_formula(entry)
+
+    def matches_value(self, actual, expected=None):
+        """
+        Compare a saved result with the expected value (the key's, unless
+        a variant's expected value is passed). None if the key has no
+        expected value; False if the submission has no saved result (files
+        saved by openpyxl, Google Sheets or LibreOffice), since it cannot
+        be checked.
+        """
+        if expected is None:
+            expected = self.expected
+        if expected is None:
+            return None
+        if actual is None:
+            return False
+        if _is_number(expected) and _is_number(actual):
+            return math.isclose(actual, expected, rel_tol=self.rel_tol, abs_tol=self.abs_tol)
+        if self.regex is not None and self.regex.fullmatch(str(actual).strip()):
+            return True
+        return self.normalize(actual) == self.normalize(expected)
+
+
+def compile_matchers(ws_key, graded, key_values, sheet, accept=None):
+    """
+    One AnswerMatcher per graded cell, in graded order. graded holds
+    0-based (row, col); key_values maps 1-based (row, col) to the value
+    Excel saved in the key. accept maps (row, col) to extra comment-style
+    lines from the key's graded-cell spec.
+    """
+    matchers = []
+    for r, c in graded:
+        cell = ws_key.cell(row=r + 1, column=c + 1)
+        comment = cell.comment.text if cell.comment else None
+        extra = (accept or {}).get((r, c))
+        if extra:
+            comment = f"{comment}\n{extra}" if comment else extra
+        matchers.append(AnswerMatcher(cell.value, key_values.get((r + 1, c + 1)), comment, sheet))
+    return matchers
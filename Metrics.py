@@ -0,0 +1,300 @@
+# --------------------------------------------------------------
+#  LIVE METRICS
+#  Counters and gauges for a running grading job: submissions done
+#  and remaining, files/sec, latency percentiles per stage, queue
+#  depth, worker utilization and memory (RSS). Recording is a dict
+#  update or a deque append, so it is always on; publishing is
+#  opt-in:
+#    - a file rewritten every few seconds (JSON, or Prometheus text
+#      if the name ends in .prom), for node_exporter's textfile
+#      collector or a quick look while the run goes
+#    - a localhost endpoint: /metrics (Prometheus) and /metrics.json
+#
+#  Usage (grader):
+#    python Grader.py --metrics run_metrics.json
+#    python Grader.py --metrics-port 9105
+# --------------------------------------------------------------
+from collections import deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+import ctypes
+import json
+import numpy as np
+import os
+import sys
+import threading
+import time
+
+INTERVAL = 5.0      # seconds between file writes
+WINDOW = 1000       # latencies kept per stage for the percentiles
+RATE_WINDOW = 60.0  # seconds of completions behind the recent files/sec
+QUANTILES = (0.5, 0.9, 0.99)
+PREFIX = "autograder"
+
+
+def rss_bytes():
+    """Resident memory of this process, or None where it can't be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if sys.platform == "win32":
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return None
+
+
+class Metrics:
+    def __init__(self, path=None, port=None, interval=INTERVAL, workers=1):
+        self.path = Path(path) if path else None
+        self.port = port
+        self.interval = interval
+        self.workers = workers
+        self.started = time.time()
+        self.counters = {"done": 0, "flagged": 0}
+        self.gauges = {"total": 0}
+        self.stage = None
+        self.stage_seconds = {}   # pipeline stage -> wall seconds (so far, for the running one)
+        self.latency = {}         # stage -> deque of recent per-item seconds
+        self.busy = 0.0           # seconds workers spent on finished items
+        self._working = {}        # token -> start of each item in progress
+        self._stage_start = None
+        self._finished = deque()  # completion times for the recent rate
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+
+    # --- recording ---
+    def begin(self, stage):
+        """End the current pipeline stage and start the next (same laps as Profiler.begin)."""
+        now = time.perf_counter()
+        with self._lock:
+            self._close_stage(now)
+            self.stage = stage
+            self._stage_start = now
+
+    def _close_stage(self, now):
+        if self.stage is not None:
+            self.stage_seconds[self.stage] = now - self._stage_start
+        self.stage = None
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, stage, seconds, busy=True):
+        """One item (submission) took seconds in stage; busy adds it to worker time."""
+        with self._lock:
+            self.latency.setdefault(stage, deque(maxlen=WINDOW)).append(seconds)
+            if busy:
+                self.busy += seconds
+
+    @contextmanager
+    def timed(self, stage, busy=True):
+        """Time one item of stage; with busy it is worker time (counted live while it runs)."""
+        token = object()
+        start = time.perf_counter()
+        if busy:
+            with self._lock:
+                self._working[token] = start
+                self.gauges["workers_busy"] = len(self._working)
+        try:
+            yield
+        finally:
+            if busy:
+                with self._lock:
+                    del self._working[token]
+                    self.gauges["workers_busy"] = len(self._working)
+            self.observe(stage, time.perf_counter() - start, busy)
+
+    def done(self, flagged=False):
+        """A submission is finished (graded, resumed or flagged)."""
+        now = time.time()
+        with self._lock:
+            self.counters["done"] += 1
+            if flagged:
+                self.counters["flagged"] += 1
+            self._finished.append(now)
+            while self._finished and self._finished[0] < now - RATE_WINDOW:
+                self._finished.popleft()
+
+    # --- reading ---
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            elapsed = now - self.started
+            stage_seconds = dict(self.stage_seconds)
+            if self.stage is not None:
+                stage_seconds[self.stage] = time.perf_counter() - self._stage_start
+            recent = [t for t in self._finished if t >= now - RATE_WINDOW]
+            busy = self.busy + sum(time.perf_counter() - start for start in self._working.values())
+            done = self.counters["done"]
+            total = self.gauges.get("total", 0)
+            snap = {
+                "time": round(now, 3),
+                "elapsed_seconds": round(elapsed, 3),
+                "stage": self.stage,
+                "done": done,
+                "remaining": max(total - done, 0),
+                "files_per_sec": round(done / elapsed, 3) if elapsed else 0.0,
+                "files_per_sec_recent": round(len(recent) / min(elapsed, RATE_WINDOW), 3) if elapsed else 0.0,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "stage_seconds": {k: round(v, 3) for k, v in stage_seconds.items()},
+                "latency_seconds": {
+                    stage: {"count": len(v), **{f"p{round(q * 100)}": round(float(x), 4)
+                                                for q, x in zip(QUANTILES, np.quantile(list(v), QUANTILES))}}
+                    for stage, v in self.latency.items() if v
+                },
+                "workers": self.workers,
+                "worker_utilization": round(min(busy / (elapsed * self.workers), 1.0), 3) if elapsed else 0.0,
+                "rss_bytes": rss_bytes(),
+            }
+        return snap
+
+    def prometheus(self):
+        """The snapshot in Prometheus text exposition format."""
+        s = self.snapshot()
+        lines = []
+
+        def metric(name, kind, value, labels=None, help_text=None):
+            if value is None:
+                return
+            full = f"{PREFIX}_{name}"
+            if help_text:
+                lines.append(f"# HELP {full} {help_text}")
+                lines.append(f"# TYPE {full} {kind}")
+            label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+            lines.append(f"{full}{label_text} {value}")
+
+        metric("submissions_done_total", "counter", s["done"], help_text="Submissions finished")
+        metric("submissions_flagged_total", "counter", s["counters"]["flagged"],
+               help_text="Submissions flagged and not graded")
+        for name, value in s["counters"].items():
+            if name not in ("done", "flagged"):
+                metric(f"{name}_total", "counter", value, help_text=name.replace("_", " ").capitalize())
+        metric("submissions_remaining", "gauge", s["remaining"], help_text="Submissions left to grade")
+        metric("files_per_second", "gauge", s["files_per_sec"], help_text="Average throughput since start")
+        metric("files_per_second_recent", "gauge", s["files_per_sec_recent"],
+               help_text=f"Throughput over the last {RATE_WINDOW:g}s")
+        for name, value in s["gauges"].items():
+            if name != "total":
+                metric(name, "gauge", value, help_text=name.replace("_", " ").capitalize())
+        first = True
+        for stage, seconds in s["stage_seconds"].items():
+            metric("stage_seconds", "gauge", seconds, {"stage": stage},
+                   "Wall time per pipeline stage" if first else None)
+            first = False
+        first = True
+        for stage, q in s["latency_seconds"].items():
+            for quantile in QUANTILES:
+                metric("latency_seconds", "summary", q[f"p{round(quantile * 100)}"],
+                       {"stage": stage, "quantile": quantile}, "Per-submission latency" if first else None)
+                first = False
+            metric("latency_seconds_count", "summary", q["count"], {"stage": stage})
+        if s["stage"]:
+            metric("stage_info", "gauge", 1, {"stage": s["stage"]}, help_text="Pipeline stage running now")
+        metric("worker_utilization", "gauge", s["worker_utilization"],
+               help_text="Share of worker time spent on submissions")
+        metric("rss_bytes", "gauge", s["rss_bytes"], help_text="Resident memory of the grading process")
+        return "\n".join(lines) + "\n"
+
+    # --- publishing ---
+    def write(self):
+        """Write the metrics file (JSON, or Prometheus text for .prom) atomically."""
+        if self.path is None:
+            return
+        if self.path.suffix.lower() == ".prom":
+            text = self.prometheus()
+        else:
+            text = json.dumps(self.snapshot(), indent=2)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        try:
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, self.path)
+        except PermissionError:
+            pass  # a reader has the file open (Windows); try again next interval
+
+    def start(self):
+        """Start the periodic file writer and the localhost endpoint, if configured."""
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            thread = threading.Thread(target=self._write_loop, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            print(f"Live metrics → {self.path} (every {self.interval:g}s)")
+        if self.port is not None:
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), MetricsHandler)
+            self._server.metrics = self
+            thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            print(f"Live metrics on http://127.0.0.1:{self.port}/metrics")
+        return self
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def close(self):
+        """End the last stage, write the final numbers and stop publishing."""
+        with self._lock:
+            self._close_stage(time.perf_counter())
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.write()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        metrics = self.server.metrics
+        if self.path == "/metrics":
+            body, content_type = metrics.prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(metrics.snapshot()), "application/json"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass  # scraped every few seconds; keep the grading log readable
+
+
+def add_arguments(parser):
+    """The --metrics options for the command line."""
+    parser.add_argument("--metrics", type=Path, default=None, metavar="FILE",
+                        help="rewrite live metrics to FILE every few seconds (.prom for Prometheus text, else JSON)")
+    parser.add_argument("--metrics-port", type=int, default=None, metavar="PORT",
+                        help="serve live metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-interval", type=float, default=INTERVAL, metavar="SECONDS")
+
+
+def from_args(args, workers=1):
+    return Metrics(args.metrics, args.metrics_port, args.metrics_interval, workers)
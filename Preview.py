@@ -0,0 +1,266 @@
+# --------------------------------------------------------------
+#  QUICK LOOK
+#  Grades a random sample of submissions straight from the LMS zip
+#  (nothing extracted, no files written) to check the key before a
+#  full run. A wrong key cell shows up as most of the class missing
+#  that cell, usually with the same "wrong" answer.
+#
+#  The sample is stratified by file size: the submissions are sorted
+#  by size, cut into K equal groups and one is drawn from each, so
+#  near-empty and complete workbooks are both represented. Reports
+#  the estimated mean score (t interval with finite population
+#  correction), the share of the class in each score range (Wilson
+#  intervals) and the cells missed suspiciously often.
+#
+#  Each sampled file is graded in a worker process under a time limit
+#  (Guards.TimeLimited), with its graded formulas recalculated from its
+#  own inputs, so files saved without results (openpyxl, Google Sheets,
+#  LibreOffice) are graded on what they compute.
+#
+#  Usage:
+#    python Preview.py Key.xlsx submissions.zip [--sheet Sheet1] [--sample 20]
+#                      [--seed 1] [--manifest variants.json] [--json preview.json]
+#                      [--timeout 120]
+# --------------------------------------------------------------
+from collections import Counter
+from io import BytesIO
+from pathlib import Path, PurePosixPath
+from statistics import NormalDist
+from openpyxl import load_workbook
+from FormulaEngine import is_formula
+import Grader
+import Guards
+import KeyProbe
+import Recalc
+import argparse
+import json
+import math
+import numpy as np
+import random
+import time
+import zipfile
+
+SAMPLE = 20
+CONFIDENCE = 0.95
+MISS_RATE = 0.5   # cells whose miss rate is at least this (lower bound) are suspicious
+TOP_CELLS = 10
+
+
+def stratified_sample(infos, k, seed=None):
+    """k zip entries, one from each of k equal-count groups by file size."""
+    infos = sorted(infos, key=lambda i: (i.file_size, i.filename))
+    if k >= len(infos):
+        return infos
+    rng = random.Random(seed)
+    edges = [round(j * len(infos) / k) for j in range(k + 1)]
+    return [infos[rng.randrange(edges[j], edges[j + 1])] for j in range(k)]
+
+
+def _t_quantile(p, df):
+    """Student t quantile (Cornish-Fisher expansion; within 0.01 of exact for df >= 3)."""
+    z = NormalDist().inv_cdf(p)
+    return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+
+
+def mean_interval(scores, population, confidence=CONFIDENCE):
+    """(mean, low, high) for the class mean from a sample of scores."""
+    n = len(scores)
+    mean = float(np.mean(scores))
+    if n < 2:
+        return mean, None, None
+    fpc = math.sqrt((population - n) / (population - 1)) if population > 1 else 0.0
+    half = _t_quantile(1 - (1 - confidence) / 2, n - 1) * float(np.std(scores, ddof=1)) / math.sqrt(n) * fpc
+    return mean, max(mean - half, 0.0), min(mean + half, 100.0)
+
+
+def wilson(hits, n, confidence=CONFIDENCE):
+    """(share, low, high) Wilson score interval for hits out of n."""
+    if n == 0:
+        return 0.0, 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    p = hits / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return p, max(center - half, 0.0), min(center + half, 1.0)
+
+
+def grade_sample(data, name, key, key_cells, manifest_file=None):
+    """
+    Grade one sampled workbook, with recalculation verdicts for its graded
+    formulas. Returns (result, {cell: what was entered} for the missed
+    cells, whether any graded formula has no saved result); raises
+    Guards.Rejected if it has no graded sheet.
+    """
+    sheet_name = key["sheet"]
+    wb = load_workbook(BytesIO(data))
+    try:
+        if sheet_name not in wb.sheetnames:
+            raise Guards.Rejected(f"no sheet '{sheet_name}'")
+        variant_num = Grader.variant_values(wb, manifest_file, PurePosixPath(name).name)
+        recalc = Recalc.verify(key_cells, [Recalc.read_cells(BytesIO(data))], sheet_name, key["coords"], 0)[0]
+        result = Grader.grade_workbook(wb, BytesIO(data), key, variant_num, recalc)
+        ws = wb[sheet_name]
+        entered = {}
+        for r, c in result["wrong"]:
+            value = ws.cell(row=r + 1, column=c + 1).value
+            entered[(r, c)] = "(blank)" if value in (None, "") else str(value)
+        saved = KeyProbe.cached_values(BytesIO(data), sheet_name, key["coords"])
+        uncached = any(is_formula(ws.cell(row=r, column=c).value) and saved[(r, c)] is None
+                       for r, c in key["coords"])
+    finally:
+        wb.close()
+    return result, entered, uncached
+
+
+_WORKER_KEY = None
+_WORKER_CELLS = None
+
+
+def _init_worker(key_file, sheet_name):
+    global _WORKER_KEY, _WORKER_CELLS
+    _WORKER_KEY = Grader.load_key(key_file, sheet_name)
+    _WORKER_CELLS = Recalc.read_cells(key_file)
+
+
+def _grade_sample_in_worker(data, name, manifest_file):
+    return grade_sample(data, name, _WORKER_KEY, _WORKER_CELLS, manifest_file)
+
+
+def preview(key_file, zip_file, sheet_name=None, sample=SAMPLE, seed=None, manifest_file=None,
+            bins=Grader.SCORE_BINS, confidence=CONFIDENCE, timeout=Guards.TIMEOUT):
+    """Grade a stratified sample of the zip against the key. Returns the report dict."""
+    start = time.perf_counter()
+    sheet_name = sheet_name or KeyProbe.sheet_names(key_file)[0]
+    key = Grader.load_key(key_file, sheet_name)
+    graded = key["graded"]
+    key_cells = None if timeout else Recalc.read_cells(key_file)
+    runner = Guards.TimeLimited(timeout, _init_worker, (key_file, sheet_name)) if timeout else None
+
+    with zipfile.ZipFile(zip_file) as z:
+        infos = [i for i in z.infolist() if i.filename.lower().endswith(".xlsx")
+                 and not PurePosixPath(i.filename).name.startswith("~$")]
+        chosen = stratified_sample(infos, sample, seed)
+
+        scores = []
+        skipped = []
+        uncached = 0
+        misses = Counter()
+        entries = {}  # cell -> Counter of what the students who missed it entered
+        try:
+            for info in chosen:
+                data = z.read(info)
+                try:
+                    Guards.screen(BytesIO(data), sheet_name)
+                    if runner:
+                        result, entered, no_results = runner.run(_grade_sample_in_worker, data, info.filename,
+                                                                 manifest_file)
+                    else:
+                        result, entered, no_results = grade_sample(data, info.filename, key, key_cells,
+                                                                   manifest_file)
+                except Exception as e:
+                    skipped.append(f"{info.filename}: {e}")
+                    continue
+                for cell, value in entered.items():
+                    entries.setdefault(cell, Counter())[value] += 1
+                misses.update(result["wrong"])
+                scores.append(result["score"])
+                uncached += no_results
+        finally:
+            if runner:
+                runner.close()
+
+    n = len(scores)
+    mean, low, high = mean_interval(scores, len(infos), confidence) if n else (None, None, None)
+    counts = Grader.score_counts(scores, bins) if n else [0] * (len(bins) - 1)
+    ranges = []
+    for label, hits in zip(Grader.score_labels(bins), counts):
+        p, lo, hi = wilson(hits, n, confidence)
+        ranges.append({"range": label, "sample": int(hits), "share": p, "low": lo, "high": hi,
+                       "estimated_students": round(p * len(infos))})
+
+    cells = []
+    for (r, c), missed in misses.most_common():
+        p, lo, hi = wilson(missed, n, confidence)
+        common, times = entries[(r, c)].most_common(1)[0]
+        cells.append({"cell": Grader.cell_list([(r, c)]), "missed": missed, "rate": p, "low": lo, "high": hi,
+                      "suspicious": lo >= MISS_RATE, "answer": Grader._json_value(key["answers"].get((r, c))),
+                      "most_common": common, "most_common_count": times})
+
+    return {
+        "key_file": Path(key_file).name,
+        "sheet": sheet_name,
+        "class_size": len(infos),
+        "sampled": n,
+        "skipped": skipped,
+        "uncached": uncached,
+        "confidence": confidence,
+        "mean": mean, "mean_low": low, "mean_high": high,
+        "ranges": ranges,
+        "cells": cells,
+        "graded_cells": len(graded),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def format_report(report, top=TOP_CELLS):
+    """Plain-text summary for the console or a message box."""
+    pct = f"{report['confidence']:.0%}"
+    lines = [f"Quick look: {report['sampled']} of {report['class_size']} submissions graded "
+             f"in {report['seconds']:.1f}s ({report['key_file']}, '{report['sheet']}')"]
+    if not report["sampled"]:
+        lines.append("No submission in the sample could be graded.")
+    else:
+        if report["mean_low"] is not None:
+            lines.append(f"Estimated mean score: {report['mean']:.1f} "
+                         f"({pct} interval {report['mean_low']:.1f}-{report['mean_high']:.1f})")
+        else:
+            lines.append(f"Score: {report['mean']:.1f} (sample too small for an interval)")
+        lines.append("")
+        lines.append(f"Score range   share   {pct} interval   ~students")
+        for r in report["ranges"]:
+            lines.append(f"{r['range']:<12}{r['share']:>6.0%}   {r['low']:>4.0%} - {r['high']:<4.0%}"
+                         f"{r['estimated_students']:>11}")
+
+        suspicious = [c for c in report["cells"] if c["suspicious"]]
+        lines.append("")
+        if suspicious:
+            lines.append(f"Check the key: {len(suspicious)} cell(s) missed by most of the sample")
+            for c in suspicious[:top]:
+                lines.append(f"  {c['cell']}: missed {c['missed']}/{report['sampled']} "
+                             f"({pct} interval {c['low']:.0%}-{c['high']:.0%}); key has {c['answer']!r}, "
+                             f"{c['most_common_count']} entered {c['most_common']!r}")
+        else:
+            lines.append("No cell is missed by most of the sample.")
+            for c in report["cells"][:3]:
+                lines.append(f"  Most missed: {c['cell']} ({c['missed']}/{report['sampled']})")
+        if report["uncached"]:
+            lines.append(f"{report['uncached']} sampled file(s) were saved without results (not by Excel); "
+                         f"their formulas were checked by recalculation.")
+    if report["skipped"]:
+        lines.append("")
+        lines.append(f"Skipped {len(report['skipped'])}: " + "; ".join(report["skipped"][:3]))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade a stratified sample to check the key before a full run.")
+    parser.add_argument("key_file", type=Path)
+    parser.add_argument("zip_file", type=Path, help="the submissions zip from the LMS")
+    parser.add_argument("--sheet", default=None, help="graded sheet (default: first sheet)")
+    parser.add_argument("--sample", type=int, default=SAMPLE, metavar="K")
+    parser.add_argument("--seed", type=int, default=None, help="repeat the same sample")
+    parser.add_argument("--manifest", type=Path, default=None, help="variants.json for variant assignments")
+    parser.add_argument("--json", type=Path, default=None, help="also save the report as JSON")
+    parser.add_argument("--timeout", type=float, default=Guards.TIMEOUT,
+                        help="seconds allowed to grade one submission; 0 grades in this process with no limit")
+    args = parser.parse_args()
+
+    report = preview(args.key_file, args.zip_file, args.sheet, args.sample, args.seed, args.manifest,
+                     timeout=args.timeout)
+    print(format_report(report))
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
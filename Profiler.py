@@ -0,0 +1,153 @@
+# --------------------------------------------------------------
+#  STAGE PROFILER
+#  Opt-in profiling for the grader and generator. Each pipeline
+#  stage gets a cProfile .pstats file and a tracemalloc report of
+#  the lines that allocated the most memory during it; summary.txt
+#  lists wall time and memory per stage.
+#
+#  Stages are laps: begin("extract") ends whatever stage was running
+#  and starts the next, so long functions only need one line per
+#  stage. With slowest=K, the items of a stage (submissions) are
+#  profiled one by one and only the K slowest profiles are kept.
+#  When profiling is off every call returns immediately.
+#
+#  Inspect a stage with:
+#    python -m pstats profile/grader/03_grade.pstats
+# --------------------------------------------------------------
+from pathlib import Path
+import cProfile
+import heapq
+import re
+import time
+import tracemalloc
+
+TOP_ALLOCATIONS = 15
+
+
+def _safe(name):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", str(name)).strip("_")[:80]
+
+
+class Profiler:
+    def __init__(self, out_dir=None, slowest=0, top=TOP_ALLOCATIONS):
+        self.enabled = out_dir is not None
+        self.out_dir = Path(out_dir) if out_dir else None
+        self.slowest = slowest
+        self.top = top
+        self.stages = []   # (name, seconds, allocated bytes, peak bytes)
+        self._stage = None
+        self._item = None
+        self._heap = []    # K slowest items: (seconds, order, name, profile)
+        self._items = 0
+
+    # --- stages ---
+    def begin(self, name, items=False):
+        """
+        End the current stage and start profiling stage name. With items,
+        the stage is split into item() laps and, if slowest is set, only
+        those are call-profiled.
+        """
+        if not self.enabled:
+            return
+        self.end_stage()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        prof = None
+        if not (items and self.slowest):
+            prof = cProfile.Profile()
+            prof.enable()
+        self._stage = (name, time.perf_counter(), tracemalloc.take_snapshot(), prof)
+
+    def end_stage(self):
+        if not self.enabled or self._stage is None:
+            return
+        self._end_item()
+        name, start, before, prof = self._stage
+        if prof is not None:
+            prof.disable()
+        seconds = time.perf_counter() - start
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        self._stage = None
+
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{len(self.stages) + 1:02d}_{_safe(name)}"
+        if prof is not None:
+            prof.dump_stats(self.out_dir / f"{stem}.pstats")
+        diff = after.compare_to(before, "lineno")
+        allocated = sum(d.size_diff for d in diff)
+        with open(self.out_dir / f"{stem}_alloc.txt", "w", encoding="utf-8") as f:
+            f.write(f"Top {self.top} allocations during '{name}' (net {allocated / 1024:.1f} KiB, "
+                    f"peak {peak / 1024:.1f} KiB)\n\n")
+            for d in diff[:self.top]:
+                f.write(f"{d}\n")
+        self.stages.append((name, seconds, allocated, peak))
+        print(f"[profile] {name}: {seconds:.2f}s, peak {peak / 1024 / 1024:.1f} MiB")
+
+    # --- items (e.g. one submission) ---
+    def item(self, name):
+        """End the previous item and start timing (and, with slowest, profiling) this one."""
+        if not self.enabled or self._stage is None:
+            return
+        self._end_item()
+        prof = None
+        if self.slowest:
+            prof = cProfile.Profile()
+            prof.enable()
+        self._item = (name, time.perf_counter(), prof)
+
+    def _end_item(self):
+        if self._item is None:
+            return
+        name, start, prof = self._item
+        self._item = None
+        if prof is None:
+            return
+        prof.disable()
+        seconds = time.perf_counter() - start
+        self._items += 1
+        entry = (seconds, self._items, name, prof)
+        if len(self._heap) < self.slowest:
+            heapq.heappush(self._heap, entry)
+        else:
+            heapq.heappushpop(self._heap, entry)
+
+    # --- report ---
+    def end(self):
+        """End the last stage and write summary.txt plus the slowest items' profiles."""
+        if not self.enabled:
+            return
+        self.end_stage()
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        slowest = sorted(self._heap, reverse=True)
+        for rank, (seconds, _, name, prof) in enumerate(slowest, start=1):
+            prof.dump_stats(self.out_dir / f"slowest_{rank:02d}_{_safe(name)}.pstats")
+
+        with open(self.out_dir / "summary.txt", "w", encoding="utf-8") as f:
+            f.write(f"{'Stage':<28}{'Seconds':>10}{'Net KiB':>12}{'Peak KiB':>12}\n")
+            for name, seconds, allocated, peak in self.stages:
+                f.write(f"{name:<28}{seconds:>10.3f}{allocated / 1024:>12.1f}{peak / 1024:>12.1f}\n")
+            if slowest:
+                f.write(f"\n{len(slowest)} slowest of {self._items} items:\n")
+                for rank, (seconds, _, name, _) in enumerate(slowest, start=1):
+                    f.write(f"{rank:>3}. {seconds:8.3f}s  {name}\n")
+        tracemalloc.stop()
+        print(f"[profile] Reports saved in {self.out_dir}")
+
+
+OFF = Profiler()
+
+
+def add_arguments(parser):
+    """The --profile options shared by the grader and generator command lines."""
+    parser.add_argument("--profile", nargs="?", const="profile", default=None, metavar="DIR",
+                        help="write cProfile and tracemalloc reports per stage to DIR (default: ./profile)")
+    parser.add_argument("--profile-slowest", type=int, default=0, metavar="K",
+                        help="profile submissions one by one and keep only the K slowest")
+
+
+def from_args(args, tool):
+    if not args.profile:
+        return OFF
+    return Profiler(Path(args.profile) / tool, args.profile_slowest)
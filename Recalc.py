@@ -0,0 +1,129 @@
+# --------------------------------------------------------------
+#  RECALCULATION CHECK
+#  Recomputes graded cells from each submission's own formulas under
+#  the original and several perturbed input sets, and compares them
+#  with the key's formulas under the same inputs. A hardcoded number
+#  or a stale cached value does not follow the perturbed inputs, so
+#  it fails even when the saved value looks right.
+# --------------------------------------------------------------
+from openpyxl import load_workbook
+from openpyxl.cell.cell import MergedCell
+from FormulaEngine import BatchEvaluator, FormulaError, canonical, is_formula
+import numpy as np
+
+
+def read_cells(path):
+    """Raw cell contents of every sheet as {(sheet, row, col): value}."""
+    wb = load_workbook(path, read_only=True)
+    try:
+        cells = {}
+        for ws in wb.worksheets:
+            for row in ws.iter_rows():
+                for cell in row:
+                    if cell.value is not None and not isinstance(cell, MergedCell):
+                        cells[(ws.title, cell.row, cell.column)] = cell.value
+        return cells
+    finally:
+        wb.close()
+
+
+def _refs(node):
+    kind = node[0]
+    if kind in ("ref", "range"):
+        yield node
+    elif kind in ("neg", "pct"):
+        yield from _refs(node[1])
+    elif kind == "op":
+        yield from _refs(node[2])
+        yield from _refs(node[3])
+    elif kind == "func":
+        for a in node[2]:
+            yield from _refs(a)
+
+
+def input_cells(key_cells, sheet, graded):
+    """
+    Numeric constants on the graded sheet that the key's formulas refer
+    to: these are the inputs that get perturbed. graded is 1-based (row, col).
+    """
+    graded = set(graded)
+    max_row = max((r for s, r, c in key_cells if s == sheet), default=0)
+    referenced = set()
+    for (s, r, c), raw in key_cells.items():
+        if s != sheet or not is_formula(raw):
+            continue
+        try:
+            node = canonical(raw, sheet)
+        except FormulaError:
+            continue
+        for ref in _refs(node):
+            if ref[1] is not None:
+                continue
+            if ref[0] == "ref":
+                referenced.add((ref[2], ref[3]))
+            else:
+                r1, c1, r2, c2 = ref[2:]
+                if r1 is None:
+                    r1, r2 = 1, max_row
+                referenced.update((rr, cc) for rr in range(r1, min(r2, max_row) + 1) for cc in range(c1, c2 + 1))
+
+    return sorted(
+        (r, c) for r, c in referenced
+        if (r, c) not in graded
+        and isinstance(key_cells.get((sheet, r, c)), (int, float))
+        and not isinstance(key_cells.get((sheet, r, c)), bool)
+    )
+
+
+def perturbation_factors(num_inputs, perturbations, seed=0, spread=0.5):
+    """(1 + perturbations, num_inputs) multipliers; row 0 keeps the original inputs."""
+    rng = np.random.default_rng(seed)
+    factors = rng.uniform(1 - spread, 1 + spread, size=(perturbations, num_inputs))
+    return np.vstack([np.ones((1, num_inputs)), factors])
+
+
+def verify(key_cells, submissions, sheet, graded, perturbations=3, seed=0, rtol=1e-6, atol=1e-9):
+    """
+    Batch-check every submission at once.
+
+    submissions is a list of raw-cell dicts (see read_cells); graded is a
+    list of 1-based (row, col). Returns one dict per submission mapping
+    (row, col) -> True (matches the key under every input set), False, or
+    None when the key or the submission's formula cannot be evaluated for
+    that cell (a function batch evaluation does not support, for one).
+    """
+    inputs = input_cells(key_cells, sheet, graded)
+    factors = perturbation_factors(len(inputs), perturbations, seed)
+    sets = factors.shape[0]
+    n = len(submissions) * sets
+
+    # Each submission's own input values (variants differ), scaled per input set
+    overrides = {}
+    for j, (r, c) in enumerate(inputs):
+        key_value = key_cells[(sheet, r, c)]
+        base = []
+        for cells in submissions:
+            v = cells.get((sheet, r, c), key_value)
+            base.append(float(v) if isinstance(v, (int, float)) else np.nan)
+        values = np.repeat(np.array(base), sets) * np.tile(factors[:, j], len(submissions))
+        if isinstance(key_value, int):
+            values = np.round(values)
+        overrides[(sheet, r, c)] = values
+
+    key_ev = BatchEvaluator([key_cells] * n, sheet, overrides)
+    # Each graded formula is checked on its own: references to other graded
+    # cells read the key's values, so one mistake is not counted twice
+    stu_ev = BatchEvaluator([cells for cells in submissions for _ in range(sets)], sheet, overrides,
+                            isolate={(sheet, r, c) for r, c in graded}, reference=key_ev)
+
+    results = [{} for _ in submissions]
+    for r, c in graded:
+        expected = key_ev.cell(sheet.lower(), r, c).reshape(len(submissions), sets)
+        actual = stu_ev.cell(sheet.lower(), r, c).reshape(len(submissions), sets)
+        checkable = np.isfinite(expected)
+        ok = np.isclose(actual, expected, rtol=rtol, atol=atol) | ~checkable
+        # NaN on the student side only means it could not be evaluated: no verdict
+        unknown = (checkable & ~np.isfinite(actual)).any(axis=1)
+        for i in range(len(submissions)):
+            results[i][(r, c)] = bool(ok[i].all()) if checkable[i].any() and not unknown[i] else None
+    return results
@@ -0,0 +1,86 @@
+# --------------------------------------------------------------
+#  RESCORE FROM STORED OUTCOMES
+#  Every grading run saves each student's per-cell outcomes in
+#  outcomes.json. Changing cell points, giving partial credit or
+#  forgiving a bad key cell is then a new rubric (see RUBRIC in
+#  Grader.py) applied to those outcomes: all scores come from one
+#  matrix-vector product, with no workbook opened. Writes Scores.csv,
+#  results_summary.xlsx and an updated outcomes.json (for Feedback.py).
+#
+#  Usage:
+#    python Rescore.py outcomes.json --rubric rubric.json --out Rescored
+#                      [--roster roster.xlsx] [--score-bins 0,60,70,80,90,100]
+# --------------------------------------------------------------
+from pathlib import Path
+import Grader
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import time
+
+
+def rescore(outcomes_file, rubric_file=None, out_dir="Rescored", roster=None, bins=Grader.SCORE_BINS):
+    key, outcomes = Grader.load_outcomes(outcomes_file)
+    rubric = Grader.load_rubric(rubric_file) if rubric_file else None
+    graded = key["graded"]
+    subs = outcomes["submissions"]
+    scored = [s for s in subs if not s.get("flag")]  # flagged submissions were never graded
+
+    start = time.perf_counter()
+    compiled = Grader.compile_rubric(graded, outcomes.get("points"), rubric)
+    matrix = [s["outcome"] for s in scored]
+    scores = Grader.score_outcomes(matrix, compiled)
+    codes = np.frombuffer("".join(matrix).encode("ascii"), dtype=np.uint8).reshape(len(matrix), len(graded))
+    wrong_counts = (codes != ord(Grader.CORRECT)).sum(axis=0)
+    elapsed = time.perf_counter() - start
+
+    old = np.array([s["score"] for s in scored])
+    changed = int((old != scores).sum())
+    print(f"Rescored {len(scored)} submissions in {elapsed * 1000:.1f} ms: {changed} changed, "
+          f"mean {old.mean() if len(old) else 0:.1f} → {scores.mean() if len(scores) else 0:.1f}")
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    new_score = {s["file"]: int(x) for s, x in zip(scored, scores)}
+
+    # Scores.csv in the grader's layout
+    rows = []
+    for s in subs:
+        folder = Path(s["file"]).parent.name
+        first, last = Grader.student_name(folder or Path(s["file"]).stem)
+        rows.append({"First Name": first, "Last Name": last, "Folder": folder,
+                     "Score": new_score.get(s["file"], 0), "Flag": s.get("flag", "")})
+    df_scores = pd.DataFrame(rows, columns=["First Name", "Last Name", "Folder", "Score", "Flag"])
+    if roster:
+        df_roster = Grader.read_roster(roster)
+        df_scores = pd.merge(df_scores, df_roster[["First Name", "Last Name", "Email", "Student ID"]],
+                             on=["First Name", "Last Name"], how="left")
+    df_scores.to_csv(out_dir / "Scores.csv", index=False)
+
+    # Item analysis and score ranges (near-duplicates need the workbooks, so no Similarity sheet)
+    cell_wrong_count = dict(zip(graded, (int(n) for n in wrong_counts)))
+    Grader.write_summary(cell_wrong_count, df_scores["Score"], out_dir / "results_summary.xlsx", bins=bins)
+
+    # outcomes.json with the new scores, so feedback files show them
+    updated = dict(outcomes, rubric=rubric,
+                   submissions=[dict(s, score=new_score.get(s["file"], s["score"])) for s in subs])
+    (out_dir / Grader.OUTCOMES_NAME).write_text(json.dumps(updated, indent=1), encoding="utf-8")
+    print(f"Scores.csv, results_summary.xlsx and {Grader.OUTCOMES_NAME} → {out_dir}")
+    return df_scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore a graded class from outcomes.json with a new rubric.")
+    parser.add_argument("outcomes", type=Path, help="outcomes.json from the grading run")
+    parser.add_argument("--rubric", type=Path, default=None, help="rubric.json (default: 1 point per cell)")
+    parser.add_argument("--out", type=Path, default=Path("Rescored"))
+    parser.add_argument("--roster", type=Path, default=None, help="roster workbook, to add Email and Student ID")
+    parser.add_argument("--score-bins", type=lambda t: [int(x) for x in t.split(",")], default=Grader.SCORE_BINS,
+                        metavar="0,60,70,80,90,100")
+    args = parser.parse_args()
+    rescore(args.outcomes, args.rubric, args.out, args.roster, args.score_bins)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+# --------------------------------------------------------------
+#  SHARDED GRADING
+#  Splits a submissions zip into N shards, grades each shard on its
+#  own (another machine, or another process) into a partial result,
+#  and merges the partials into the usual outputs without regrading.
+#
+#  Every aggregate in a partial is a sum (per-cell wrong counts,
+#  score range counts) or a list keyed by submission (scores,
+#  per-cell outcomes, feedback files), so partials can be merged in
+#  any order and in any grouping with the same result.
+#
+#  Usage:
+#    python ShardGrader.py split subs.zip --shards 4 --out shards
+#    python ShardGrader.py grade shards/shard_1.zip --key Key.xlsx --sheet Sheet1 --out partial_1
+#                          [--score-bins 0,60,70,80,90,100] [--rubric rubric.json]
+#                          [--timeout 120] [--max-mb 200] [--max-cells 2000000]
+#    python ShardGrader.py merge partial_1 partial_2 ... --out final [--roster Roster.xlsx]
+#    python ShardGrader.py local subs.zip --key Key.xlsx --sheet Sheet1 --shards 4 --out final
+#                          [--score-bins 0,60,70,80,90,100] [--rubric rubric.json]
+#                          [--timeout 120] [--max-mb 200] [--max-cells 2000000]
+# --------------------------------------------------------------
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path, PurePosixPath
+from openpyxl import load_workbook
+from openpyxl.utils.cell import coordinate_to_tuple
+import Grader
+import Guards
+import KeyProbe
+import Similarity
+import argparse
+import csv
+import hashlib
+import json
+import pandas as pd
+import zipfile
+
+PARTIAL_NAME = "partial.json"
+SHARD_MANIFEST = "shards.json"
+SCORE_COLUMNS = ["First Name", "Last Name", "Folder", "File", "Score", "Flag"]
+
+
+# ----------------------------------------------------------------------
+# SPLIT
+# ----------------------------------------------------------------------
+def split(zip_file, num_shards, out_dir):
+    """
+    Write shard_1.zip ... shard_N.zip, keeping each student's folder in
+    one shard. Folders are dealt out in sorted order, so the split only
+    depends on the zip's contents. Returns the shard paths.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(zip_file) as z:
+        folders = {}
+        for name in z.namelist():
+            if name.lower().endswith(".xlsx"):
+                folders.setdefault(PurePosixPath(name).parent.as_posix(), []).append(name)
+
+        members = [[] for _ in range(num_shards)]
+        for i, folder in enumerate(sorted(folders)):
+            members[i % num_shards].extend(sorted(folders[folder]))
+
+        paths = []
+        for i, names in enumerate(members, start=1):
+            path = out_dir / f"shard_{i}.zip"
+            with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zs:
+                for name in names:
+                    zs.writestr(z.getinfo(name), z.read(name))
+            paths.append(path)
+
+    manifest = {
+        "source": Path(zip_file).name,
+        "sha256": hashlib.sha256(Path(zip_file).read_bytes()).hexdigest(),
+        "shards": {p.name: names for p, names in zip(paths, members)},
+    }
+    (out_dir / SHARD_MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    print(f"Split {sum(len(m) for m in members)} files from {len(folders)} folders into {num_shards} shards → {out_dir}")
+    return paths
+
+
+# ----------------------------------------------------------------------
+# GRADE ONE SHARD
+# ----------------------------------------------------------------------
+def grade_member(data, name, key, manifest_file=None, instructor="Instructor"):
+    """
+    Grade one workbook from a shard. Returns (result, fingerprint,
+    feedback workbook bytes); raises Guards.Rejected if it can't be graded.
+    """
+    try:
+        wb = load_workbook(BytesIO(data))
+    except Exception as e:
+        raise Guards.Rejected(f"could not be opened ({e})")
+    try:
+        if key["sheet"] not in wb.sheetnames:
+            raise Guards.Rejected(f"has no '{key['sheet']}' sheet")
+        variant_num = Grader.variant_values(wb, manifest_file, PurePosixPath(name).name)
+        result = Grader.grade_workbook(wb, BytesIO(data), key, variant_num)
+        fingerprint = Similarity.fingerprint(wb, key)
+        buf = BytesIO()
+        Grader.write_feedback(wb, result, key, instructor, buf)
+    finally:
+        wb.close()
+    return result, fingerprint, buf.getvalue()
+
+
+# Under a time limit each file is graded in a worker process (Guards.TimeLimited)
+# that loads the key itself, as in Grader.process_submissions
+_WORKER_KEY = None
+
+
+def _init_worker(key_file, sheet_name, rubric=None):
+    global _WORKER_KEY
+    _WORKER_KEY = Grader.load_key(key_file, sheet_name, rubric=rubric)
+
+
+def _grade_member_in_worker(data, name, manifest_file, instructor):
+    return grade_member(data, name, _WORKER_KEY, manifest_file, instructor)
+
+
+def grade_shard(shard_zip, key_file, sheet_name, out_dir, instructor="Instructor", manifest_file=None,
+                score_bins=Grader.SCORE_BINS, rubric=None, timeout=Guards.TIMEOUT,
+                max_mb=Guards.MAX_UNCOMPRESSED_MB, max_cells=Guards.MAX_CELLS):
+    """
+    Grade every workbook in shard_zip. Writes partial.json, a partial
+    Scores.csv and Results.zip (feedback files, same layout as the full
+    run) to out_dir and returns the partial's path. Workbooks that can't
+    be graded, or break the size, cell or time limits (see Guards), are
+    kept with score 0 and the reason in Flag.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    key = Grader.load_key(key_file, sheet_name, rubric=rubric)
+    graded = key["graded"]
+    coords = Grader.cell_list(graded).split(",") if graded else []
+
+    runner = Guards.TimeLimited(timeout, _init_worker, (key_file, sheet_name, rubric)) if timeout else None
+
+    submissions = []
+    cell_wrong_count = {c: 0 for c in coords}
+    with zipfile.ZipFile(shard_zip) as z, \
+            zipfile.ZipFile(out_dir / "Results.zip", "w", zipfile.ZIP_DEFLATED) as zres:
+        for name in sorted(z.namelist()):
+            rel = PurePosixPath(name)
+            if rel.suffix.lower() != ".xlsx" or rel.name.startswith("~$"):
+                continue
+            print(f"Grading: {name}")
+            first, last = Grader.student_name(rel.parent.name)
+            row = {"Folder": rel.parent.name, "File": rel.name, "First Name": first, "Last Name": last}
+            try:
+                data = z.read(name)
+                Guards.screen(BytesIO(data), sheet_name, max_mb, max_cells)
+                if runner:
+                    result, fingerprint, feedback = runner.run(_grade_member_in_worker, data, name,
+                                                               manifest_file, instructor)
+                else:
+                    result, fingerprint, feedback = grade_member(data, name, key, manifest_file, instructor)
+            except Exception as e:
+                if not runner and not isinstance(e, Guards.Rejected):
+                    raise
+                # Not graded: score 0, every cell counted blank, no feedback file
+                flag = str(e) if isinstance(e, Guards.Rejected) else f"grading failed: {e}"
+                print(f"Flagged: {name}: {flag}")
+                submissions.append(dict(row, Score=0, outcome=Grader.EMPTY * len(graded), fingerprint=None,
+                                        Flag=flag))
+                continue
+            zres.writestr(f"Results/{name}", feedback)
+
+            outcome = Grader.outcome_string(result, graded)
+            for coord, o in zip(coords, outcome):
+                if o != Grader.CORRECT:
+                    cell_wrong_count[coord] += 1
+            submissions.append(dict(row, Score=result["score"], outcome=outcome, fingerprint=fingerprint, Flag=""))
+    if runner:
+        runner.close()
+
+    partial = {
+        "key_file": Path(key_file).name,
+        "sheet": sheet_name,
+        "rubric": rubric,
+        "shard": Path(shard_zip).name,
+        "graded": coords,
+        "submissions": submissions,
+        "cell_wrong_count": cell_wrong_count,
+        "score_bins": score_bins,
+        "score_counts": Grader.score_counts((s["Score"] for s in submissions), score_bins),
+    }
+    path = out_dir / PARTIAL_NAME
+    path.write_text(json.dumps(partial, indent=2), encoding="utf-8")
+    pd.DataFrame(submissions, columns=SCORE_COLUMNS).to_csv(out_dir / "Scores.csv", index=False)
+    print(f"Graded {len(submissions)} submissions from {Path(shard_zip).name} → {out_dir}")
+    return path
+
+
+# ----------------------------------------------------------------------
+# MERGE
+# ----------------------------------------------------------------------
+def merge_partials(partials):
+    """
+    Combine partial results (dicts from partial.json). Counts are summed
+    and submissions sorted by folder and file, so the merge does not
+    depend on the order the partials are given in.
+    """
+    if not partials:
+        raise ValueError("No partial results to merge")
+    first = partials[0]
+    for p in partials[1:]:
+        if (p["key_file"], p["sheet"], p["graded"]) != (first["key_file"], first["sheet"], first["graded"]):
+            raise ValueError(f"Partial {p['shard']} was graded against a different key or sheet than {first['shard']}")
+        if p["score_bins"] != first["score_bins"]:
+            raise ValueError(f"Partial {p['shard']} uses different score bins than {first['shard']}")
+        if p.get("rubric") != first.get("rubric"):
+            raise ValueError(f"Partial {p['shard']} was scored with a different rubric than {first['shard']}")
+
+    submissions = sorted((s for p in partials for s in p["submissions"]), key=lambda s: (s["Folder"], s["File"]))
+    for a, b in zip(submissions, submissions[1:]):
+        if (a["Folder"], a["File"]) == (b["Folder"], b["File"]):
+            raise ValueError(f"{a['Folder']}/{a['File']} appears in more than one partial")
+
+    cell_wrong_count = {c: sum(p["cell_wrong_count"][c] for p in partials) for c in first["graded"]}
+    counts = [sum(col) for col in zip(*(p["score_counts"] for p in partials))]
+    return {
+        "key_file": first["key_file"],
+        "sheet": first["sheet"],
+        "rubric": first.get("rubric"),
+        "shard": "merged",
+        "graded": first["graded"],
+        "submissions": submissions,
+        "cell_wrong_count": cell_wrong_count,
+        "score_bins": first["score_bins"],
+        "score_counts": counts,
+    }
+
+
+def merge(partial_dirs, out_dir, roster=None):
+    """Write Scores.csv, results_summary.xlsx, correctness.csv and Results.zip from partial folders."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    partial_dirs = [Path(d) for d in partial_dirs]
+    merged = merge_partials([json.loads((d / PARTIAL_NAME).read_text(encoding="utf-8")) for d in partial_dirs])
+    submissions = merged["submissions"]
+
+    # Scores.csv, matched to the roster like the single-machine run
+    df_scores = pd.DataFrame(submissions, columns=SCORE_COLUMNS)
+    df_scores["Flag"] = df_scores["Flag"].fillna("")  # partials from before flagged rows were kept
+    if roster:
+        df_roster = Grader.read_roster(roster)
+        df_scores = pd.merge(df_scores, df_roster[["First Name", "Last Name", "Email", "Student ID"]],
+                             on=["First Name", "Last Name"], how="left")
+    df_scores.to_csv(out_dir / "Scores.csv", index=False)
+
+    # Item analysis and score ranges from the summed counts
+    cell_wrong_count = {}
+    for coord, count in merged["cell_wrong_count"].items():
+        r, c = coordinate_to_tuple(coord)
+        cell_wrong_count[(r - 1, c - 1)] = count
+    # Near-duplicates are found across shards, from the stored fingerprints
+    clusters = Similarity.find_clusters({f"{s['Folder']}/{s['File']}": s["fingerprint"]
+                                         for s in submissions if s.get("fingerprint")})
+    Grader.write_summary(cell_wrong_count, None, out_dir / "results_summary.xlsx", merged["score_counts"],
+                         clusters, merged["score_bins"])
+
+    # Correctness matrix: one row per submission, one column per graded cell
+    with open(out_dir / "correctness.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Folder", "File"] + merged["graded"])
+        for s in submissions:
+            writer.writerow([s["Folder"], s["File"]] + [1 if o == Grader.CORRECT else 0 for o in s["outcome"]])
+
+    # Feedback files, in sorted order regardless of shard
+    entries = {}
+    for d in partial_dirs:
+        with zipfile.ZipFile(d / "Results.zip") as z:
+            for info in z.infolist():
+                entries[info.filename] = (d / "Results.zip", info)
+    with zipfile.ZipFile(out_dir / "Results.zip", "w", zipfile.ZIP_DEFLATED) as zout:
+        for name in sorted(entries):
+            src, info = entries[name]
+            with zipfile.ZipFile(src) as z:
+                zout.writestr(info, z.read(info))
+
+    (out_dir / PARTIAL_NAME).write_text(json.dumps(merged, indent=2), encoding="utf-8")
+    print(f"Merged {len(partial_dirs)} partials ({len(submissions)} submissions) → {out_dir}")
+    return merged
+
+
+# ----------------------------------------------------------------------
+# LOCAL RUN (all shards on this machine)
+# ----------------------------------------------------------------------
+def _grade_job(job):
+    return grade_shard(*job)
+
+
+def run_local(zip_file, key_file, sheet_name, num_shards, out_dir, roster=None, instructor="Instructor",
+              manifest_file=None, workers=None, score_bins=Grader.SCORE_BINS, rubric=None, timeout=Guards.TIMEOUT,
+              max_mb=Guards.MAX_UNCOMPRESSED_MB, max_cells=Guards.MAX_CELLS):
+    out_dir = Path(out_dir)
+    shards = split(zip_file, num_shards, out_dir / "shards")
+    partial_dirs = [out_dir / "partials" / s.stem for s in shards]
+    jobs = [(s, key_file, sheet_name, d, instructor, manifest_file, score_bins, rubric, timeout, max_mb, max_cells)
+            for s, d in zip(shards, partial_dirs)]
+    with ProcessPoolExecutor(max_workers=workers or num_shards) as pool:
+        list(pool.map(_grade_job, jobs))
+    return merge(partial_dirs, out_dir, roster)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade a submissions zip in shards and merge the results.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("split", help="split a submissions zip into shards")
+    p.add_argument("zip_file", type=Path)
+    p.add_argument("--shards", type=int, required=True)
+    p.add_argument("--out", type=Path, required=True)
+
+    for name, help_text in (("grade", "grade one shard"), ("local", "split, grade in parallel and merge")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("zip_file", type=Path)
+        p.add_argument("--key", type=Path, required=True)
+        p.add_argument("--sheet", default=None, help="graded sheet (default: first sheet)")
+        p.add_argument("--out", type=Path, required=True)
+        p.add_argument("--instructor", default="Instructor")
+        p.add_argument("--manifest", type=Path, default=None, help="variants.json for variant assignments")
+        p.add_argument("--score-bins", type=lambda t: [int(x) for x in t.split(",")], default=Grader.SCORE_BINS,
+                       metavar="0,60,70,80,90,100", help="score range edges for the summary histogram")
+        p.add_argument("--rubric", type=Path, default=None, metavar="rubric.json",
+                       help="cell points and partial credit (see RUBRIC in Grader.py)")
+        p.add_argument("--timeout", type=float, default=Guards.TIMEOUT,
+                       help="seconds allowed to grade one submission; 0 grades in this process with no limit")
+        p.add_argument("--max-mb", type=float, default=Guards.MAX_UNCOMPRESSED_MB,
+                       help="largest uncompressed submission in MB")
+        p.add_argument("--max-cells", type=int, default=Guards.MAX_CELLS,
+                       help="most rows and cells allowed on the graded sheet")
+        if name == "local":
+            p.add_argument("--shards", type=int, required=True)
+            p.add_argument("--workers", type=int, default=None)
+            p.add_argument("--roster", type=Path, default=None)
+
+    p = sub.add_parser("merge", help="merge partial results")
+    p.add_argument("partials", type=Path, nargs="+")
+    p.add_argument("--out", type=Path, required=True)
+    p.add_argument("--roster", type=Path, default=None)
+
+    args = parser.parse_args()
+    if args.command == "split":
+        split(args.zip_file, args.shards, args.out)
+    elif args.command == "merge":
+        merge(args.partials, args.out, args.roster)
+    else:
+        sheet = args.sheet or KeyProbe.sheet_names(args.key)[0]
+        rubric = Grader.load_rubric(args.rubric) if args.rubric else None
+        if args.command == "grade":
+            grade_shard(args.zip_file, args.key, sheet, args.out, args.instructor, args.manifest, args.score_bins,
+                        rubric, args.timeout, args.max_mb, args.max_cells)
+        else:
+            run_local(args.zip_file, args.key, sheet, args.shards, args.out, args.roster, args.instructor,
+                      args.manifest, args.workers, args.score_bins, rubric, args.timeout, args.max_mb,
+                      args.max_cells)
+
+
+if __name__ == "__main__":
+    main()
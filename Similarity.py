@@ -0,0 +1,174 @@
+# --------------------------------------------------------------
+#  NEAR-DUPLICATE SUBMISSIONS
+#  Each submission is reduced to a small set of hashed shingles:
+#  every cell where it differs from the key (formula structure or
+#  value, by position and by formula alone) and its authorship
+#  metadata. Content shared with the key, and shingles most of the
+#  class has (a common mistake, the template's author), say nothing
+#  about copying and are dropped.
+#
+#  MinHash signatures are bucketed by LSH bands, so only submissions
+#  that share a band are compared and the cost grows roughly with the
+#  number of submissions, not its square. Candidate pairs are checked
+#  on their exact Jaccard similarity and joined into clusters.
+# --------------------------------------------------------------
+from collections import Counter
+from openpyxl.cell.cell import MergedCell
+from openpyxl.utils import get_column_letter
+from FormulaEngine import FormulaError, canonical, is_formula
+import hashlib
+import numpy as np
+
+NUM_PERM = 128
+BANDS = 32                # 4 rows per band: pairs above ~0.4 similarity become candidates
+THRESHOLD = 0.5           # Jaccard similarity reported as suspicious
+MIN_SHARED = 3            # shingles two submissions must share
+MAX_DOC_FREQ = 0.3        # shingles in more of the class than this are ignored
+_PRIME = 4294967291       # largest prime below 2**32; products stay within uint64
+
+
+# ----------------------------------------------------------------------
+# FINGERPRINTS
+# ----------------------------------------------------------------------
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def _content(value, sheet):
+    """Comparable form of a cell's content: canonical formula, or a rounded number, or text."""
+    if is_formula(value):
+        try:
+            return "=" + repr(canonical(value, sheet))
+        except FormulaError:
+            return str(value).replace(" ", "").upper()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return format(float(value), ".6g")
+    return str(value).strip()
+
+
+def shingles(wb, key):
+    """Readable shingles for one loaded submission graded against key (from Grader.load_key)."""
+    sheet = key["sheet"]
+    key_cells = key["cells"]
+    out = set()
+    for row in wb[sheet].iter_rows():
+        for cell in row:
+            if cell.value is None or isinstance(cell, MergedCell):
+                continue
+            rc = (cell.row - 1, cell.column - 1)
+            content = _content(cell.value, sheet)
+            key_value = key_cells.get(rc)
+            if key_value is not None and _content(key_value, sheet) == content:
+                continue
+            coord = f"{get_column_letter(cell.column)}{cell.row}"
+            out.add(f"{coord}: {content}")
+            if content.startswith("="):
+                # The same unusual formula moved to another cell
+                out.add(f"formula: {content}")
+
+    props = wb.properties
+    for name in ("creator", "last_modified_by", "created"):
+        value = getattr(props, name, None)
+        if value:
+            out.add(f"{name}: {value}")
+    return out
+
+
+def fingerprint(wb, key):
+    """Hashed shingles (sorted 32-bit ints), small enough to keep for every submission."""
+    return sorted({_hash(s) for s in shingles(wb, key)})
+
+
+# ----------------------------------------------------------------------
+# MINHASH / LSH
+# ----------------------------------------------------------------------
+def _permutations(num_perm, seed=1):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash(values, a, b):
+    x = np.asarray(values, dtype=np.uint64) % np.uint64(_PRIME)
+    return ((a[:, None] * x[None, :] + b[:, None]) % np.uint64(_PRIME)).min(axis=1)
+
+
+def _clusters(pairs):
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j, *_ in pairs:
+        parent[find(i)] = find(j)
+    groups = {}
+    for x in list(parent):
+        groups.setdefault(find(x), []).append(x)
+    return [sorted(g) for g in groups.values()]
+
+
+def find_clusters(fingerprints, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS,
+                  min_shared=MIN_SHARED, max_doc_freq=MAX_DOC_FREQ):
+    """
+    fingerprints maps a submission name to its fingerprint. Returns a list
+    of clusters, most similar first, each a dict with "members" (names),
+    "pairs" [(name, name, similarity, shared count)] and "similarity" (max).
+    """
+    names = sorted(fingerprints)
+    doc_freq = Counter(h for n in names for h in set(fingerprints[n]))
+    limit = max(2, max_doc_freq * len(names))
+    sets = {n: frozenset(h for h in fingerprints[n] if doc_freq[h] <= limit) for n in names}
+    names = [n for n in names if len(sets[n]) >= min_shared]
+
+    a, b = _permutations(num_perm)
+    rows = num_perm // bands
+    buckets = {}
+    for i, n in enumerate(names):
+        sig = minhash(sorted(sets[n]), a, b)
+        for band in range(bands):
+            buckets.setdefault((band, sig[band * rows:(band + 1) * rows].tobytes()), []).append(i)
+
+    candidates = set()
+    for members in buckets.values():
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                candidates.add((members[x], members[y]))
+
+    pairs = []
+    for i, j in sorted(candidates):
+        s1, s2 = sets[names[i]], sets[names[j]]
+        shared = len(s1 & s2)
+        similarity = shared / len(s1 | s2)
+        if similarity >= threshold and shared >= min_shared:
+            pairs.append((names[i], names[j], similarity, shared))
+
+    clusters = []
+    for members in _clusters(pairs):
+        inside = [p for p in pairs if p[0] in members]
+        clusters.append({"members": members, "pairs": inside, "similarity": max(p[2] for p in inside)})
+    clusters.sort(key=lambda c: (-c["similarity"], c["members"]))
+    print(f"Similarity: {len(candidates)} candidate pairs from {len(names)} submissions, "
+          f"{len(clusters)} suspicious cluster(s)")
+    return clusters
+
+
+def add_sheet(wb, clusters, title="Similarity"):
+    """Add the suspicious clusters to a summary workbook (works in write-only mode)."""
+    ws = wb.create_sheet(title)
+    ws.column_dimensions["B"].width = 45
+    ws.column_dimensions["C"].width = 45
+    ws.append(["Cluster", "Submission", "Most similar to", "Similarity", "Shared differences"])
+    if not clusters:
+        ws.append(["No near-duplicate submissions found."])
+        return ws
+    for k, cluster in enumerate(clusters, start=1):
+        for name in cluster["members"]:
+            best = max((p for p in cluster["pairs"] if name in p[:2]), key=lambda p: p[2])
+            other = best[1] if best[0] == name else best[0]
+            ws.append([k, name, other, round(best[2], 3), best[3]])
+    return ws
@@ -0,0 +1,138 @@
+# --------------------------------------------------------------
+#  PER-STUDENT ASSIGNMENT VARIANTS
+#  Input cells in the key carry a comment such as
+#      Vary: 100, 500        (whole numbers between 100 and 500)
+#      Vary: 0.03, 0.08, 3   (3 decimal places)
+#  Each variant draws its inputs from a seeded RNG. The generator
+#  records the seed, inputs and expected graded values in
+#  variants.json, and stamps the variant id into the workbook's
+#  custom document properties so the grader can find it again.
+# --------------------------------------------------------------
+from functools import lru_cache
+from pathlib import Path
+from openpyxl.packaging.custom import StringProperty
+from openpyxl.utils import get_column_letter, coordinate_to_tuple
+from FormulaEngine import Evaluator
+import json
+import random
+
+VARIANT_PROPERTY = "AutograderVariant"
+MANIFEST_NAME = "variants.json"
+
+
+# ----------------------------------------------------------------------
+# INPUT SPECS
+# ----------------------------------------------------------------------
+def parse_vary(text):
+    """
+    Parse a 'Vary: low, high[, decimals]' comment.
+    Returns (low, high, decimals) or None if the comment is not a Vary spec.
+    """
+    if not text:
+        return None
+    text = text.strip()
+    if not text.lower().startswith("vary:"):
+        return None
+    parts = [p.strip() for p in text[5:].replace("\n", ",").split(",") if p.strip()]
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Vary comment needs 'low, high[, decimals]': {text!r}")
+    low, high = float(parts[0]), float(parts[1])
+    if len(parts) == 3:
+        decimals = int(parts[2])
+    else:
+        # Whole numbers unless the bounds themselves have decimals
+        decimals = 0 if low.is_integer() and high.is_integer() else 2
+    return min(low, high), max(low, high), decimals
+
+
+def draw_inputs(specs, seed):
+    """Draw one value per input cell. specs maps (row, col) -> (low, high, decimals)."""
+    rng = random.Random(seed)
+    inputs = {}
+    for (r, c), (low, high, decimals) in sorted(specs.items()):
+        value = round(rng.uniform(low, high), decimals)
+        inputs[(r, c)] = int(value) if decimals == 0 else value
+    return inputs
+
+
+def expected_values(cells, sheet, graded, inputs):
+    """
+    Evaluate the key's graded cells with the variant's inputs applied.
+    cells maps (sheet, row, col) -> raw key value for every sheet.
+    """
+    cells = dict(cells)
+    for (r, c), value in inputs.items():
+        cells[(sheet, r, c)] = value
+    ev = Evaluator(cells, sheet)
+    return {(r, c): ev.value(r, c) for r, c in graded}
+
+
+# ----------------------------------------------------------------------
+# WORKBOOK MARKER
+# ----------------------------------------------------------------------
+def set_marker(wb, variant_id):
+    props = wb.custom_doc_props
+    if VARIANT_PROPERTY in props.names:
+        del props[VARIANT_PROPERTY]
+    props.append(StringProperty(name=VARIANT_PROPERTY, value=str(variant_id)))
+
+
+def get_marker(wb):
+    try:
+        prop = wb.custom_doc_props[VARIANT_PROPERTY]
+    except (KeyError, AttributeError):
+        return None
+    return str(prop.value) if prop is not None else None
+
+
+# ----------------------------------------------------------------------
+# MANIFEST
+# ----------------------------------------------------------------------
+def _coord(r, c):
+    return f"{get_column_letter(c)}{r}"
+
+
+def manifest_entry(file_name, seed, inputs, expected):
+    return {
+        "file": file_name,
+        "seed": seed,
+        "inputs": {_coord(r, c): v for (r, c), v in sorted(inputs.items())},
+        "expected": {_coord(r, c): v for (r, c), v in sorted(expected.items())},
+    }
+
+
+def write_manifest(path, key_file, sheet, base_seed, variants):
+    manifest = {
+        "key_file": Path(key_file).name,
+        "sheet": sheet,
+        "base_seed": base_seed,
+        "variants": variants,
+    }
+    Path(path).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    print(f"Variant manifest saved: {path}")
+
+
+@lru_cache(maxsize=None)
+def load_manifest(path):
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+@lru_cache(maxsize=None)
+def variant_key(path, variant_id):
+    """
+    Expected values for one variant as {(row, col): value} with 0-based
+    indices, matching how the grader walks the key. Numbers are rounded
+    to 5 places like the grader's numeric comparison. Cached per variant,
+    so every submission of the same variant shares one lookup table.
+    Returns None if the variant id is not in the manifest.
+    """
+    entry = load_manifest(str(path))["variants"].get(str(variant_id))
+    if entry is None:
+        return None
+    key = {}
+    for coord, value in entry["expected"].items():
+        r, c = coordinate_to_tuple(coord)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = round(float(value), 5)
+        key[(r - 1, c - 1)] = value
+    return key
@@ -0,0 +1,297 @@
+# --------------------------------------------------------------
+#  WATCH-FOLDER GRADER
+#  Grades submissions as they land in a drop folder (in-lab exams
+#  saved to a shared drive) and keeps Scores.csv and the item
+#  analysis up to date, so results are ready as soon as the last
+#  file arrives.
+#
+#  A file is graded once it has stopped changing for --settle
+#  seconds, is a complete .xlsx (zip) and is not open in Excel
+#  (no ~$ lock file next to it). Saving it again regrades it.
+#  Files that break the size, cell or time limits (see Guards) get a
+#  score of 0 with the reason in the Flag column. Deleting a file
+#  removes it from Scores.csv. An --out folder inside the drop folder
+#  is not scanned.
+#
+#  Usage:
+#    python WatchGrader.py --key Key.xlsx --sheet Sheet1 --drop S:/Exam1
+#                          --out Exam1_Results [--roster Roster.xlsx]
+#                          [--manifest variants.json] [--rubric rubric.json]
+#                          [--timeout 120] [--max-mb 200] [--max-cells 2000000]
+#                          [--settle 3] [--once]
+# --------------------------------------------------------------
+from pathlib import Path
+from openpyxl import load_workbook
+import Grader
+import Guards
+import KeyProbe
+import argparse
+import os
+import pandas as pd
+import time
+import zipfile
+
+
+# ----------------------------------------------------------------------
+# DROP FOLDER
+# ----------------------------------------------------------------------
+def is_locked(path):
+    """Excel keeps '~$<name>' next to an open workbook (first two chars dropped for long names)."""
+    return any((path.parent / f"~${n}").exists() for n in (path.name, path.name[2:]))
+
+
+class DropFolder:
+    """Polls a folder and reports .xlsx files that have finished arriving."""
+
+    def __init__(self, folder, settle=3.0, exclude=None):
+        self.folder = Path(folder)
+        self.settle = settle
+        self.exclude = Path(exclude).resolve() if exclude else None  # e.g. our own Results folder
+        self.pending = {}  # path -> (size, mtime) signature and when it was first seen
+        self.done = {}     # path -> signature that was last graded (or rejected)
+
+    def ready(self):
+        now = time.monotonic()
+        ready = []
+        for path in sorted(self.folder.rglob("*.xlsx")):
+            if path.name.startswith("~$"):
+                continue
+            if self.exclude is not None and self.exclude in path.resolve().parents:
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue  # removed or renamed while scanning
+            sig = (st.st_size, st.st_mtime_ns)
+            if self.done.get(path) == sig:
+                continue
+
+            seen = self.pending.get(path)
+            if seen is None or seen[0] != sig:
+                # New or still growing: wait until it stops changing
+                seen = self.pending[path] = (sig, now)
+            if now - seen[1] < self.settle or is_locked(path):
+                continue
+            if not zipfile.is_zipfile(path):
+                print(f"Not a complete workbook, skipping until it changes: {path.name}")
+                self.mark_done(path, sig)
+                continue
+            ready.append((path, sig))
+        return ready
+
+    def mark_done(self, path, sig):
+        self.done[path] = sig
+        self.pending.pop(path, None)
+
+    def retry(self, path):
+        """Forget a file so it is picked up again after it settles."""
+        self.pending.pop(path, None)
+
+    def forget(self, path):
+        """Drop a deleted file, so it is graded again if it comes back unchanged."""
+        self.pending.pop(path, None)
+        self.done.pop(path, None)
+
+    def reset(self):
+        self.done.clear()
+
+
+# ----------------------------------------------------------------------
+# RESULTS
+# ----------------------------------------------------------------------
+def replace_atomic(write, path):
+    """Write to a temp file and swap it in, so readers never see half a file."""
+    tmp = path.with_name(f".{path.stem}.tmp{path.suffix}")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+class Gradebook:
+    """Latest result per submission, and the Scores.csv / summary built from them."""
+
+    def __init__(self, out_dir, graded, roster=None):
+        self.out_dir = Path(out_dir)
+        self.graded = graded
+        self.df_roster = Grader.read_roster(roster) if roster else None
+        self.records = {}
+        self.dirty = False
+
+    def add(self, rel, result=None, flag=""):
+        """Record a graded result, or with flag a file that could not be graded (score 0)."""
+        # Names come from the LMS folder, or the file name for a flat drop folder
+        first, last = Grader.student_name(rel.parent.name or rel.stem)
+        self.records[rel] = {
+            "First Name": first,
+            "Last Name": last,
+            "Folder": rel.parent.name or rel.stem,
+            "File": rel.name,
+            "Score": result["score"] if result else 0,
+            "Flag": flag,
+            "wrong": result["wrong"] if result else [],
+        }
+        self.dirty = True
+
+    def remove(self, rel):
+        if self.records.pop(rel, None) is not None:
+            self.dirty = True
+
+    def write(self):
+        if not self.dirty:
+            return
+        rows = [{k: v for k, v in rec.items() if k != "wrong"} for _, rec in sorted(self.records.items())]
+        df_scores = pd.DataFrame(rows, columns=["First Name", "Last Name", "Folder", "File", "Score", "Flag"])
+        if self.df_roster is not None:
+            df_scores = pd.merge(df_scores, self.df_roster[["First Name", "Last Name", "Email", "Student ID"]],
+                                 on=["First Name", "Last Name"], how="left")
+
+        cell_wrong_count = {c: 0 for c in self.graded}
+        for rec in self.records.values():
+            for cell in rec["wrong"]:
+                cell_wrong_count[cell] = cell_wrong_count.get(cell, 0) + 1
+
+        try:
+            replace_atomic(lambda p: df_scores.to_csv(p, index=False), self.out_dir / "Scores.csv")
+            replace_atomic(lambda p: Grader.write_summary(cell_wrong_count, df_scores["Score"], p),
+                           self.out_dir / "results_summary.xlsx")
+        except PermissionError as e:
+            # Usually Scores.csv open in Excel on Windows; try again after the next file
+            print(f"Could not update results ({e}). Will retry.")
+            return
+        self.dirty = False
+        print(f"Updated Scores.csv and results_summary.xlsx ({len(self.records)} graded)")
+
+
+# ----------------------------------------------------------------------
+# WATCH LOOP
+# ----------------------------------------------------------------------
+def grade_file(path, rel, key, out_dir, instructor, manifest_file=None):
+    wb = load_workbook(path)
+    try:
+        if key["sheet"] not in wb.sheetnames:
+            raise Guards.Rejected(f"has no '{key['sheet']}' sheet")
+        variant_num = Grader.variant_values(wb, manifest_file, path.name)
+        result = Grader.grade_workbook(wb, path, key, variant_num)
+        res_path = Path(out_dir) / "Results" / rel
+        res_path.parent.mkdir(parents=True, exist_ok=True)
+        Grader.write_feedback(wb, result, key, instructor, res_path)
+    finally:
+        wb.close()
+    return result
+
+
+# Under a time limit each file is graded in a worker process (Guards.TimeLimited)
+# that loads the key itself, as in Grader.process_submissions
+_WORKER_KEY = None
+
+
+def _init_worker(key_file, sheet_name, rubric=None):
+    global _WORKER_KEY
+    _WORKER_KEY = Grader.load_key(key_file, sheet_name, rubric=rubric)
+
+
+def _grade_file_in_worker(path, rel, out_dir, instructor, manifest_file):
+    return grade_file(path, rel, _WORKER_KEY, out_dir, instructor, manifest_file)
+
+
+def watch(key_file, sheet_name, drop_dir, out_dir, roster=None, manifest_file=None,
+          instructor="Instructor", settle=3.0, interval=1.0, once=False, rubric=None,
+          timeout=Guards.TIMEOUT, max_mb=Guards.MAX_UNCOMPRESSED_MB, max_cells=Guards.MAX_CELLS):
+    key_file, drop_dir, out_dir = Path(key_file), Path(drop_dir), Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    key = Grader.load_key(key_file, sheet_name, rubric=rubric)
+    key_mtime = KeyProbe.key_mtime(key_file)
+    print(f"Key loaded: {key_file.name} ({len(key['graded'])} graded cells)")
+    folder = DropFolder(drop_dir, 0 if once else settle, exclude=out_dir)
+    book = Gradebook(out_dir, key["graded"], roster)
+    runner = Guards.TimeLimited(timeout, _init_worker, (key_file, sheet_name, rubric)) if timeout else None
+    print(f"Watching {drop_dir} (Ctrl+C to stop)" if not once else f"Grading {drop_dir}")
+
+    try:
+        while True:
+            # A corrected key regrades everything already seen
+            if KeyProbe.key_mtime(key_file) != key_mtime:
+                key = Grader.load_key(key_file, sheet_name, rubric=rubric)
+                key_mtime = KeyProbe.key_mtime(key_file)
+                book.graded = key["graded"]
+                if runner:
+                    runner.close()  # the next file starts a worker with the new key
+                folder.reset()
+                print("Key changed, regrading all submissions")
+
+            # Deleted submissions leave Scores.csv along with their feedback file
+            for rel in [r for r in book.records if not (drop_dir / r).exists()]:
+                book.remove(rel)
+                folder.forget(drop_dir / rel)
+                (out_dir / "Results" / rel).unlink(missing_ok=True)
+                print(f"Removed {rel}")
+
+            for path, sig in folder.ready():
+                rel = path.relative_to(drop_dir)
+                start = time.perf_counter()
+                try:
+                    Guards.screen(path, key["sheet"], max_mb, max_cells)
+                    if runner:
+                        result = runner.run(_grade_file_in_worker, path, rel, out_dir, instructor, manifest_file)
+                    else:
+                        result = grade_file(path, rel, key, out_dir, instructor, manifest_file)
+                except (OSError, zipfile.BadZipFile) as e:
+                    # Changed again while we were reading it
+                    print(f"Could not read {rel} yet ({e}). Will retry.")
+                    folder.retry(path)
+                    continue
+                except Exception as e:
+                    # Flagged until the file is saved again
+                    flag = str(e) if isinstance(e, Guards.Rejected) else f"grading failed: {e}"
+                    print(f"Flagged: {rel}: {flag}")
+                    folder.mark_done(path, sig)
+                    book.add(rel, flag=flag)
+                    continue
+                folder.mark_done(path, sig)
+                book.add(rel, result)
+                wrong = Grader.cell_list(result["wrong"])
+                print(f"Graded {rel} → {result['score']}% "
+                      f"({time.perf_counter() - start:.2f}s){' wrong: ' + wrong if wrong else ''}")
+            book.write()
+
+            if once:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\nStopping.")
+    finally:
+        if runner:
+            runner.close()
+    book.write()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade submissions as they arrive in a folder.")
+    parser.add_argument("--key", type=Path, required=True)
+    parser.add_argument("--sheet", default=None, help="graded sheet (default: first sheet)")
+    parser.add_argument("--drop", type=Path, required=True, help="folder submissions are saved to")
+    parser.add_argument("--out", type=Path, required=True, help="folder for Results/, Scores.csv and summary")
+    parser.add_argument("--roster", type=Path, default=None)
+    parser.add_argument("--manifest", type=Path, default=None, help="variants.json for variant assignments")
+    parser.add_argument("--instructor", default="Instructor")
+    parser.add_argument("--rubric", type=Path, default=None, metavar="rubric.json",
+                        help="cell points and partial credit (see RUBRIC in Grader.py)")
+    parser.add_argument("--timeout", type=float, default=Guards.TIMEOUT,
+                        help="seconds allowed to grade one submission; 0 grades in this process with no limit")
+    parser.add_argument("--max-mb", type=float, default=Guards.MAX_UNCOMPRESSED_MB,
+                        help="largest uncompressed submission in MB")
+    parser.add_argument("--max-cells", type=int, default=Guards.MAX_CELLS,
+                        help="most rows and cells allowed on the graded sheet")
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds a file must stay unchanged")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between folder scans")
+    parser.add_argument("--once", action="store_true", help="grade what is there now and exit")
+    args = parser.parse_args()
+
+    sheet = args.sheet or KeyProbe.sheet_names(args.key)[0]
+    watch(args.key, sheet, args.drop, args.out, args.roster, args.manifest, args.instructor,
+          args.settle, args.interval, args.once,
+          Grader.load_rubric(args.rubric) if args.rubric else None, args.timeout, args.max_mb, args.max_cells)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# --------------------------------------------------------------
+#  GENERATOR BENCHMARK
+#  Measures assignment copies/sec for a given key file.
+#
+#  Usage:
+#    python bench_generator.py KEY.xlsx [--sheet NAME] [--copies N]
+# --------------------------------------------------------------
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from Generator import build_assignment, write_copies
+
+
+def bench_per_copy(key_file, sheet, num_copies, out_dir):
+    """Old behaviour: re-parse and rebuild the key for every copy."""
+    start = time.perf_counter()
+    for i in range(1, num_copies + 1):
+        data = build_assignment(key_file, sheet)
+        (out_dir / f"Assignment_{i:02d}.xlsx").write_bytes(data)
+    return time.perf_counter() - start
+
+
+def bench_build_once(key_file, sheet, num_copies, out_dir):
+    """Build the assignment once, then write the bytes N times."""
+    start = time.perf_counter()
+    data = build_assignment(key_file, sheet)
+    write_copies(data, out_dir, num_copies)
+    return time.perf_counter() - start
+
+
+def report_rules(key_file, sheet):
+    """Compare per-cell conditional formatting rules against coalesced range rules."""
+    per_cell, coalesced = {}, {}
+    build_assignment(key_file, sheet, coalesce_rules=False, stats=per_cell)
+    build_assignment(key_file, sheet, coalesce_rules=True, stats=coalesced)
+
+    saved = per_cell["bytes"] - coalesced["bytes"]
+    print(f"Graded cells: {coalesced['graded_cells']}")
+    print(f"Rules:     {per_cell['rules']:>8} per-cell   {coalesced['rules']:>8} coalesced")
+    print(f"File size: {per_cell['bytes']:>8} bytes      {coalesced['bytes']:>8} bytes"
+          f"   ({saved / per_cell['bytes'] * 100:.1f}% smaller)")
+
+
+def report_compact_key(key_file, sheet):
+    """Compare a full KeyData copy against graded-cells-only KeyData."""
+    full, compact = {}, {}
+    build_assignment(key_file, sheet, stats=full)
+    try:
+        build_assignment(key_file, sheet, compact_key=True, stats=compact)
+    except ValueError as e:
+        print(f"Compact KeyData skipped: {e}")
+        return
+    print(f"KeyData:   {full['bytes']:>8} bytes full {compact['bytes']:>8} bytes compact"
+          f"   ({full['key_cells']} -> {compact['key_cells']} cells)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark assignment generation (copies/sec).")
+    parser.add_argument("key_file", type=Path)
+    parser.add_argument("--sheet", default=None)
+    parser.add_argument("--copies", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"Key: {args.key_file}  copies: {args.copies}")
+    report_rules(args.key_file, args.sheet)
+    report_compact_key(args.key_file, args.sheet)
+    for label, fn in [("per-copy rebuild", bench_per_copy), ("build once", bench_build_once)]:
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed = fn(args.key_file, args.sheet, args.copies, Path(tmp))
+        print(f"{label:<18} {elapsed:8.3f} s   {args.copies / elapsed:10.1f} copies/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import zipfile
+from openpyxl import Workbook
+from openpyxl.styles import PatternFill
+import Grader
+import Recalc
+
+FILL = PatternFill("solid", fgColor=Grader.TARGET)
+
+
+def save(path, formula, saved=None):
+    """Workbook with inputs in A1:A2 and formula in graded B1; saved is the result Excel would store."""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "S"
+    ws["A1"], ws["A2"] = 1, 2
+    ws["B1"] = formula
+    ws["B1"].fill = FILL
+    wb.save(path)
+    if saved is not None:
+        # openpyxl writes no saved results; add one as Excel would
+        with zipfile.ZipFile(path) as z:
+            parts = {i: z.read(i) for i in z.infolist()}
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            for info, data in parts.items():
+                if info.filename == "xl/worksheets/sheet1.xml":
+                    data = data.replace(b"<v />", f"<v>{saved}</v>".encode(), 1)
+                z.writestr(info, data)
+    return path
+
+
+def grade(tmp_path, formula, saved=None):
+    key = Grader.load_key(save(tmp_path / "key.xlsx", "=A1+A2", 3), "S")
+    sub = save(tmp_path / "sub.xlsx", formula, saved)
+    return Grader.grade_submission(sub, key)[0]
+
+
+def test_wrong_formula_without_saved_value_is_wrong(tmp_path):
+    result = grade(tmp_path, "=A1*A2")
+    assert result["wrong"] == [(0, 1)]
+    assert result["score"] == 0
+
+
+def test_key_formula_without_saved_value_is_right(tmp_path):
+    assert grade(tmp_path, "=A2+A1")["score"] == 100
+
+
+def test_alternate_formula_with_matching_saved_value_is_right(tmp_path):
+    assert grade(tmp_path, "=SUM(A1:A2)", 3)["score"] == 100
+
+
+KEY_CELLS = {("S", 1, 1): 2, ("S", 2, 1): 3, ("S", 1, 2): "=A1+A2"}
+
+
+def verdict(formula):
+    return Recalc.verify(KEY_CELLS, [{**KEY_CELLS, ("S", 1, 2): formula}], "S", [(1, 2)], 2)[0][(1, 2)]
+
+
+def test_recalc_gives_no_verdict_for_unsupported_function():
+    assert verdict("=SUMPRODUCT(A1:A2,1)") is None
+
+
+def test_recalc_counts_and_bounds_ranges():
+    assert verdict("=SUM(A1:A1048576)") is True
+    assert verdict("=A1*A2") is False
+    assert verdict("=A1+A2*COUNT(A1:A9)/COUNTA(A1:A5)") is True